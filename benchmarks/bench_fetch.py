@@ -0,0 +1,282 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+from benchmarks.fake_imap_server import MailStore, FakeIMAPServer
+from libraries.emailer import EmailDataProcessor
+
+from typing import Tuple, Union, Optional, Dict, List, Any
+
+# Сквозной бенчмарк выгрузки: EmailDataProcessor.run() против локального IMAP-сервера (benchmarks/fake_imap_server.py)
+# с синтетическими ящиками. Каждый запуск - отдельный процесс, чтобы пиковая память не копилась между запусками.
+# Сервер работает в потоке того же процесса, что и родитель выгрузки (делит с ним GIL) - сравнивать результаты
+# имеет смысл между версиями программы на одной машине, а не с реальным сервером.
+#
+# python benchmarks/bench_fetch.py --folders 3 --messages 2000 --engine process async pipeline --json results.json
+# python benchmarks/bench_fetch.py --compare old.json new.json
+
+
+class TimedEmailDataProcessor(EmailDataProcessor):
+    #MARK: TimedEmailDataProcessor
+    # Время сборки выходного файла замеряется отдельно от выгрузки (класс на уровне модуля - объект передается воркерам)
+    excel_seconds = 0.0
+
+    def write_output(self, *args, **kwargs):
+        time_begin = time.perf_counter()
+        try:
+            return super().write_output(*args, **kwargs)
+        finally:
+            self.excel_seconds += time.perf_counter() - time_begin
+
+
+def raw_data_digest(processor:EmailDataProcessor) -> Tuple[int, str]:
+    #MARK: raw_data_digest
+    """
+    Количество строк Raw Data выходного файла и отпечаток их содержимого (SHA-256 отсортированных строк).
+    Порядок строк зависит от движка и папок, содержимое - нет: у metadata и full оно должно совпадать.
+    write_only не записывает размеры листа, поэтому строки считаются проходом.
+    """
+    records = sorted(json.dumps(list(record), ensure_ascii=False, default=str)
+                     for record in processor.output.iter_records())
+    digest = hashlib.sha256()
+    for record in records:
+        digest.update(record.encode("utf-8") + b"\n")
+    return len(records), digest.hexdigest()
+
+
+def peak_rss_mb() -> Tuple[Optional[float], Optional[float]]:
+    #MARK: peak_rss_mb
+    # Пиковая память (МБ): текущий процесс и самый большой из завершенных дочерних (воркеры выгрузки)
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # Linux отдает килобайты, macOS - байты
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1))
+
+
+def git_commit() -> Optional[str]:
+    #MARK: git_commit
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).resolve().parent,
+                              capture_output=True, text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once(params:Dict[str, Any]) -> Dict[str, Any]:
+    #MARK: run_once
+    """
+    Один запуск: заполнить ящик, поднять сервер, выполнить run() и собрать метрики.
+    Заполнение ящика в замер не входит.
+    """
+    store = MailStore()
+    store.seed(folders=params["folders"], messages=params["messages"], attachments=params["attachments"],
+               attachment_size=params["attachment_size"], non_ascii_ratio=params["non_ascii_ratio"],
+               senders=params["senders"], domains=params["domains"],
+               duplicate_ratio=params.get("duplicate_ratio", 0.0))
+    with tempfile.TemporaryDirectory() as temp_dir, FakeIMAPServer(store) as server:
+        processor = TimedEmailDataProcessor(
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            email_user="bench",
+            email_password="bench",
+            output_excel_file=str(Path(temp_dir) / "bench.xlsx"),
+            output_format=params.get("output_format", "excel"),
+            fetch_mode=params["fetch_mode"],
+            fetch_batch_size=params["fetch_batch_size"],
+            state_db=str(Path(temp_dir) / "state.sqlite") if params["state_db"] else "",
+            max_connections=params["max_connections"],
+            engine=params["engine"],
+            parse_workers=params["parse_workers"],
+            progress_interval=3600,
+            # Ошибка выгрузки должна быть видна сразу, а не прятаться за повторами
+            folder_retries=0,
+        )
+        store.reset_counters()
+        log = io.StringIO()
+        time_begin = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr if params["verbose"] else log):
+            processor.run()
+        seconds = time.perf_counter() - time_begin
+        excel_size = processor.output.size()
+        messages, digest = raw_data_digest(processor)
+    if messages != store.total_messages():
+        raise Exception(f"Выгружено {messages} писем из {store.total_messages()}:\n{log.getvalue()}")
+    excel = processor.excel_seconds
+    fetch = max(seconds - excel, 1e-9)
+    rss, rss_children = peak_rss_mb()
+    return {
+        "engine": params["engine"],
+        "fetch_mode": params["fetch_mode"],
+        "output_format": processor.output.format,
+        "messages": messages,
+        "raw_data_sha256": digest,
+        "mailbox_bytes": store.total_bytes(),
+        "seconds": round(seconds, 4),
+        "fetch_seconds": round(fetch, 4),
+        "excel_seconds": round(excel, 4),
+        "messages_per_sec": round(messages / fetch, 1),
+        "bytes_sent": store.bytes_sent,
+        "bytes_received": store.bytes_received,
+        "imap_commands": store.commands,
+        "excel_bytes": excel_size,
+        "peak_rss_mb": rss,
+        "peak_rss_children_mb": rss_children,
+    }
+
+
+def run_isolated(params:Dict[str, Any]) -> Dict[str, Any]:
+    #MARK: run_isolated
+    # Запуск в отдельном процессе: результат - последняя строка stdout (JSON)
+    completed = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--run-one", json.dumps(params)],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise Exception(f"Запуск бенчмарка завершился с ошибкой:\n{completed.stderr}")
+    if params["verbose"]:
+        print(completed.stderr, file=sys.stderr)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def check_raw_data(runs:List[Dict[str, Any]]) -> bool:
+    #MARK: check_raw_data
+    # Все запуски выгружали один и тот же ящик: Raw Data (отправители, темы, размеры, имена вложений)
+    # должна совпадать между движками и режимами metadata / full
+    digests = {}
+    for run in runs:
+        digests.setdefault(run["raw_data_sha256"], []).append(f"{run['engine']}/{run['fetch_mode']}")
+    if len(digests) <= 1:
+        return True
+    print("ОШИБКА: содержимое Raw Data различается между запусками:")
+    for digest, names in digests.items():
+        print(f"    {digest[:12]}: {', '.join(names)}")
+    return False
+
+
+def print_runs(runs:List[Dict[str, Any]]):
+    #MARK: print_runs
+    print(f"{'engine':<8} {'mode':<9} {'писем':>7} {'писем/сек':>10} {'выгрузка, с':>12} {'Excel, с':>9} "
+          f"{'отправлено, МБ':>15} {'RSS, МБ':>8} {'RSS детей, МБ':>14}")
+    for run in runs:
+        print(f"{run['engine']:<8} {run['fetch_mode']:<9} {run['messages']:>7} {run['messages_per_sec']:>10} "
+              f"{run['fetch_seconds']:>12} {run['excel_seconds']:>9} {round(run['bytes_sent'] / 2 ** 20, 2):>15} "
+              f"{run['peak_rss_mb']!s:>8} {run['peak_rss_children_mb']!s:>14}")
+
+
+def compare(old_path:str,
+            new_path:str):
+    #MARK: compare
+    # Сравнение двух файлов результатов по одинаковым (engine, fetch_mode): лучший из повторов
+    reports = {}
+
+    def best(path:str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        with open(path, encoding="utf-8") as file:
+            report = reports[path] = json.load(file)
+        result = {}
+        for run in report["runs"]:
+            key = (run["engine"], run["fetch_mode"])
+            if key not in result or run["messages_per_sec"] > result[key]["messages_per_sec"]:
+                result[key] = run
+        return result
+
+    old, new = best(old_path), best(new_path)
+    if reports[old_path]["params"] != reports[new_path]["params"]:
+        print("Внимание: параметры запусков различаются, сравнение может быть некорректным")
+    print(f"{reports[old_path].get('git_commit')} -> {reports[new_path].get('git_commit')}")
+    for key in sorted(set(old) & set(new)):
+        for metric in ("messages_per_sec", "excel_seconds", "bytes_sent", "peak_rss_mb", "peak_rss_children_mb"):
+            before, after = old[key][metric], new[key][metric]
+            if before is None or after is None:
+                continue
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "-"
+            print(f"{key[0]:<8} {key[1]:<9} {metric:<22} {before:>12} -> {after:<12} {change}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк выгрузки писем с локальным IMAP-сервером")
+    parser.add_argument("--folders", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=1000, help="Писем в каждой папке")
+    parser.add_argument("--attachments", type=int, default=2, help="Максимум вложений в письме (от 0 до n)")
+    parser.add_argument("--attachment-size", type=int, default=20000, help="Размер вложения, байт")
+    parser.add_argument("--non-ascii-ratio", type=float, default=0.5, help="Доля писем с кириллицей в заголовках")
+    parser.add_argument("--senders", type=int, default=200)
+    parser.add_argument("--domains", type=int, default=20)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0,
+                        help="Доля писем-копий из предыдущих папок (начиная со второй папки)")
+    parser.add_argument("--engine", nargs="+", default=["process", "async"], choices=["process", "async", "pipeline"])
+    parser.add_argument("--fetch-mode", nargs="+", default=["metadata"], choices=["metadata", "full"])
+    parser.add_argument("--output-format", default="excel", choices=["excel", "parquet", "sqlite"])
+    parser.add_argument("--fetch-batch-size", type=int, default=500)
+    parser.add_argument("--max-connections", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=2)
+    parser.add_argument("--state-db", action="store_true", help="Выгрузка с локальной базой состояния")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", default="", help="Файл результатов (- для stdout)")
+    parser.add_argument("--verbose", action="store_true", help="Показывать вывод выгрузки (stderr)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Сравнить два файла результатов")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_once(json.loads(args.run_one))))
+        sys.exit(0)
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    params = {
+        "folders": args.folders,
+        "messages": args.messages,
+        "attachments": args.attachments,
+        "attachment_size": args.attachment_size,
+        "non_ascii_ratio": args.non_ascii_ratio,
+        "senders": args.senders,
+        "domains": args.domains,
+        "duplicate_ratio": args.duplicate_ratio,
+        "output_format": args.output_format,
+        "fetch_batch_size": args.fetch_batch_size,
+        "max_connections": args.max_connections,
+        "parse_workers": args.parse_workers,
+        "state_db": args.state_db,
+        "verbose": args.verbose,
+    }
+    runs = []
+    for fetch_mode in args.fetch_mode:
+        for engine in args.engine:
+            for _ in range(args.repeat):
+                runs.append(run_isolated(dict(params, engine=engine, fetch_mode=fetch_mode)))
+    report = {
+        "benchmark": "fetch",
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {name: value for name, value in params.items() if name != "verbose"},
+        "runs": runs,
+    }
+    if args.json == "-":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_runs(runs)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            print(f"Результаты: {args.json}")
+    if not check_raw_data(runs):
+        sys.exit(1)
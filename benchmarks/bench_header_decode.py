@@ -0,0 +1,85 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import random
+import time
+from email.header import Header, decode_header
+from email.utils import parseaddr, formataddr
+
+from libraries.header_decode import decode_header_value, parse_address, clear_header_caches
+
+from typing import Tuple, List, Callable
+
+# Микробенчмарк разбора заголовков From / Subject: прежняя реализация (decode_header на каждое письмо)
+# против header_decode (быстрый путь для ASCII + LRU-кеш).
+#
+# python benchmarks/bench_header_decode.py --messages 200000 --senders 2000
+
+
+def old_parse_email_address(raw_from) -> Tuple[str, str]:
+    name, addr = parseaddr(raw_from)
+    decoded_name = decode_header(name)
+    name = ''.join(
+        part.decode(charset or 'utf-8') if isinstance(part, bytes) else part
+        for part, charset in decoded_name
+    )
+    return (name, addr)
+
+
+def old_decode_subject(subject) -> str:
+    decoded_parts = decode_header(subject or "")
+    return ''.join(
+        part.decode(charset or 'utf-8', errors='replace') if isinstance(part, bytes) else part
+        for part, charset in decoded_parts
+    )
+
+
+def make_headers(messages:int,
+                 senders:int,
+                 non_ascii_share:float,
+                 seed:int=1) -> List[Tuple[str, str]]:
+    #MARK: make_headers
+    # Набор (From, Subject), где отправители и темы рассылок повторяются, как в реальном ящике
+    rng = random.Random(seed)
+    pool = []
+    for i in range(senders):
+        if rng.random() < non_ascii_share:
+            name = Header(f"Рассылка {i}", "utf-8").encode()
+            subject = Header(f"Новости недели №{i}", "utf-8").encode()
+        else:
+            name, subject = f"Sender {i}", f"Weekly digest #{i}"
+        pool.append((formataddr((name, f"sender{i}@example{i % 50}.com")), subject))
+    return [pool[int(rng.paretovariate(1.2)) % senders] for _ in range(messages)]
+
+
+def measure(parse_from:Callable, parse_subject:Callable, headers:List[Tuple[str, str]]) -> float:
+    #MARK: measure
+    time_begin = time.perf_counter()
+    for raw_from, subject in headers:
+        parse_from(raw_from)
+        parse_subject(subject)
+    return time.perf_counter() - time_begin
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Микробенчмарк разбора заголовков")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--senders", type=int, default=2000)
+    parser.add_argument("--non-ascii-share", type=float, default=0.5)
+    args = parser.parse_args()
+
+    headers = make_headers(args.messages, args.senders, args.non_ascii_share)
+    # Результаты должны совпадать с прежней реализацией
+    for raw_from, subject in headers[:1000]:
+        assert parse_address(raw_from) == old_parse_email_address(raw_from)
+        assert decode_header_value(subject) == old_decode_subject(subject)
+    clear_header_caches()
+
+    old = measure(old_parse_email_address, old_decode_subject, headers)
+    new = measure(parse_address, decode_header_value, headers)
+    print(f"Писем: {args.messages}, уникальных отправителей: {args.senders}, доля non-ASCII: {args.non_ascii_share}")
+    print(f"decode_header на каждое письмо: {old / args.messages * 1e6:.2f} мкс/письмо")
+    print(f"header_decode (ASCII + LRU):    {new / args.messages * 1e6:.2f} мкс/письмо")
+    print(f"Ускорение: {old / max(new, 1e-9):.1f}x")
@@ -0,0 +1,99 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import json
+import subprocess
+
+from typing import Tuple, Dict, List
+
+# Проверка времени импорта по python -X importtime: main.py при старте и каждый воркер ProcessPoolExecutor,
+# запущенный через spawn/forkserver, импортируют libraries.emailer. Тяжелые зависимости (openpyxl, pyarrow,
+# requests...) должны загружаться только там, где они нужны, а не при импорте модуля.
+#
+# python benchmarks/check_importtime.py --budget-ms 150
+# Код возврата 1 - бюджет превышен или загружен запрещенный модуль.
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_MODULES = ["libraries.emailer", "main"]
+# Пакеты, которые не должны загружаться при импорте модулей выгрузки
+DEFAULT_FORBIDDEN = ["requests", "urllib3", "openpyxl", "pandas", "numpy", "pyarrow", "aiohttp", "asyncio"]
+
+# Импорт в чистом интерпретаторе: в stdout - модули, которые он загрузил (без загруженных при старте Python)
+_PROBE = ("import sys, json; before = set(sys.modules); import {module}; "
+          "print(json.dumps(sorted(set(sys.modules) - before)))")
+
+
+def parse_importtime(text:str) -> Dict[str, Tuple[int, int]]:
+    #MARK: parse_importtime
+    # Строки "import time: self [us] | cumulative | imported package" -> {модуль: (self, cumulative)} в мкс
+    result = {}
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            own, cumulative = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue # Строка заголовка
+        result.setdefault(parts[2].strip(), (own, cumulative))
+    return result
+
+
+def measure(module:str) -> Tuple[float, Dict[str, Tuple[int, int]], List[str]]:
+    #MARK: measure
+    # (мс на импорт module, времена модулей, загруженные модули)
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+                               cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise Exception(f"Не удалось импортировать {module}:\n{completed.stderr[-2000:]}")
+    times = parse_importtime(completed.stderr)
+    if module not in times:
+        raise Exception(f"В выводе -X importtime нет модуля {module}")
+    return times[module][1] / 1000.0, times, json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def check_module(module:str,
+                 runs:int,
+                 forbidden:List[str],
+                 top:int) -> Tuple[float, List[str]]:
+    #MARK: check_module
+    # Лучший из runs замеров (первый запуск еще и компилирует .pyc) и запрещенные модули
+    best = None
+    for _ in range(max(runs, 1)):
+        total, times, loaded = measure(module)
+        if best is None or total < best[0]:
+            best = (total, times, loaded)
+    total, times, loaded = best
+    found = sorted({name.split(".")[0] for name in loaded} & set(forbidden))
+    print(f"{module}: {total:.1f} мс, модулей загружено {len(loaded)}")
+    heaviest = sorted(((own, name) for name, (own, _) in times.items() if name in loaded), reverse=True)[:top]
+    for own, name in heaviest:
+        print(f"    {own / 1000.0:8.1f} мс  {name}")
+    return total, found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Проверка времени импорта модулей выгрузки (-X importtime)")
+    parser.add_argument("--module", nargs="+", default=DEFAULT_MODULES, help="Проверяемые модули")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="Допустимое время импорта модуля, мс")
+    parser.add_argument("--runs", type=int, default=3, help="Замеров на модуль (берется лучший)")
+    parser.add_argument("--forbidden", nargs="*", default=DEFAULT_FORBIDDEN,
+                        help="Пакеты, которые не должны загружаться при импорте")
+    parser.add_argument("--top", type=int, default=10, help="Сколько самых долгих модулей показать")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module:
+        total, found = check_module(module, args.runs, args.forbidden, args.top)
+        if found:
+            print(f"ОШИБКА: {module} загружает {', '.join(found)}")
+            failed = True
+        if total > args.budget_ms:
+            print(f"ОШИБКА: {module} импортируется {total:.1f} мс, бюджет {args.budget_ms:.0f} мс")
+            failed = True
+    sys.exit(1 if failed else 0)
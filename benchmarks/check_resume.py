@@ -0,0 +1,106 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import contextlib
+import io
+import sqlite3
+import tempfile
+
+from benchmarks.fake_imap_server import MailStore, FakeIMAPServer
+from libraries.emailer import EmailDataProcessor
+
+from typing import Tuple, Dict, List
+
+# Проверка продолжения выгрузки (--resume) против локального IMAP-сервера: первый запуск обрывается на одной
+# из команд FETCH, затем у папок меняется UIDVALIDITY, и run(resume=True) должен выгрузить каждое письмо ровно
+# один раз - строки папки со старым UIDVALIDITY из промежуточного файла в выходной не попадают.
+#
+# python benchmarks/check_resume.py --engine process pipeline async
+# Код возврата 1 - количество строк Raw Data, итогов или вложений не совпало с ящиком.
+
+
+def expected_counts(store:MailStore) -> Dict[str, int]:
+    #MARK: expected_counts
+    messages = [message for mailbox in store.folders.values() for message in mailbox.messages]
+    return {
+        "raw_data": len(messages),
+        "by_email": len(messages),
+        "by_domain": len(messages),
+        "attachments": sum(1 for message in messages for part in message.msg.walk()
+                           if part.get_content_disposition() == "attachment"),
+    }
+
+
+def output_counts(path_to_output:Path) -> Dict[str, int]:
+    #MARK: output_counts
+    connection = sqlite3.connect(path_to_output)
+    try:
+        return {
+            "raw_data": connection.execute("SELECT COUNT(*) FROM raw_data").fetchone()[0],
+            "by_email": connection.execute("SELECT COALESCE(SUM(count), 0) FROM by_email").fetchone()[0],
+            "by_domain": connection.execute("SELECT COALESCE(SUM(count), 0) FROM by_domain").fetchone()[0],
+            "attachments": connection.execute("SELECT COUNT(*) FROM attachments").fetchone()[0],
+        }
+    finally:
+        connection.close()
+
+
+def check_engine(engine:str,
+                 folders:int,
+                 messages:int,
+                 drop_on_fetch:int,
+                 state_db:bool) -> Tuple[Dict[str, int], Dict[str, int]]:
+    #MARK: check_engine
+    # (ожидаемые количества, количества в выходном файле после продолжения с новым UIDVALIDITY)
+    store = MailStore()
+    store.seed(folders=folders, messages=messages, attachments=2, attachment_size=500)
+    with tempfile.TemporaryDirectory() as temp_dir, FakeIMAPServer(store) as server:
+        path_to_output = Path(temp_dir) / "resume.sqlite"
+        processor = EmailDataProcessor(
+            imap_server=server.host,
+            imap_port=server.port,
+            imap_ssl=False,
+            email_user="check",
+            email_password="check",
+            output_excel_file=str(path_to_output),
+            fetch_batch_size=50,
+            state_db=str(Path(temp_dir) / "state.sqlite") if state_db else "",
+            max_connections=2,
+            engine=engine,
+            parse_workers=2,
+            progress_interval=3600,
+            # Упавшая папка должна остаться недогруженной до запуска с --resume
+            folder_retries=0,
+        )
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            store.drop_on_fetch = {drop_on_fetch}
+            processor.run()
+            if not processor.checkpoint_db.exists():
+                raise Exception(f"Обрыв на FETCH #{drop_on_fetch} не оставил контрольных точек:\n{log.getvalue()}")
+            store.drop_on_fetch = set()
+            for mailbox in store.folders.values():
+                mailbox.uidvalidity += 1
+            processor.run(resume=True)
+        return expected_counts(store), output_counts(path_to_output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Проверка продолжения выгрузки после смены UIDVALIDITY")
+    parser.add_argument("--engine", nargs="+", default=["process", "pipeline", "async"],
+                        choices=["process", "async", "pipeline"])
+    parser.add_argument("--folders", type=int, default=2)
+    parser.add_argument("--messages", type=int, default=300, help="Писем в каждой папке")
+    parser.add_argument("--drop-on-fetch", type=int, default=4, help="Номер команды FETCH, на которой рвется связь")
+    parser.add_argument("--state-db", action="store_true", help="Выгрузка с локальной базой состояния")
+    args = parser.parse_args()
+
+    failed = False
+    for engine in args.engine:
+        expected, actual = check_engine(engine, args.folders, args.messages, args.drop_on_fetch, args.state_db)
+        wrong = [f"{name}: {actual[name]} вместо {count}" for name, count in expected.items() if actual[name] != count]
+        print(f"{engine}: " + ("; ".join(wrong) if wrong else f"ок, {actual['raw_data']} писем"))
+        failed = failed or bool(wrong)
+    sys.exit(1 if failed else 0)
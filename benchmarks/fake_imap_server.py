@@ -0,0 +1,651 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import datetime
+import email
+import email.utils
+import random
+import re
+import socketserver
+import threading
+from email import policy
+from email.message import EmailMessage
+from urllib.parse import quote as url_quote
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable, Set
+
+# Локальная замена IMAP-сервера для бенчмарков: IMAP4rev1 поверх обычного TCP (без TLS) в потоке текущего процесса.
+# Поддерживает ровно то, что использует выгрузка: LOGIN, LIST, STATUS, SELECT/EXAMINE, UID SEARCH
+# (ALL, SINCE, BEFORE, ON, LARGER, SMALLER, FROM, SUBJECT, TO, SEEN, UNSEEN, NOT, OR, UID), UID FETCH
+# (UID, FLAGS, RFC822, RFC822.SIZE, BODYSTRUCTURE, BODY.PEEK[HEADER.FIELDS (...)]), UID STORE, UID EXPUNGE, UID MOVE.
+#
+# store = MailStore()
+# store.seed(folders=3, messages=1000)
+# server = FakeIMAPServer(store).start()
+# ... imaplib.IMAP4("127.0.0.1", server.port) ...
+# server.stop()
+
+_IMAP_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+_LITERAL = re.compile(r"\{(\d+)\}$")
+_ARGUMENT = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+')
+_FETCH_ITEM = re.compile(r"[A-Za-z0-9.]+\[[^\]]*\](?:<[\d.]+>)?|[A-Za-z0-9.]+")
+# Типы вложений синтетических писем: (MIME-тип, подтип, расширение)
+_ATTACHMENT_TYPES = [("application", "pdf", "pdf"), ("image", "jpeg", "jpg"), ("application", "zip", "zip")]
+
+
+def _quote(value:Any) -> str:
+    # Строка IMAP: NIL, "строка" или литерал {n} для не-ASCII
+    if value is None:
+        return "NIL"
+    value = str(value)
+    if any(ord(char) > 127 for char in value) or "\r" in value or "\n" in value:
+        return f"{{{len(value.encode())}}}\r\n{value}"
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _params(params:List[Tuple[str, Any]]) -> str:
+    if not params:
+        return "NIL"
+    items = []
+    for name, value in params:
+        if isinstance(value, tuple):
+            # Параметры RFC 2231 (filename*=utf-8''...) отдаем в закодированном виде, как реальные серверы.
+            # get_params уже раскрыл %XX в строку latin-1: собираем текст в его кодировке и кодируем заново
+            charset = value[0] or "utf-8"
+            text = email.utils.collapse_rfc2231_value(value)
+            name, value = name + "*", f"{charset}'{value[1] or ''}'" + url_quote(text.encode(charset, "replace"))
+        items.append(f"{_quote(name)} {_quote(value)}")
+    return "(" + " ".join(items) + ")"
+
+
+def bodystructure(msg:email.message.Message) -> str:
+    #MARK: bodystructure
+    # BODYSTRUCTURE письма (RFC 3501, 7.4.2) - без расширенных полей, которые выгрузка не читает
+    if msg.is_multipart():
+        return "(" + "".join(bodystructure(part) for part in msg.get_payload()) + f" {_quote(msg.get_content_subtype())})"
+    maintype, subtype = msg.get_content_maintype(), msg.get_content_subtype()
+    params = list(msg.get_params()[1:]) if msg.get_params() else []
+    encoding = msg.get("Content-Transfer-Encoding", "7bit")
+    payload = msg.get_payload(decode=False)
+    if isinstance(payload, list):
+        payload = payload[0].as_string() if payload else ""
+    raw = payload.encode("utf-8", "replace") if isinstance(payload, str) else bytes(payload)
+    lines = raw.count(b"\n")
+    result = f"({_quote(maintype)} {_quote(subtype)} {_params(params)} NIL NIL {_quote(encoding)} {len(raw)}"
+    if maintype == "text":
+        result += f" {lines}"
+    elif maintype == "message" and subtype == "rfc822":
+        result += f" NIL {bodystructure(msg.get_payload()[0])} {lines}"
+    disposition = msg.get_content_disposition()
+    if disposition:
+        disposition_params = list((msg.get_params(header="content-disposition") or [])[1:])
+        result += f" NIL ({_quote(disposition)} {_params(disposition_params)})"
+    return result + ")"
+
+
+def make_message(index:int,
+                 attachments:int=0,
+                 attachment_size:int=1000,
+                 non_ascii:bool=False,
+                 sender:Optional[str]=None,
+                 subject:Optional[str]=None,
+                 date:Optional[datetime.date]=None,
+                 senders:int=50,
+                 domains:int=10) -> bytes:
+    #MARK: make_message
+    # Синтетическое письмо: отправитель из senders адресов на domains доменах, вложения по attachment_size байт
+    msg = EmailMessage()
+    sender = sender or f"user{index % senders}@mail{index % domains}.example.co.uk"
+    name = "Иван Петров" if non_ascii else f"User {index % senders}"
+    msg["From"] = email.utils.formataddr((name, sender))
+    msg["To"] = "me@example.com"
+    msg["Subject"] = subject or (f"Тема письма {index}" if non_ascii else f"Subject {index}")
+    date = date or datetime.date(2024, 1, 1)
+    msg["Date"] = email.utils.format_datetime(datetime.datetime.combine(date, datetime.time(12, 0),
+                                                                        tzinfo=datetime.timezone.utc))
+    msg["Message-ID"] = f"<msg{index}@example.com>"
+    msg.set_content("Hello body " * 5)
+    for number in range(attachments):
+        maintype, subtype, extension = _ATTACHMENT_TYPES[(index + number) % len(_ATTACHMENT_TYPES)]
+        filename = f"отчёт_{number}.{extension}" if non_ascii else f"file{number}.{extension}"
+        msg.add_attachment(b"x" * attachment_size, maintype=maintype, subtype=subtype, filename=filename)
+    return msg.as_bytes(policy=policy.SMTP)
+
+
+class StoredMessage:
+    #MARK: StoredMessage
+    # Письмо в ящике: исходные байты и лениво вычисляемые части ответа FETCH
+    __slots__ = ("uid", "raw", "flags", "date", "_msg", "_bodystructure", "_header")
+
+    def __init__(self,
+                 uid:int,
+                 raw:bytes,
+                 flags:Iterable[str]=(),
+                 date:Optional[datetime.date]=None):
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags)
+        self.date = date or datetime.date.today()
+        self._msg = None
+        self._bodystructure = None
+        self._header = None
+
+
+
+    @property
+    def msg(self) -> email.message.Message:
+        if self._msg is None:
+            self._msg = email.message_from_bytes(self.raw)
+        return self._msg
+
+
+
+    @property
+    def bodystructure(self) -> str:
+        if self._bodystructure is None:
+            self._bodystructure = bodystructure(self.msg)
+        return self._bodystructure
+
+
+
+    def header_lines(self) -> List[bytes]:
+        #MARK: header_lines
+        # Строки заголовка с учетом переносов (продолжение строки начинается с пробела)
+        if self._header is None:
+            end = self.raw.find(b"\r\n\r\n")
+            end = self.raw.find(b"\n\n") if end < 0 else end
+            header = self.raw[:end] if end >= 0 else self.raw
+            self._header = re.split(rb"\r?\n(?![ \t])", header)
+        return self._header
+
+
+class Mailbox:
+    #MARK: Mailbox
+    def __init__(self,
+                 uidvalidity:int=1):
+        self.uidvalidity = uidvalidity
+        self.next_uid = 1
+        self.messages = []
+
+
+
+    def add(self,
+            raw:bytes,
+            flags:Iterable[str]=(),
+            date:Optional[datetime.date]=None) -> int:
+        #MARK: add
+        self.messages.append(StoredMessage(self.next_uid, raw, flags, date))
+        self.next_uid += 1
+        return self.next_uid - 1
+
+
+class MailStore:
+    #MARK: MailStore
+    """
+    Почтовые ящики сервера и счетчики трафика.
+
+    drop_on_fetch - номера команд FETCH (с 1, сквозная нумерация), на которых сервер обрывает соединение:
+    так проверяются повторы и продолжение выгрузки.
+    """
+    def __init__(self):
+        self.folders = {}
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.commands = 0
+        self.fetches = 0
+        self.drop_on_fetch = set()
+
+
+
+    def folder(self,
+               name:str,
+               uidvalidity:int=1) -> Mailbox:
+        #MARK: folder
+        # name - имя как на сервере (для кириллицы - modified UTF-7)
+        return self.folders.setdefault(name, Mailbox(uidvalidity))
+
+
+
+    def seed(self,
+             folders:int=3,
+             messages:int=1000,
+             attachments:int=1,
+             attachment_size:int=1000,
+             non_ascii_ratio:float=0.5,
+             senders:int=50,
+             domains:int=10,
+             days:int=365,
+             seed:int=0,
+             duplicate_ratio:float=0.0):
+        #MARK: seed
+        """
+        Заполняет ящик синтетическими письмами: folders папок по messages писем.
+        Количество вложений в письме - от 0 до attachments, доля писем с кириллицей в заголовках - non_ascii_ratio,
+        даты писем равномерно распределены по последним days дням (от 2024-01-01).
+        Доля duplicate_ratio писем начиная со второй папки - копии писем из предыдущих папок (тот же Message-ID).
+        """
+        from imapclient import imap_utf7
+        rng = random.Random(seed)
+        names = ["INBOX", "Sent", "Архив", "Рассылки", "Work/Projects", "Спам"]
+        index = 0
+        previous = []
+        for number in range(folders):
+            name = names[number] if number < len(names) else f"Folder{number}"
+            mailbox = self.folder(imap_utf7.encode(name).decode())
+            for _ in range(messages):
+                if previous and rng.random() < duplicate_ratio:
+                    copy = rng.choice(previous)
+                    mailbox.add(copy.raw, date=copy.date)
+                    continue
+                date = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(max(days, 1)))
+                raw = make_message(index, attachments=rng.randint(0, attachments), attachment_size=attachment_size,
+                                   non_ascii=rng.random() < non_ascii_ratio, date=date,
+                                   senders=senders, domains=domains)
+                mailbox.add(raw, date=date)
+                index += 1
+            previous.extend(mailbox.messages)
+
+
+
+    def total_messages(self) -> int:
+        return sum(len(mailbox.messages) for mailbox in self.folders.values())
+
+
+
+    def total_bytes(self) -> int:
+        return sum(len(message.raw) for mailbox in self.folders.values() for message in mailbox.messages)
+
+
+
+    def reset_counters(self):
+        #MARK: reset_counters
+        with self.lock:
+            self.bytes_sent = self.bytes_received = self.commands = self.fetches = 0
+
+
+def _parse_date(value:str) -> datetime.date:
+    day, month, year = value.split("-")
+    return datetime.date(int(year), _IMAP_MONTHS.index(month.capitalize()) + 1, int(day))
+
+
+def _sequence_set(spec:str,
+                  largest:int) -> Set[int]:
+    # message-set IMAP: 1:3,5,7:* -> {1, 2, 3, 5, 7, ..., largest}
+    result = set()
+    for part in spec.split(","):
+        if ":" in part:
+            start, end = part.split(":")
+            start = largest if start == "*" else int(start)
+            end = largest if end == "*" else int(end)
+            result.update(range(min(start, end), max(start, end) + 1))
+        else:
+            result.add(largest if part == "*" else int(part))
+    return result
+
+
+def _arguments(line:str) -> List[str]:
+    return [token[1:-1].replace('\\"', '"').replace("\\\\", "\\") if token.startswith('"') else token
+            for token in _ARGUMENT.findall(line)]
+
+
+class _Session(socketserver.StreamRequestHandler):
+    # Одна сессия IMAP (одно TCP-подключение)
+
+    def send(self,
+             data:Union[str, bytes]):
+        if isinstance(data, str):
+            data = data.encode()
+        with self.server.store.lock:
+            self.server.store.bytes_sent += len(data)
+        self.wfile.write(data)
+
+
+
+    def read_line(self) -> Optional[str]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        received = len(line)
+        line = line.decode("utf-8", "replace").rstrip("\r\n")
+        # Литералы в команде: ... {5}\r\n + 5 байт + продолжение строки
+        match = _LITERAL.search(line)
+        while match:
+            self.send("+ go\r\n")
+            literal = self.rfile.read(int(match.group(1)))
+            rest = self.rfile.readline()
+            received += len(literal) + len(rest)
+            line = line[:match.start()] + _quote_plain(literal.decode("utf-8", "replace")) + \
+                rest.decode("utf-8", "replace").rstrip("\r\n")
+            match = _LITERAL.search(line)
+        with self.server.store.lock:
+            self.server.store.bytes_received += received
+            self.server.store.commands += 1
+        return line
+
+
+
+    def handle(self):
+        self.selected = None
+        self.send("* OK FakeIMAP ready\r\n")
+        while True:
+            try:
+                line = self.read_line()
+            except (ConnectionError, OSError):
+                return
+            if line is None:
+                return
+            if not line.strip():
+                continue
+            parts = line.split(" ", 2)
+            tag = parts[0]
+            command = parts[1].upper() if len(parts) > 1 else ""
+            args = parts[2] if len(parts) > 2 else ""
+            try:
+                if self.dispatch(tag, command, args) == "BYE":
+                    return
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                self.send(f"{tag} BAD {e}\r\n")
+
+
+
+    def mailbox(self) -> Mailbox:
+        return self.server.store.folders[self.selected]
+
+
+
+    def dispatch(self,
+                 tag:str,
+                 command:str,
+                 args:str) -> Optional[str]:
+        store = self.server.store
+        if command == "CAPABILITY":
+            self.send("* CAPABILITY IMAP4rev1 UIDPLUS MOVE AUTH=PLAIN\r\n")
+        elif command == "LOGIN":
+            pass
+        elif command == "LOGOUT":
+            self.send(f"* BYE\r\n{tag} OK LOGOUT completed\r\n")
+            return "BYE"
+        elif command == "NOOP":
+            pass
+        elif command in ("LIST", "LSUB"):
+            for name in list(store.folders):
+                self.send(f'* {command} (\\HasNoChildren) "/" "{name}"\r\n')
+        elif command in ("SELECT", "EXAMINE"):
+            name = _arguments(args)[0]
+            if name not in store.folders:
+                self.send(f"{tag} NO no such mailbox\r\n")
+                return None
+            self.selected = name
+            mailbox = self.mailbox()
+            self.send(f"* {len(mailbox.messages)} EXISTS\r\n* 0 RECENT\r\n"
+                      f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid\r\n"
+                      f"* OK [UIDNEXT {mailbox.next_uid}] predicted next UID\r\n")
+            access = "READ-ONLY" if command == "EXAMINE" else "READ-WRITE"
+            self.send(f"{tag} OK [{access}] {command} completed\r\n")
+            return None
+        elif command == "STATUS":
+            tokens = _arguments(args)
+            if tokens[0] not in store.folders:
+                self.send(f"{tag} NO no such mailbox\r\n")
+                return None
+            mailbox = store.folders[tokens[0]]
+            values = {"MESSAGES": len(mailbox.messages), "UIDNEXT": mailbox.next_uid,
+                      "UIDVALIDITY": mailbox.uidvalidity, "RECENT": 0,
+                      "UNSEEN": sum(1 for message in mailbox.messages if "\\Seen" not in message.flags)}
+            items = [token.upper() for token in tokens[1:] if token not in "()"]
+            self.send(f'* STATUS "{tokens[0]}" (' + " ".join(f"{item} {values[item]}" for item in items) + ")\r\n")
+        elif command == "UID":
+            subcommand, _, rest = args.partition(" ")
+            return self.selected_command(tag, subcommand.upper(), rest, uid=True)
+        elif command in ("SEARCH", "FETCH", "STORE", "EXPUNGE", "MOVE", "COPY", "CLOSE"):
+            return self.selected_command(tag, command, args, uid=False)
+        else:
+            self.send(f"{tag} BAD unknown command {command}\r\n")
+            return None
+        self.send(f"{tag} OK {command} completed\r\n")
+        return None
+
+
+
+    def resolve(self,
+                spec:str,
+                uid:bool) -> List[Tuple[int, StoredMessage]]:
+        # (номер письма, письмо) по message-set из UID или порядковых номеров
+        messages = self.mailbox().messages
+        if not messages:
+            return []
+        if uid:
+            wanted = _sequence_set(spec, messages[-1].uid)
+            return [(number, message) for number, message in enumerate(messages, 1) if message.uid in wanted]
+        wanted = _sequence_set(spec, len(messages))
+        return [(number, message) for number, message in enumerate(messages, 1) if number in wanted]
+
+
+
+    def matches(self,
+                number:int,
+                message:StoredMessage,
+                tokens:List[str]) -> bool:
+        # Все ключи поиска на верхнем уровне объединяются через AND
+        def key(position:int) -> Tuple[bool, int]:
+            name = tokens[position].upper()
+            if name == "ALL":
+                return True, position + 1
+            if name == "NOT":
+                result, position = key(position + 1)
+                return not result, position
+            if name == "OR":
+                left, position = key(position + 1)
+                right, position = key(position)
+                return left or right, position
+            if name in ("SEEN", "UNSEEN", "DELETED"):
+                flag = "\\Deleted" if name == "DELETED" else "\\Seen"
+                return (flag in message.flags) != (name == "UNSEEN"), position + 1
+            if name == "SINCE":
+                return message.date >= _parse_date(tokens[position + 1]), position + 2
+            if name == "BEFORE":
+                return message.date < _parse_date(tokens[position + 1]), position + 2
+            if name == "ON":
+                return message.date == _parse_date(tokens[position + 1]), position + 2
+            if name == "LARGER":
+                return len(message.raw) > int(tokens[position + 1]), position + 2
+            if name == "SMALLER":
+                return len(message.raw) < int(tokens[position + 1]), position + 2
+            if name in ("FROM", "SUBJECT", "TO"):
+                return tokens[position + 1].lower() in str(message.msg.get(name.capitalize(), "")).lower(), position + 2
+            if name == "UID":
+                largest = self.mailbox().messages[-1].uid
+                return message.uid in _sequence_set(tokens[position + 1], largest), position + 2
+            if name == "(":
+                result = True
+                position += 1
+                while tokens[position] != ")":
+                    matched, position = key(position)
+                    result = result and matched
+                return result, position + 1
+            if re.match(r"^[\d*:,]+$", name):
+                return number in _sequence_set(name, len(self.mailbox().messages)), position + 1
+            raise ValueError(f"unsupported search key {name}")
+
+        position = 0
+        result = True
+        while position < len(tokens):
+            matched, position = key(position)
+            result = result and matched
+        return result
+
+
+
+    def fetch_items(self,
+                    message:StoredMessage,
+                    items:List[str],
+                    uid:bool) -> List[Union[str, bytes]]:
+        result = []
+        if uid and "UID" not in [item.upper() for item in items]:
+            items = ["UID"] + items
+        for item in items:
+            name = item.upper()
+            if name == "UID":
+                result.append(f"UID {message.uid}")
+            elif name == "FLAGS":
+                result.append("FLAGS (" + " ".join(sorted(message.flags)) + ")")
+            elif name == "RFC822.SIZE":
+                result.append(f"RFC822.SIZE {len(message.raw)}")
+            elif name == "INTERNALDATE":
+                result.append(f'INTERNALDATE "{message.date.day:02d}-{_IMAP_MONTHS[message.date.month - 1]}-'
+                              f'{message.date.year} 00:00:00 +0000"')
+            elif name in ("RFC822", "BODY[]", "BODY.PEEK[]"):
+                label = "RFC822" if name == "RFC822" else "BODY[]"
+                result.append(f"{label} {{{len(message.raw)}}}\r\n".encode() + message.raw)
+            elif name == "BODYSTRUCTURE":
+                result.append("BODYSTRUCTURE " + message.bodystructure)
+            elif name.startswith("BODY.PEEK[HEADER") or name.startswith("BODY[HEADER"):
+                section = name[name.index("["):]
+                lines = message.header_lines()
+                if ".FIELDS" in section:
+                    fields = set(re.search(r"\((.*)\)", section).group(1).split())
+                    lines = [line for line in lines
+                             if line.split(b":", 1)[0].strip().upper().decode("ascii", "replace") in fields]
+                data = b"\r\n".join(lines) + b"\r\n\r\n"
+                result.append(f"BODY{section} {{{len(data)}}}\r\n".encode() + data)
+            else:
+                raise ValueError(f"unsupported fetch item {item}")
+        return result
+
+
+
+    def selected_command(self,
+                         tag:str,
+                         command:str,
+                         args:str,
+                         uid:bool) -> Optional[str]:
+        if self.selected is None:
+            self.send(f"{tag} NO no mailbox selected\r\n")
+            return None
+        store = self.server.store
+        mailbox = self.mailbox()
+        if command == "SEARCH":
+            tokens = _arguments(args)
+            if tokens and tokens[0].upper() == "CHARSET":
+                tokens = tokens[2:]
+            found = [str(message.uid if uid else number) for number, message in enumerate(mailbox.messages, 1)
+                     if self.matches(number, message, tokens)]
+            self.send("* SEARCH" + "".join(" " + value for value in found) + "\r\n")
+        elif command == "FETCH":
+            with store.lock:
+                store.fetches += 1
+                drop = store.fetches in store.drop_on_fetch
+            if drop:
+                # Обрыв посреди ответа
+                self.send("* 1 FETCH (UID 1 RFC822.SIZE 1\r\n")
+                return "BYE"
+            spec, _, rest = args.partition(" ")
+            rest = rest.strip()
+            if rest.startswith("("):
+                rest = rest[1:-1]
+            items = _FETCH_ITEM.findall(rest)
+            chunks = []
+            for number, message in self.resolve(spec, uid):
+                parts = [part if isinstance(part, bytes) else part.encode()
+                         for part in self.fetch_items(message, items, uid)]
+                chunks.append(f"* {number} FETCH (".encode() + b" ".join(parts) + b")\r\n")
+            if chunks:
+                self.send(b"".join(chunks))
+        elif command == "STORE":
+            spec, operation, flags = args.split(" ", 2)
+            flags = set(re.findall(r"\\?\w+", flags))
+            operation = operation.upper()
+            for number, message in self.resolve(spec, uid):
+                if operation.startswith("+"):
+                    message.flags |= flags
+                elif operation.startswith("-"):
+                    message.flags -= flags
+                else:
+                    message.flags = set(flags)
+                if "SILENT" not in operation:
+                    self.send(f"* {number} FETCH (FLAGS ({' '.join(sorted(message.flags))}))\r\n")
+        elif command in ("EXPUNGE", "CLOSE"):
+            allowed = None
+            if uid and args.strip():
+                allowed = {message.uid for _, message in self.resolve(args.strip(), True)}
+            kept = []
+            for message in mailbox.messages:
+                if "\\Deleted" in message.flags and (allowed is None or message.uid in allowed):
+                    if command == "EXPUNGE":
+                        self.send(f"* {len(kept) + 1} EXPUNGE\r\n")
+                else:
+                    kept.append(message)
+            mailbox.messages = kept
+            if command == "CLOSE":
+                self.selected = None
+        elif command in ("MOVE", "COPY"):
+            spec, target = args.split(" ", 1)
+            target = store.folder(_arguments(target)[0])
+            moved = self.resolve(spec, uid)
+            for _, message in moved:
+                target.add(message.raw, message.flags, message.date)
+            if command == "MOVE":
+                moved_ids = {id(message) for _, message in moved}
+                mailbox.messages = [message for message in mailbox.messages if id(message) not in moved_ids]
+        self.send(f"{tag} OK {'UID ' if uid else ''}{command} completed\r\n")
+        return None
+
+
+def _quote_plain(value:str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    #MARK: FakeIMAPServer
+    # Сервер на 127.0.0.1 в фоновом потоке; port=0 - свободный порт, выбранный системой
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self,
+                 store:MailStore,
+                 host:str="127.0.0.1",
+                 port:int=0):
+        super().__init__((host, port), _Session)
+        self.store = store
+        self._thread = None
+
+
+
+    @property
+    def host(self) -> str:
+        return self.server_address[0]
+
+
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+
+    def start(self) -> "FakeIMAPServer":
+        #MARK: start
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-imap", daemon=True)
+        self._thread.start()
+        return self
+
+
+
+    def stop(self):
+        #MARK: stop
+        self.shutdown()
+        self.server_close()
+
+
+
+    def __enter__(self):
+        return self.start()
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
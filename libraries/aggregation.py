@@ -0,0 +1,263 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import hashlib
+import math
+
+from libraries.rules import registered_domain
+
+from typing import Tuple, Optional, Dict, List, Any, Iterable, Iterator
+
+# Режимы подсчета уникальных отправителей домена
+UNIQUE_EXACT = "exact"
+UNIQUE_HLL = "hll"
+
+
+def _email_and_size(row:Tuple[Any, ...]) -> Tuple[str, int]:
+    # Строка Raw Data (email, name, subject, date, size, attachments) или тройка (email, name, size)
+    size = row[2] if len(row) == 3 else row[4]
+    return (row[0] or "", int(size or 0))
+
+
+class HyperLogLog:
+    #MARK: HyperLogLog
+    """
+    Вероятностный счетчик уникальных значений фиксированного размера (2^precision байт).
+    Погрешность около 1.04 / sqrt(2^precision): для precision=12 - примерно 1.6%.
+    """
+    def __init__(self,
+                 precision:int=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+
+
+    def add(self,
+            value:str):
+        #MARK: add
+        x = int.from_bytes(hashlib.blake2b(value.encode("utf-8", errors="replace"), digest_size=8).digest(), "big")
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+
+
+    def merge(self,
+              other:"HyperLogLog"):
+        #MARK: merge
+        if other.precision != self.precision:
+            raise ValueError("Нельзя объединить HyperLogLog с разной точностью")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+
+
+    def __len__(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Поправка для малых значений (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+
+class UniqueCounter:
+    #MARK: UniqueCounter
+    """
+    Счетчик уникальных адресов домена. В режиме exact - множество; в режиме hll - множество,
+    пока адресов меньше sparse_limit, дальше HyperLogLog (память на домен не растет).
+    """
+    __slots__ = ("mode", "sparse_limit", "values", "sketch")
+
+    def __init__(self,
+                 mode:str=UNIQUE_EXACT,
+                 sparse_limit:int=1024):
+        self.mode = mode
+        self.sparse_limit = sparse_limit
+        self.values = set()
+        self.sketch: Optional[HyperLogLog] = None
+
+
+
+    def add(self,
+            value:str):
+        #MARK: add
+        if self.sketch is not None:
+            self.sketch.add(value)
+            return
+        self.values.add(value)
+        if self.mode == UNIQUE_HLL and len(self.values) > self.sparse_limit:
+            self._to_sketch()
+
+
+
+    def _to_sketch(self):
+        self.sketch = HyperLogLog()
+        for value in self.values:
+            self.sketch.add(value)
+        self.values = set()
+
+
+
+    def merge(self,
+              other:"UniqueCounter"):
+        #MARK: merge
+        if other.sketch is not None and self.sketch is None:
+            self._to_sketch()
+        if self.sketch is not None:
+            if other.sketch is not None:
+                self.sketch.merge(other.sketch)
+            for value in other.values:
+                self.sketch.add(value)
+        else:
+            for value in other.values:
+                self.add(value)
+
+
+
+    def __len__(self) -> int:
+        return len(self.sketch) if self.sketch is not None else len(self.values)
+
+
+
+class EmailAggregator:
+    #MARK: EmailAggregator
+    # Лист By Email: количество писем и суммарный размер по адресу
+    def __init__(self):
+        self.summary: Dict[str, List[int]] = {}
+
+
+
+    def add(self,
+            address:str,
+            size:int):
+        #MARK: add
+        data = self.summary.get(address)
+        if data is None:
+            self.summary[address] = [1, size]
+        else:
+            data[0] += 1
+            data[1] += size
+
+
+
+    def update(self,
+               rows:Iterable[Tuple[Any, ...]]):
+        #MARK: update
+        for row in rows:
+            self.add(*_email_and_size(row))
+
+
+
+    def merge(self,
+              other:"EmailAggregator"):
+        #MARK: merge
+        for address, (count, size) in other.summary.items():
+            data = self.summary.setdefault(address, [0, 0])
+            data[0] += count
+            data[1] += size
+
+
+
+    def items(self) -> Iterator[Tuple[str, int, int]]:
+        # (email, количество, размер) в порядке появления адресов
+        for address, (count, size) in self.summary.items():
+            yield (address, count, size)
+
+
+
+class DomainAggregator:
+    #MARK: DomainAggregator
+    # Лист By Domain: количество писем, уникальные адреса и суммарный размер по домену
+    def __init__(self,
+                 unique_mode:str=UNIQUE_EXACT):
+        if unique_mode not in (UNIQUE_EXACT, UNIQUE_HLL):
+            raise ValueError(f"Неизвестный режим подсчета уникальных адресов: {unique_mode}. Допустимо: exact, hll")
+        self.unique_mode = unique_mode
+        self.summary: Dict[str, List[Any]] = {}
+
+
+
+    def _entry(self,
+               domain:str) -> List[Any]:
+        data = self.summary.get(domain)
+        if data is None:
+            data = self.summary[domain] = [0, 0, UniqueCounter(self.unique_mode)]
+        return data
+
+
+
+    def add(self,
+            address:str,
+            size:int):
+        #MARK: add
+        data = self._entry(registered_domain(address))
+        data[0] += 1
+        data[1] += size
+        data[2].add(address)
+
+
+
+    def update(self,
+               rows:Iterable[Tuple[Any, ...]]):
+        #MARK: update
+        for row in rows:
+            self.add(*_email_and_size(row))
+
+
+
+    def merge(self,
+              other:"DomainAggregator"):
+        #MARK: merge
+        for domain, (count, size, unique) in other.summary.items():
+            data = self._entry(domain)
+            data[0] += count
+            data[1] += size
+            data[2].merge(unique)
+
+
+
+    def items(self) -> Iterator[Tuple[str, int, int, int]]:
+        # (домен, количество, уникальных адресов, размер) в порядке появления доменов
+        for domain, (count, size, unique) in self.summary.items():
+            yield (domain, count, len(unique), size)
+
+
+
+class SummaryAggregator:
+    #MARK: SummaryAggregator
+    """
+    Итоги для листов By Email и By Domain, которые считаются по пачкам строк по мере выгрузки.
+    Частичные итоги (по папке, по воркеру) объединяются через merge, сами строки в памяти не держатся.
+    """
+    def __init__(self,
+                 unique_mode:str=UNIQUE_EXACT):
+        self.by_email = EmailAggregator()
+        self.by_domain = DomainAggregator(unique_mode)
+        self.rows = 0
+
+
+
+    def update(self,
+               rows:Iterable[Tuple[Any, ...]]):
+        #MARK: update
+        # Один проход по строкам: источник может быть генератором
+        for row in rows:
+            address, size = _email_and_size(row)
+            self.by_email.add(address, size)
+            self.by_domain.add(address, size)
+            self.rows += 1
+
+
+
+    def merge(self,
+              other:"SummaryAggregator"):
+        #MARK: merge
+        self.by_email.merge(other.by_email)
+        self.by_domain.merge(other.by_domain)
+        self.rows += other.rows
@@ -0,0 +1,284 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import asyncio
+import re
+import ssl
+from collections import deque
+
+from typing import Tuple, Union, Optional, Dict, List, Any
+
+# * 12 FETCH (...) / * SEARCH 1 2 3 / * OK [UIDVALIDITY 5] ...
+_UNTAGGED = re.compile(rb"^\* (?:(?P<num>\d+) )?(?P<type>[A-Za-z-]+)(?: (?P<rest>.*))?$", re.S)
+_RESPONSE_CODE = re.compile(rb"^\[(?P<code>[A-Za-z-]+)(?: (?P<data>[^\]]*))?\]")
+_TAGGED = re.compile(rb"^(?P<tag>[A-Za-z0-9]+) (?P<status>OK|NO|BAD)(?: (?P<text>.*))?$", re.S | re.I)
+_LITERAL_AT_END = re.compile(rb"\{(\d+)\}\r\n$")
+# Предел длины строки ответа, как MAX_LINE у сессий imaplib в imap_pool
+MAX_LINE = 64 * 1024 * 1024
+
+
+class AsyncIMAPError(Exception):
+    pass
+
+
+class _PendingCommand:
+    def __init__(self, tag:str, future:asyncio.Future):
+        self.tag = tag
+        self.future = future
+        # Нетегированные ответы в формате imaplib: {ТИП: [данные, ...]}
+        self.untagged: Dict[str, List[Any]] = {}
+
+
+def _quote(value:str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class AsyncIMAPClient:
+    #MARK: AsyncIMAPClient
+    """
+    Минимальный асинхронный IMAP-клиент поверх asyncio streams.
+
+    Поддерживает конвейерную отправку команд: send() сразу пишет команду в сокет и возвращает future,
+    не дожидаясь ответа на предыдущие. Нетегированные ответы относятся к самой старой ожидающей команде
+    (сервер выполняет команды одной сессии по порядку). Данные ответов имеют тот же формат, что и у imaplib,
+    поэтому для разбора FETCH используется parse_fetch_response.
+    """
+    def __init__(self,
+                 host:str,
+                 port:int=993,
+                 use_ssl:bool=True,
+                 timeout:float=120.0):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._pending: deque = deque()
+        self._tag_counter = 0
+        self._reader_task: Optional[asyncio.Task] = None
+        self.untagged_responses: Dict[str, List[Any]] = {}
+        self.bytes_received = 0
+
+
+
+    async def connect(self):
+        #MARK: connect
+        ssl_context = ssl.create_default_context() if self.use_ssl else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_context, limit=2 ** 20), self.timeout)
+        greeting = await asyncio.wait_for(self._readline(), self.timeout)
+        if not greeting.startswith(b"* OK") and not greeting.startswith(b"* PREAUTH"):
+            raise AsyncIMAPError(f"Неожиданное приветствие сервера: {greeting!r}")
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+
+
+    async def _readline(self) -> bytes:
+        # Строка ответа целиком, даже длиннее буфера потока (limit): * SEARCH папки на 200 тысяч писем -
+        # около 1.3 МБ. readline() на такой строке падает и теряет буфер, поэтому - readuntil и дочитывание частями
+        # (не больше MAX_LINE байт)
+        chunks = []
+        size = 0
+        while True:
+            try:
+                chunks.append(await self.reader.readuntil(b"\n"))
+                break
+            except asyncio.LimitOverrunError as e:
+                size += e.consumed
+                if size > MAX_LINE:
+                    raise AsyncIMAPError(f"Строка ответа сервера длиннее {MAX_LINE} байт")
+                chunks.append(await self.reader.readexactly(e.consumed))
+            except asyncio.IncompleteReadError as e:
+                # Соединение закрыто: как readline, отдаем то, что успели прочитать
+                chunks.append(e.partial)
+                break
+        return b"".join(chunks)
+
+
+
+    async def _read_response(self) -> List[Union[bytes, Tuple[bytes, bytes]]]:
+        # Одна строка ответа вместе с литералами: [(заголовок, литерал), ..., хвост]
+        items = []
+        line = await self._readline()
+        if not line:
+            raise ConnectionError("Сервер закрыл соединение")
+        self.bytes_received += len(line)
+        match = _LITERAL_AT_END.search(line)
+        while match:
+            literal = await self.reader.readexactly(int(match.group(1)))
+            self.bytes_received += len(literal)
+            items.append((line[:-2], literal))
+            line = await self._readline()
+            if not line:
+                raise ConnectionError("Сервер закрыл соединение")
+            self.bytes_received += len(line)
+            match = _LITERAL_AT_END.search(line)
+        line = line.rstrip(b"\r\n")
+        if line or not items:
+            items.append(line)
+        return items
+
+
+
+    def _store_untagged(self,
+                        items:List[Union[bytes, Tuple[bytes, bytes]]]):
+        first = items[0][0] if isinstance(items[0], tuple) else items[0]
+        match = _UNTAGGED.match(first)
+        if not match:
+            return
+        response_type = match.group("type").decode().upper()
+        num, rest = match.group("num"), match.group("rest") or b""
+        target = self._pending[0].untagged if self._pending else self.untagged_responses
+        # Коды ответа в квадратных скобках: * OK [UIDVALIDITY 5]
+        if response_type in ("OK", "NO", "BAD") and rest.startswith(b"["):
+            code = _RESPONSE_CODE.match(rest)
+            if code:
+                target.setdefault(code.group("code").decode().upper(), []).append(code.group("data"))
+                self.untagged_responses[code.group("code").decode().upper()] = [code.group("data")]
+            return
+        # Как в imaplib: "* 12 FETCH (...)" -> "12 (...)", "* SEARCH 1 2" -> "1 2"
+        head = (num + b" " + rest) if num else rest
+        if num and not rest:
+            head = num
+        if isinstance(items[0], tuple):
+            items = [(head, items[0][1])] + items[1:]
+        else:
+            items = [head] + items[1:]
+        target.setdefault(response_type, []).extend(items)
+
+
+
+    async def _read_loop(self):
+        try:
+            while True:
+                items = await self._read_response()
+                first = items[0][0] if isinstance(items[0], tuple) else items[0]
+                if first.startswith(b"* "):
+                    self._store_untagged(items)
+                    continue
+                if first.startswith(b"+"):
+                    continue
+                match = _TAGGED.match(first)
+                if not match:
+                    continue
+                tag = match.group("tag").decode()
+                while self._pending:
+                    pending = self._pending.popleft()
+                    if pending.tag == tag:
+                        status = match.group("status").decode().upper()
+                        if not pending.future.done():
+                            pending.future.set_result((status, pending.untagged, match.group("text") or b""))
+                        break
+                    if not pending.future.done():
+                        pending.future.set_exception(AsyncIMAPError(f"Нет ответа на команду {pending.tag}"))
+        except Exception as e:
+            while self._pending:
+                pending = self._pending.popleft()
+                if not pending.future.done():
+                    pending.future.set_exception(ConnectionError(f"Соединение с {self.host} потеряно: {e}"))
+
+
+
+    def send(self,
+             name:str,
+             *args:str) -> asyncio.Future:
+        #MARK: send
+        # Отправляет команду, не дожидаясь ответа. Результат future: (статус, нетегированные ответы, текст)
+        self._tag_counter += 1
+        tag = f"A{self._tag_counter:05d}"
+        future = asyncio.get_running_loop().create_future()
+        if self._reader_task is None or self._reader_task.done():
+            future.set_exception(ConnectionError(f"Нет соединения с {self.host}"))
+            return future
+        self._pending.append(_PendingCommand(tag, future))
+        line = " ".join((tag, name) + tuple(args)) + "\r\n"
+        self.writer.write(line.encode("ascii"))
+        return future
+
+
+
+    async def command(self,
+                      name:str,
+                      *args:str) -> Tuple[str, Dict[str, List[Any]], bytes]:
+        #MARK: command
+        await self.writer.drain()
+        future = self.send(name, *args)
+        await self.writer.drain()
+        return await asyncio.wait_for(future, self.timeout)
+
+
+
+    async def login(self,
+                    user:str,
+                    password:str):
+        #MARK: login
+        status, _, text = await self.command("LOGIN", _quote(user), _quote(password))
+        if status != "OK":
+            raise AsyncIMAPError(f"LOGIN: {text.decode(errors='replace')}")
+
+
+
+    async def list_folders(self) -> List[bytes]:
+        #MARK: list_folders
+        status, untagged, text = await self.command("LIST", '""', '"*"')
+        if status != "OK":
+            raise AsyncIMAPError(f"LIST: {text.decode(errors='replace')}")
+        return [item for item in untagged.get("LIST", []) if isinstance(item, bytes)]
+
+
+
+    async def examine(self,
+                      folder:str) -> Dict[str, List[Any]]:
+        #MARK: examine
+        # Папка открывается только на чтение (как select(readonly=True) в imaplib)
+        status, untagged, text = await self.command("EXAMINE", _quote(folder))
+        if status != "OK":
+            raise AsyncIMAPError(f"EXAMINE {folder}: {text.decode(errors='replace')}")
+        return untagged
+
+
+
+    async def status(self,
+                     folder:str,
+                     items:str="(MESSAGES)") -> List[Any]:
+        #MARK: status
+        # Счетчики папки без ее открытия: ответ разбирает parse_status_response
+        status, untagged, text = await self.command("STATUS", _quote(folder), items)
+        if status != "OK":
+            raise AsyncIMAPError(f"STATUS {folder}: {text.decode(errors='replace')}")
+        return untagged.get("STATUS", [])
+
+
+
+    async def uid_search(self,
+                         *criteria:str) -> List[bytes]:
+        #MARK: uid_search
+        status, untagged, text = await self.command("UID", "SEARCH", *(criteria or ("ALL",)))
+        if status != "OK":
+            raise AsyncIMAPError(f"UID SEARCH: {text.decode(errors='replace')}")
+        return untagged.get("SEARCH", [b""])
+
+
+
+    def uid_fetch(self,
+                  uid_set:str,
+                  fetch_items:str) -> asyncio.Future:
+        #MARK: uid_fetch
+        # Конвейерный FETCH: результат - (статус, {"FETCH": [...]}, текст)
+        return self.send("UID", "FETCH", uid_set, fetch_items)
+
+
+
+    async def logout(self):
+        #MARK: logout
+        try:
+            await asyncio.wait_for(self.command("LOGOUT"), 10)
+        except Exception:
+            pass
+        finally:
+            if self._reader_task:
+                self._reader_task.cancel()
+            if self.writer:
+                self.writer.close()
@@ -0,0 +1,202 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import json
+import sqlite3
+
+from libraries.report_writer import RAW_DATA_COLUMNS
+from libraries.rules import registered_domain
+from libraries.duplicates import display_folder, normalize_message_id
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable, Iterator
+
+# Колонки таблиц вложений в Parquet и SQLite (в Excel - ATTACHMENTS_HEADERS и ATTACHMENT_SUMMARY_HEADERS)
+ATTACHMENTS_FIELDS = ["email", "subject", "date", "message_id", "folder", "uid", "filename", "extension",
+                      "mime_type", "size"]
+ATTACHMENT_SUMMARY_FIELDS = ["group_by", "value", "attachments", "messages", "size"]
+
+# Разрезы итогов по вложениям (колонка group_by) в порядке вывода
+GROUP_EXTENSION = "extension"
+GROUP_MIME_TYPE = "mime_type"
+GROUP_DOMAIN = "domain"
+ATTACHMENT_GROUPS = [GROUP_EXTENSION, GROUP_MIME_TYPE, GROUP_DOMAIN]
+
+# Длиннее - скорее часть имени, чем расширение ("отчет.за март")
+_MAX_EXTENSION_LENGTH = 10
+
+
+def attachment_extension(filename:Any) -> str:
+    #MARK: attachment_extension
+    # "Отчет.2024.PDF" -> "pdf"; без расширения (или ".bashrc") - ""
+    name = str(filename or "").replace("\\", "/").rsplit("/", 1)[-1].strip()
+    stem, dot, extension = name.rpartition(".")
+    extension = extension.strip().lower()
+    if not dot or not stem or not extension or len(extension) > _MAX_EXTENSION_LENGTH or " " in extension:
+        return ""
+    return extension
+
+
+def encode_attachment_parts(parts:Iterable[Tuple[str, int, str]]) -> str:
+    #MARK: encode_attachment_parts
+    # [(MIME-тип, размер в кодировке передачи, имя файла), ...] -> компактный JSON; без вложений - ""
+    parts = [[mime_type, int(size or 0), filename] for mime_type, size, filename in parts]
+    if not parts:
+        return ""
+    return json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_attachment_parts(text:Any) -> List[Tuple[str, int, str]]:
+    #MARK: decode_attachment_parts
+    if not text:
+        return []
+    try:
+        return [(str(mime_type), int(size or 0), str(filename)) for mime_type, size, filename in json.loads(text)]
+    except (TypeError, ValueError):
+        return []
+
+
+def row_attachment_parts(row:Tuple[Any, ...]) -> List[Tuple[str, int, str]]:
+    #MARK: row_attachment_parts
+    # Вложения строки выгрузки: значение после колонок Raw Data (в строках из файлов его нет)
+    return decode_attachment_parts(row[RAW_DATA_COLUMNS]) if len(row) > RAW_DATA_COLUMNS else []
+
+
+class AttachmentIndex:
+    #MARK: AttachmentIndex
+    """
+    Вложения писем всех папок выгрузки (SQLite рядом с выходным файлом): по записи на вложение -
+    имя файла, расширение, MIME-тип, размер в кодировке передачи и письмо (папка, UID, адрес, тема).
+
+    Вложения берутся из BODYSTRUCTURE (fetch_mode: metadata) или из разобранного письма (full),
+    содержимое вложений в metadata не скачивается. Как и в DuplicateIndex, запись по ключу
+    (папка, UID, номер вложения) повторяема, а при смене UIDVALIDITY записи папки удаляются.
+    Пишет только ResultWriter.
+    """
+    def __init__(self,
+                 path_to_db:Union[str, Path]):
+        self.path_to_db = str(path_to_db)
+        self.connection = sqlite3.connect(self.path_to_db, timeout=60, check_same_thread=False)
+        # Индекс строится заново при каждой выгрузке: надежность записи не нужна
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS folders (
+                folder TEXT PRIMARY KEY,
+                uidvalidity INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS attachments (
+                folder TEXT NOT NULL,
+                uid INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                email TEXT,
+                domain TEXT,
+                subject TEXT,
+                date TEXT,
+                message_id TEXT,
+                filename TEXT,
+                extension TEXT,
+                mime_type TEXT,
+                size INTEGER,
+                PRIMARY KEY (folder, uid, position)
+            ) WITHOUT ROWID;
+        """)
+        self.connection.commit()
+
+
+
+    def close(self):
+        #MARK: close
+        self.connection.commit()
+        self.connection.close()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+    def start_folder(self,
+                     folder:str,
+                     uidvalidity:int):
+        #MARK: start_folder
+        # UIDVALIDITY изменился - прежние UID папки ничего не значат
+        row = self.connection.execute("SELECT uidvalidity FROM folders WHERE folder = ?", (folder,)).fetchone()
+        if row is not None and row[0] != uidvalidity:
+            self.connection.execute("DELETE FROM attachments WHERE folder = ?", (folder,))
+        self.connection.execute("INSERT OR REPLACE INTO folders (folder, uidvalidity) VALUES (?, ?)",
+                                (folder, uidvalidity))
+        self.connection.commit()
+
+
+
+    def add(self,
+            folder:str,
+            rows:Iterable[Tuple[int, Tuple[Any, ...]]]):
+        #MARK: add
+        # Пары (UID, строка выгрузки); строки без вложений ничего не добавляют
+        records = []
+        for uid, row in rows:
+            parts = row_attachment_parts(row)
+            if not parts:
+                continue
+            email = row[0] or ""
+            domain = registered_domain(email)
+            date = None if row[3] is None else str(row[3])
+            message_id = normalize_message_id(row[6]) if len(row) > 6 else ""
+            for position, (mime_type, size, filename) in enumerate(parts):
+                records.append((folder, uid, position, email, domain, row[2], date, message_id, filename,
+                                attachment_extension(filename), mime_type, size))
+        if not records:
+            return
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO attachments (folder, uid, position, email, domain, subject, date, message_id, "
+            "filename, extension, mime_type, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+        self.connection.commit()
+
+
+
+    def records(self) -> Iterator[Tuple[str, str, str, str, str, int, str, str, str, int]]:
+        #MARK: records
+        # Вложения (ATTACHMENTS_FIELDS) от больших к маленьким
+        query = ("SELECT email, subject, date, message_id, folder, uid, filename, extension, mime_type, size "
+                 "FROM attachments ORDER BY size DESC, folder, uid, position")
+        for email, subject, date, message_id, folder, uid, filename, extension, mime_type, size \
+                in self.connection.execute(query):
+            yield (email or "", subject or "", date or "", message_id or "", display_folder(folder), uid,
+                   filename or "", extension or "", mime_type or "", size or 0)
+
+
+
+    def groups(self) -> Iterator[Tuple[str, str, int, int, int]]:
+        #MARK: groups
+        """
+        Итоги (ATTACHMENT_SUMMARY_FIELDS) по расширению, MIME-типу и домену отправителя:
+        разрез, значение, вложений, писем, байт. В каждом разрезе - от большего объема к меньшему.
+        """
+        for column in ATTACHMENT_GROUPS:
+            query = f"""
+                SELECT {column}, COUNT(*), COUNT(DISTINCT folder || char(10) || uid), SUM(size) AS total
+                FROM attachments
+                GROUP BY {column}
+                ORDER BY total DESC, {column}
+            """
+            for value, attachments, messages, size in self.connection.execute(query):
+                yield (column, value or "", attachments, messages, size or 0)
+
+
+
+    def summary(self) -> Tuple[int, int, List[Tuple[str, int]]]:
+        #MARK: summary
+        # (вложений, байт, три самых объемных расширения с байтами)
+        count, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM attachments").fetchone()
+        top = self.connection.execute(
+            "SELECT extension, SUM(size) AS total FROM attachments GROUP BY extension ORDER BY total DESC LIMIT 3"
+        ).fetchall()
+        return count, size, [(extension or "", total or 0) for extension, total in top]
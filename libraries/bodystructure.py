@@ -0,0 +1,149 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import re
+from email.utils import decode_rfc2231
+from urllib.parse import unquote
+
+from typing import Tuple, Union, Optional, Dict, List, Any, NamedTuple
+
+# filename*0*, filename*1 ... - продолжения параметров по RFC 2231
+_CONTINUATION = re.compile(r"^(?P<name>[^*]+)\*(?P<num>\d+)(?P<enc>\*?)$")
+
+
+class BodyPart(NamedTuple):
+    #MARK: BodyPart
+    part_id: str
+    mime_type: str
+    filename: str
+    disposition: str
+    encoding: str
+    size: int
+
+
+def _as_str(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _as_int(value: Any) -> int:
+    try:
+        return int(_as_str(value))
+    except ValueError:
+        return 0
+
+
+def _decode_rfc2231_value(value: str) -> str:
+    # utf-8''%D0%BE%D1%82... -> текст
+    charset, _, text = decode_rfc2231(value)
+    try:
+        return unquote(text, encoding=charset or "utf-8", errors="replace")
+    except LookupError:
+        return unquote(text, encoding="utf-8", errors="replace")
+
+
+def _params_to_dict(params: Any) -> Dict[str, str]:
+    #MARK: _params_to_dict
+    """
+    Превращает список параметров BODYSTRUCTURE ("NAME" "a.pdf" "CHARSET" "utf-8") в словарь
+    с ключами в нижнем регистре. Склеивает продолжения RFC 2231 (filename*0*, filename*1*).
+    """
+    if not isinstance(params, list):
+        return {}
+    result = {}
+    continuations = {}
+    for i in range(0, len(params) - 1, 2):
+        key = _as_str(params[i]).lower()
+        value = _as_str(params[i + 1])
+        match = _CONTINUATION.match(key)
+        if match:
+            continuations.setdefault(match.group("name"), []).append(
+                (int(match.group("num")), value, bool(match.group("enc"))))
+            continue
+        if key.endswith("*"):
+            result[key[:-1]] = _decode_rfc2231_value(value)
+        else:
+            result[key] = value
+    for name, chunks in continuations.items():
+        chunks.sort()
+        joined = "".join(value for _, value, _ in chunks)
+        if chunks[0][2]:
+            joined = _decode_rfc2231_value(joined)
+        result.setdefault(name, joined)
+    return result
+
+
+def _extension_disposition(structure: List[Any], start: int) -> Tuple[str, Dict[str, str]]:
+    # Поле body-fld-dsp: ("attachment" ("filename" "a.pdf")) или NIL
+    if len(structure) > start and isinstance(structure[start], list) and structure[start]:
+        dsp = structure[start]
+        return _as_str(dsp[0]).lower(), _params_to_dict(dsp[1] if len(dsp) > 1 else None)
+    return "", {}
+
+
+def parse_bodystructure(structure: Any,
+                        part_id: str = ""
+                        ) -> List[BodyPart]:
+    #MARK: parse_bodystructure
+    """
+    Разбирает BODYSTRUCTURE (уже разобранный в списки parse_fetch_response) в список конечных частей письма.
+    Вложенные письма (message/rfc822) обходятся рекурсивно, как это делает email.message.Message.walk().
+
+    :param structure: Значение поля BODYSTRUCTURE.
+    :param part_id: Номер части в терминах IMAP (1, 1.2, ...), для корня - пустая строка.
+    :return: Список BodyPart.
+    """
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    # multipart: (часть1 часть2 ... "subtype" [расширения])
+    if isinstance(structure[0], list):
+        parts = []
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            child_id = f"{part_id}.{index}" if part_id else str(index)
+            parts.extend(parse_bodystructure(child, child_id))
+        return parts
+
+    # одиночная часть: ("type" "subtype" params id description encoding size ...)
+    main_type = _as_str(structure[0]).lower()
+    sub_type = _as_str(structure[1]).lower() if len(structure) > 1 else ""
+    params = _params_to_dict(structure[2] if len(structure) > 2 else None)
+    encoding = _as_str(structure[5] if len(structure) > 5 else None).lower()
+    size = _as_int(structure[6] if len(structure) > 6 else 0)
+    own_id = part_id or "1"
+
+    nested = []
+    if main_type == "text":
+        # после size идет количество строк, затем md5 и disposition
+        disposition_index = 9
+    elif main_type == "message" and sub_type == "rfc822":
+        # после size идут envelope, body, количество строк, затем md5 и disposition
+        disposition_index = 11
+        if len(structure) > 8:
+            nested = parse_bodystructure(structure[8], own_id)
+    else:
+        disposition_index = 8
+
+    disposition, disposition_params = _extension_disposition(structure, disposition_index)
+    filename = disposition_params.get("filename") or params.get("name") or ""
+    part = BodyPart(part_id=own_id,
+                    mime_type=f"{main_type}/{sub_type}",
+                    filename=filename,
+                    disposition=disposition,
+                    encoding=encoding,
+                    size=size)
+    return [part] + nested
+
+
+def attachment_parts(parts: List[BodyPart]) -> List[BodyPart]:
+    #MARK: attachment_parts
+    # То же условие, что и в EmailDataProcessor.extract_attachments: disposition attachment + есть имя файла
+    return [part for part in parts if part.disposition == "attachment" and part.filename]
@@ -0,0 +1,249 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import os
+import sqlite3
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable
+
+# Состояние папки в текущей выгрузке
+FOLDER_IN_PROGRESS = "in_progress"
+FOLDER_DONE = "done"
+FOLDER_FAILED = "failed"
+
+
+class ScanCheckpoint:
+    #MARK: ScanCheckpoint
+    """
+    Контрольные точки выгрузки (SQLite рядом с выходным файлом).
+
+    Для каждой папки: UIDVALIDITY, статус и UID писем, строки которых уже лежат в промежуточном файле
+    (части одной папки выгружаются параллельно, поэтому хранится множество UID, а не только последний).
+    Отдельно - размер промежуточного файла на момент последней контрольной точки:
+    при продолжении (--resume) файл обрезается до него, поэтому недописанная пачка не дублируется.
+    Для каждой пачки хранится ее диапазон байт в промежуточном файле: если UIDVALIDITY папки изменился,
+    ее старые строки вырезаются из файла (spool_ranges / drop_folder_ranges), а не выгружаются второй раз.
+    Пишет только ResultWriter, воркеры открывают базу на чтение.
+    """
+    def __init__(self,
+                 path_to_db:Union[str, Path],
+                 readonly:bool=False):
+        self.path_to_db = str(path_to_db)
+        self.readonly = readonly
+        if readonly:
+            self.connection = sqlite3.connect(f"{Path(self.path_to_db).as_uri()}?mode=ro", uri=True, timeout=60,
+                                              check_same_thread=False)
+            return
+        self.connection = sqlite3.connect(self.path_to_db, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS scan (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS folder_progress (
+                folder TEXT PRIMARY KEY,
+                uidvalidity INTEGER NOT NULL DEFAULT 0,
+                rows INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS spooled_uids (
+                folder TEXT NOT NULL,
+                uid INTEGER NOT NULL,
+                PRIMARY KEY (folder, uid)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS spool_batches (
+                start INTEGER PRIMARY KEY,
+                end INTEGER NOT NULL,
+                folder TEXT NOT NULL
+            );
+        """)
+        self.connection.commit()
+
+
+
+    def close(self):
+        #MARK: close
+        if not self.readonly:
+            self.connection.commit()
+        self.connection.close()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+    def reset(self):
+        #MARK: reset
+        # Новая выгрузка с начала
+        self.connection.execute("DELETE FROM scan")
+        self.connection.execute("DELETE FROM folder_progress")
+        self.connection.execute("DELETE FROM spooled_uids")
+        self.connection.execute("DELETE FROM spool_batches")
+        self.connection.commit()
+
+
+
+    def spool_size(self) -> int:
+        #MARK: spool_size
+        row = self.connection.execute("SELECT value FROM scan WHERE key = 'spool_size'").fetchone()
+        return row[0] if row else 0
+
+
+
+    def _set_spool_size(self,
+                        spool_size:int):
+        self.connection.execute("INSERT OR REPLACE INTO scan (key, value) VALUES ('spool_size', ?)", (spool_size,))
+
+
+
+    def folder_progress(self,
+                        folder:str
+                        ) -> Optional[Tuple[int, int, str]]:
+        #MARK: folder_progress
+        # (UIDVALIDITY, количество записанных строк, статус) или None
+        row = self.connection.execute(
+            "SELECT uidvalidity, rows, status FROM folder_progress WHERE folder = ?", (folder,)).fetchone()
+        return (row[0], row[1], row[2]) if row else None
+
+
+
+    def spooled_uids(self,
+                     folder:str) -> set:
+        #MARK: spooled_uids
+        # UID писем папки, строки которых уже в промежуточном файле
+        return {row[0] for row in self.connection.execute(
+            "SELECT uid FROM spooled_uids WHERE folder = ?", (folder,))}
+
+
+
+    def spool_ranges(self,
+                     folder:str) -> List[Tuple[int, int]]:
+        #MARK: spool_ranges
+        # Диапазоны байт [start, end) пачек папки в промежуточном файле
+        return [(row[0], row[1]) for row in self.connection.execute(
+            "SELECT start, end FROM spool_batches WHERE folder = ? ORDER BY start", (folder,))]
+
+
+
+    def folders_with_status(self,
+                            status:str) -> List[str]:
+        #MARK: folders_with_status
+        return [row[0] for row in self.connection.execute(
+            "SELECT folder FROM folder_progress WHERE status = ? ORDER BY folder", (status,))]
+
+
+
+    def start_folder(self,
+                     folder:str,
+                     uidvalidity:int) -> bool:
+        #MARK: start_folder
+        """
+        Если UIDVALIDITY изменился, сохраненные UID ничего не значат - папка начинается с начала.
+
+        :return: True, если в промежуточном файле остались строки папки со старым UIDVALIDITY:
+            до записи новых строк их нужно вырезать (spool_ranges, drop_folder_ranges).
+        """
+        progress = self.folder_progress(folder)
+        stale = False
+        if progress is None or progress[0] != uidvalidity:
+            if progress is not None and progress[1]:
+                print(f"Папка {folder}: UIDVALIDITY изменился с прошлой контрольной точки, "
+                      f"папка выгружается с начала")
+                stale = True
+                # Контрольные точки прошлых версий не знают, где лежат строки папки - вырезать их нечем
+                recorded = self.connection.execute(
+                    "SELECT COUNT(*) FROM spool_batches WHERE folder = ?", (folder,)).fetchone()[0]
+                if not recorded:
+                    raise Exception(f"Папка {folder}: UIDVALIDITY изменился, а контрольная точка не хранит "
+                                    f"положение ее строк в промежуточном файле. Запустите выгрузку без --resume")
+            self.connection.execute("DELETE FROM spooled_uids WHERE folder = ?", (folder,))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO folder_progress (folder, uidvalidity, rows, status) "
+                "VALUES (?, ?, 0, ?)", (folder, uidvalidity, FOLDER_IN_PROGRESS))
+        else:
+            self.connection.execute("UPDATE folder_progress SET status = ?, error = NULL WHERE folder = ?",
+                                    (FOLDER_IN_PROGRESS, folder))
+        self.connection.commit()
+        return stale
+
+
+
+    def record_batch(self,
+                     folder:str,
+                     uids:List[int],
+                     spool_start:int,
+                     spool_size:int):
+        #MARK: record_batch
+        # Пачка строк папки дописана в промежуточный файл с позиции spool_start: UID, диапазон и размер файла -
+        # одной транзакцией
+        self.connection.executemany("INSERT OR IGNORE INTO spooled_uids (folder, uid) VALUES (?, ?)",
+                                    ((folder, uid) for uid in uids))
+        if spool_size > spool_start:
+            self.connection.execute("INSERT OR REPLACE INTO spool_batches (start, end, folder) VALUES (?, ?, ?)",
+                                    (spool_start, spool_size, folder))
+        self.connection.execute("UPDATE folder_progress SET rows = rows + ? WHERE folder = ?", (len(uids), folder))
+        self._set_spool_size(spool_size)
+        self.connection.commit()
+
+
+
+    def drop_folder_ranges(self,
+                           folder:str,
+                           spool_size:int):
+        #MARK: drop_folder_ranges
+        """
+        Строки папки вырезаны из промежуточного файла (RowSpool.remove_ranges): пачки остальных папок
+        сдвигаются на длину вырезанного перед ними, размер файла - новый.
+        """
+        removed = self.spool_ranges(folder)
+        batches = self.connection.execute(
+            "SELECT start, end, folder FROM spool_batches WHERE folder != ? ORDER BY start", (folder,)).fetchall()
+        shifted = []
+        position = 0
+        offset = 0
+        for start, end, name in batches:
+            while position < len(removed) and removed[position][0] < start:
+                offset += removed[position][1] - removed[position][0]
+                position += 1
+            shifted.append((start - offset, end - offset, name))
+        self.connection.execute("DELETE FROM spool_batches")
+        self.connection.executemany("INSERT INTO spool_batches (start, end, folder) VALUES (?, ?, ?)", shifted)
+        self.connection.execute("UPDATE folder_progress SET rows = 0 WHERE folder = ?", (folder,))
+        self._set_spool_size(spool_size)
+        self.connection.commit()
+
+
+
+    def finish_folder(self,
+                      folder:str,
+                      status:str,
+                      spool_size:int,
+                      error:Optional[str]=None):
+        #MARK: finish_folder
+        self.connection.execute(
+            "INSERT INTO folder_progress (folder, status, error) VALUES (?, ?, ?) "
+            "ON CONFLICT(folder) DO UPDATE SET status = excluded.status, error = excluded.error",
+            (folder, status, error))
+        self._set_spool_size(spool_size)
+        self.connection.commit()
+
+
+
+def remove_checkpoint(path_to_db:Union[str, Path]):
+    #MARK: remove_checkpoint
+    # База и служебные файлы WAL
+    for suffix in ("", "-wal", "-shm"):
+        path = Path(f"{path_to_db}{suffix}")
+        if path.exists():
+            os.remove(path)
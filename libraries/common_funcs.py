@@ -5,8 +5,6 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 import logging
 from typing import Union, Dict, Any, List
 import os
-import inspect
-import requests
 import datetime
 import json
 
@@ -84,7 +82,7 @@ def create_folder_if_not_exists(list_folders:List[Any]
     """
     # Настраиваем логгер с наименованием текущей функции
     if not isinstance(logger, logging.Logger):
-        logger = logging.getLogger(inspect.currentframe().f_code.co_name)
+        logger = logging.getLogger("create_folder_if_not_exists")
         logger.setLevel(logging.INFO)
         handler = logging.StreamHandler()
         logger.addHandler(handler)
@@ -101,12 +99,26 @@ def create_folder_if_not_exists(list_folders:List[Any]
             logger.info(f"Такой путь существует")
 
 
-def prepare_ResponseStatisticInsert(response: Union[requests.Response]
+def prepare_ThroughputStatistic(date_begin: datetime.datetime
+                                , date_end: datetime.datetime
+                                , size_of_data_bytes: int) -> Dict[str, float]:
+    #MARK: prepare_ThroughputStatistic
+    # Длительность (сек), размер (МБ) и скорость (Mbit/s) передачи данных
+    duration = max((date_end - date_begin).total_seconds(), 1e-6)  # Защита от деления на ноль, минимум 1e-6
+    size_mb = max(size_of_data_bytes / 1024.0 / 1024.0, 0.0)  # Размер данных в МБ
+    speed = max((((size_of_data_bytes * 8.0) / 1024.0) / 1024.0) / duration, 0.0)  # Скорость в Mbit/s
+    return {"duration": duration, "size_mb": size_mb, "speed_mbit": speed}
+
+
+def prepare_ResponseStatisticInsert(response: Union["requests.Response"]
                              , date_begin: datetime.datetime
                              , date_end: datetime.datetime
                              , size_of_data_bytes: int
                              , **kwargs) -> Dict[str, Union[str, int]]:
     #MARK: prepare_ResponseStatisticInsert
+    # requests нужен только здесь: импорт при загрузке модуля замедлял старт CLI и каждого воркера
+    import requests
+
     # Вытаскиваем URL, хост, статус
     if isinstance(response, requests.Response):
         full_url = response.url
@@ -128,9 +140,10 @@ def prepare_ResponseStatisticInsert(response: Union[requests.Response]
             text_answer = str(text_answer)
     except Exception as e:
         text_answer = str(text_answer)
-    duration = max((date_end - date_begin).total_seconds(), 1e-6)  # Защита от деления на ноль, минимум 1e-6
-    size_mb = max(size_of_data_bytes / 1024.0 / 1024.0, 0.0)  # Размер данных в МБ
-    speed = max((((size_of_data_bytes * 8.0) / 1024.0) / 1024.0) / duration, 0.0)  # Скорость в Mbit/s
+    throughput = prepare_ThroughputStatistic(date_begin, date_end, size_of_data_bytes)
+    duration = throughput["duration"]
+    size_mb = throughput["size_mb"]
+    speed = throughput["speed_mbit"]
 
     kwargs.update({
         "Status-code": status_code
@@ -147,10 +160,12 @@ def prepare_ResponseStatisticInsert(response: Union[requests.Response]
     return kwargs
 
 
-async def prepare_ResponseData(response: Union[requests.Response]
+async def prepare_ResponseData(response: Union["requests.Response"]
                              , **kwargs) -> Dict[str, Any]:
     #MARK: prepare_ResponseData
 
+    import requests
+
     # Вытаскиваем URL, хост, статус
     if isinstance(response, requests.Response):
         full_url = response.url
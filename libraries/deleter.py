@@ -0,0 +1,221 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import csv
+import imaplib
+
+from imapclient import imap_utf7
+
+from libraries.imap_fetch import compress_uid_set, chunked
+from libraries.state_store import SyncStateStore
+from libraries.rules import RuleIndex
+from libraries.duplicates import row_fingerprint, fingerprint_text, parse_fingerprint
+from libraries.output_backends import OutputBackend, ExcelOutput, get_output_backend
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable
+
+# Колонки отчета о удалении
+DELETION_REPORT_HEADERS = ["Folder", "UID", "Email", "Subject", "Date", "Size (bytes)", "Rule", "Status"]
+
+# Колонка Status отчета
+STATUS_PLANNED = "planned"
+STATUS_DELETED = "deleted"
+STATUS_NOT_DELETED = "not deleted"
+
+
+class DeletionRules:
+    #MARK: DeletionRules
+    """
+    Правила удаления из входного файла (той же структуры, что и выходной: Excel, Parquet или SQLite):
+    * лист "By Email" - все письма с адресов из колонки Email;
+    * лист "By Domain" - все письма с доменов из колонки Domain (включая поддомены);
+    * лист "By Subject" (необязательный) - письма, тема которых содержит строку из колонки Subject;
+    * лист "Raw Data" - конкретные письма (совпадают Email, Subject, Date и Size);
+    * лист "Duplicates" - копии писем из колонки Fingerprint, кроме одной (первой по папке и UID).
+    """
+    def __init__(self,
+                 emails:Iterable[str]=(),
+                 domains:Iterable[str]=(),
+                 subjects:Iterable[str]=(),
+                 messages:Iterable[Tuple[Any, ...]]=(),
+                 duplicates:Iterable[str]=()):
+        # Правила собираются в индекс один раз, проверка письма не перебирает список правил
+        self.index = RuleIndex(emails=emails,
+                               domains=domains,
+                               subjects=subjects,
+                               messages=(self.message_key(*message) for message in messages))
+        self.duplicates = {fingerprint for fingerprint in map(parse_fingerprint, duplicates) if fingerprint is not None}
+
+
+
+    @staticmethod
+    def message_key(email:Any, subject:Any, date:Any, size:Any) -> Tuple[str, str, str, int]:
+        try:
+            size = int(size or 0)
+        except (TypeError, ValueError):
+            size = 0
+        return (str(email or "").lower(), str(subject or ""), str(date or ""), size)
+
+
+
+    @classmethod
+    def from_output(cls,
+                    backend:OutputBackend
+                    ) -> "DeletionRules":
+        #MARK: from_output
+        emails, domains, subjects = backend.rule_columns()
+        messages = ((record.email, record.subject, record.date, record.size) for record in backend.iter_records())
+        return cls(emails=emails, domains=domains, subjects=subjects, messages=messages,
+                   duplicates=backend.duplicate_fingerprints())
+
+
+
+    @classmethod
+    def from_file(cls,
+                  path_to_file:Union[str, Path],
+                  path_to_cache:Union[str, Path, None]=None
+                  ) -> "DeletionRules":
+        #MARK: from_file
+        # Формат входного файла - по расширению (.xlsx, .parquet, .sqlite); кеш используется только для Excel
+        return cls.from_output(get_output_backend(path_to_file, path_to_cache=path_to_cache))
+
+
+
+    @classmethod
+    def from_excel(cls,
+                   path_to_excel:Union[str, Path],
+                   path_to_cache:Union[str, Path, None]=None
+                   ) -> "DeletionRules":
+        #MARK: from_excel
+        # path_to_cache - колоночный кеш листа Raw Data (.feather/.parquet), см. excel_input
+        return cls.from_output(ExcelOutput(path_to_excel, path_to_cache))
+
+
+
+    def __len__(self) -> int:
+        return len(self.index) + len(self.duplicates)
+
+
+
+    def match(self,
+              email:Any,
+              subject:Any,
+              date:Any,
+              size:Any
+              ) -> Optional[str]:
+        #MARK: match
+        # Возвращает описание сработавшего правила или None
+        message_key = self.message_key(email, subject, date, size) if self.index.messages else None
+        return self.index.classify(str(email or "").lower(), str(subject or ""), message_key)
+
+
+
+def plan_deletion(store:SyncStateStore,
+                  rules:DeletionRules
+                  ) -> Dict[str, List[Tuple[int, Tuple[Any, ...], str]]]:
+    #MARK: plan_deletion
+    """
+    Сопоставляет правила с письмами из хранилища состояния.
+    Из каждой группы копий (Duplicates) остается первая по (папка, UID) копия, которую не удаляют другие правила.
+
+    :return: {папка: [(UID, строка Raw Data, правило), ...]}
+    """
+    plan = {}
+    kept = set()
+    for folder, uid, *row in store.iter_messages():
+        rule = rules.match(row[0], row[2], row[3], row[4])
+        if not rule and rules.duplicates:
+            fingerprint = row_fingerprint(row)
+            if fingerprint in kept:
+                rule = f"duplicate:{fingerprint_text(fingerprint)}"
+            elif fingerprint in rules.duplicates:
+                kept.add(fingerprint)
+        if rule:
+            plan.setdefault(folder, []).append((uid, tuple(row), rule))
+    return plan
+
+
+
+def write_deletion_report(path_to_report:Union[str, Path],
+                          plan:Dict[str, List[Tuple[int, Tuple[Any, ...], str]]],
+                          results:Optional[Dict[str, Tuple[List[int], Optional[str]]]]=None):
+    #MARK: write_deletion_report
+    """
+    CSV-отчет: письма плана и правило, по которому каждое попало в план.
+
+    :param results: Итоги удаления {папка: (удаленные UID, текст ошибки или None)}. Без них (dry run)
+        у всех писем статус planned; с ними - deleted или "not deleted" с ошибкой папки.
+    """
+    with open(path_to_report, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file, delimiter=';', quoting=csv.QUOTE_ALL)
+        writer.writerow(DELETION_REPORT_HEADERS)
+        for folder, matches in plan.items():
+            deleted, error = set(), None
+            if results is not None:
+                folder_deleted, error = results.get(folder, ([], "папка не обработана"))
+                deleted = set(folder_deleted)
+            for uid, row, rule in matches:
+                if results is None:
+                    status = STATUS_PLANNED
+                elif uid in deleted:
+                    status = STATUS_DELETED
+                else:
+                    status = f"{STATUS_NOT_DELETED}: {error}" if error else STATUS_NOT_DELETED
+                writer.writerow([folder, uid, row[0], row[2], row[3], row[4], rule, status])
+
+
+
+def delete_uids_in_folder(mail:imaplib.IMAP4,
+                          folder:str,
+                          expected_uidvalidity:int,
+                          uids:List[int],
+                          delete_mode:str="expunge",
+                          trash_folder:str="",
+                          chunk_size:int=1000
+                          ) -> Tuple[List[int], Optional[str]]:
+    #MARK: delete_uids_in_folder
+    """
+    Удаляет письма папки пачками: одна команда на диапазоны UID, а не на каждое письмо.
+
+    delete_mode="expunge": UID STORE +FLAGS.SILENT (\\Deleted) + UID EXPUNGE (нужен UIDPLUS).
+    delete_mode="move": UID MOVE в trash_folder (нужен MOVE). trash_folder - имя как в конфиге (например,
+    "Корзина"), на сервер оно уходит в modified UTF-7.
+
+    :return: (UID, которые действительно удалены, текст ошибки или None). Если упала одна из пачек,
+        удаленные до нее UID все равно возвращаются - их нужно убрать из хранилища.
+    """
+    status, _ = mail.select(f'"{folder}"')
+    if status != 'OK':
+        raise Exception(f"Не удалось открыть папку {folder} на запись")
+    status, response = mail.response('UIDVALIDITY')
+    uidvalidity = int(response[0]) if response and response[0] else 0
+    if uidvalidity != expected_uidvalidity:
+        # UID из хранилища относятся к другой версии папки - удалять по ним нельзя
+        raise Exception(f"UIDVALIDITY папки {folder} изменился ({expected_uidvalidity} -> {uidvalidity}), "
+                        f"нужна повторная выгрузка")
+    capabilities = set(mail.capabilities)
+    if delete_mode == "move" and "MOVE" not in capabilities:
+        raise Exception("Сервер не поддерживает MOVE")
+    if delete_mode != "move" and "UIDPLUS" not in capabilities:
+        # Обычный EXPUNGE удалил бы и чужие письма с флагом \Deleted
+        raise Exception("Сервер не поддерживает UIDPLUS (UID EXPUNGE)")
+    trash = imap_utf7.encode(trash_folder).decode() if trash_folder else ""
+    deleted = []
+    try:
+        for batch in chunked(sorted(uids), chunk_size):
+            uid_set = compress_uid_set(batch)
+            if delete_mode == "move":
+                status, data = mail.uid('MOVE', uid_set, f'"{trash}"')
+            else:
+                status, data = mail.uid('STORE', uid_set, '+FLAGS.SILENT', '(\\Deleted)')
+                if status == 'OK':
+                    status, data = mail.uid('EXPUNGE', uid_set)
+            if status != 'OK':
+                raise Exception(f"Не удалось удалить письма {uid_set} в папке {folder}: {data}")
+            deleted.extend(batch)
+    except Exception as e:
+        # Пачки до ошибки уже удалены на сервере
+        return deleted, str(e)
+    # CLOSE не вызываем: он удалил бы и чужие письма с флагом \Deleted
+    return deleted, None
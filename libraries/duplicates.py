@@ -0,0 +1,220 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import hashlib
+import re
+import sqlite3
+
+from imapclient import imap_utf7
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable, Iterator
+
+# Колонки таблицы дубликатов в Parquet и SQLite (в Excel - DUPLICATES_HEADERS)
+DUPLICATES_FIELDS = ["fingerprint", "message_id", "email", "subject", "copies", "size", "reclaimable",
+                     "folders", "keep_folder", "keep_uid"]
+
+_MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+
+
+def normalize_message_id(value:Any) -> str:
+    #MARK: normalize_message_id
+    # "  <abc@host>  (comment)" -> "<abc@host>"; без угловых скобок - значение без пробелов
+    text = str(value or "").strip()
+    match = _MESSAGE_ID_RE.search(text)
+    if match:
+        return match.group(0)
+    return "".join(text.split())
+
+
+def message_fingerprint(email:Any,
+                        subject:Any,
+                        date:Any,
+                        size:Any,
+                        message_id:Any=None) -> int:
+    #MARK: message_fingerprint
+    """
+    Отпечаток письма: по Message-ID, а если его нет - по From + Date + Subject + размер.
+    Одинаковый отпечаток у копий одного письма в разных папках.
+
+    :return: 64-битное целое со знаком (хранится в SQLite как INTEGER).
+    """
+    message_id = normalize_message_id(message_id)
+    if message_id:
+        key = f"id\0{message_id}"
+    else:
+        try:
+            size = int(size or 0)
+        except (TypeError, ValueError):
+            size = 0
+        key = f"hdr\0{str(email or '').lower()}\0{date or ''}\0{subject or ''}\0{size}"
+    digest = hashlib.blake2b(key.encode("utf-8", errors="replace"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def row_fingerprint(row:Tuple[Any, ...]) -> int:
+    #MARK: row_fingerprint
+    # Строка Raw Data (email, name, subject, date, size, attachments[, message_id])
+    return message_fingerprint(row[0], row[2], row[3], row[4], row[6] if len(row) > 6 else None)
+
+
+def fingerprint_text(fingerprint:int) -> str:
+    #MARK: fingerprint_text
+    # В Excel числа хранятся как double, поэтому в файлах отпечаток - 16 шестнадцатеричных символов
+    return format(fingerprint & 0xFFFFFFFFFFFFFFFF, "016x")
+
+
+def parse_fingerprint(text:Any) -> Optional[int]:
+    #MARK: parse_fingerprint
+    try:
+        value = int(str(text).strip(), 16)
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= value <= 0xFFFFFFFFFFFFFFFF:
+        return None
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def display_folder(folder:str) -> str:
+    #MARK: display_folder
+    # Имя папки из modified UTF-7 для людей
+    try:
+        return imap_utf7.decode(folder.encode("ascii"))
+    except Exception:
+        return folder
+
+
+class DuplicateIndex:
+    #MARK: DuplicateIndex
+    """
+    Индекс отпечатков писем всех папок выгрузки (SQLite рядом с выходным файлом).
+
+    Для каждого письма хранятся папка, UID, отпечаток и поля для отчета; поиск копий - по индексу
+    на отпечатке, поэтому память не зависит от размера ящика. Запись по ключу (папка, UID) повторяема:
+    продолжение выгрузки (--resume) не создает ложных копий. Пишет только ResultWriter.
+
+    Копия, которая остается, - первая по (папка, UID); так же ее выбирает plan_deletion.
+    """
+    def __init__(self,
+                 path_to_db:Union[str, Path]):
+        self.path_to_db = str(path_to_db)
+        self.connection = sqlite3.connect(self.path_to_db, timeout=60, check_same_thread=False)
+        # Индекс строится заново при каждой выгрузке: надежность записи не нужна
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS folders (
+                folder TEXT PRIMARY KEY,
+                uidvalidity INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                folder TEXT NOT NULL,
+                uid INTEGER NOT NULL,
+                fingerprint INTEGER NOT NULL,
+                size INTEGER,
+                email TEXT,
+                subject TEXT,
+                message_id TEXT,
+                PRIMARY KEY (folder, uid)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS messages_fingerprint ON messages (fingerprint);
+        """)
+        self.connection.commit()
+
+
+
+    def close(self):
+        #MARK: close
+        self.connection.commit()
+        self.connection.close()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+    def start_folder(self,
+                     folder:str,
+                     uidvalidity:int):
+        #MARK: start_folder
+        # UIDVALIDITY изменился - прежние UID папки ничего не значат
+        row = self.connection.execute("SELECT uidvalidity FROM folders WHERE folder = ?", (folder,)).fetchone()
+        if row is not None and row[0] != uidvalidity:
+            self.connection.execute("DELETE FROM messages WHERE folder = ?", (folder,))
+        self.connection.execute("INSERT OR REPLACE INTO folders (folder, uidvalidity) VALUES (?, ?)",
+                                (folder, uidvalidity))
+        self.connection.commit()
+
+
+
+    def add(self,
+            folder:str,
+            rows:Iterable[Tuple[int, Tuple[Any, ...]]]):
+        #MARK: add
+        # Пары (UID, строка Raw Data)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO messages (folder, uid, fingerprint, size, email, subject, message_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((folder, uid, row_fingerprint(row), row[4], row[0], row[2],
+              normalize_message_id(row[6]) if len(row) > 6 else "") for uid, row in rows))
+        self.connection.commit()
+
+
+
+    def groups(self) -> Iterator[Tuple[str, str, str, str, int, int, int, str, str, int]]:
+        #MARK: groups
+        """
+        Группы копий (DUPLICATES_FIELDS) от большего освобождаемого объема к меньшему:
+        отпечаток, Message-ID, адрес, тема, копий, размер письма, освобождаемые байты
+        (все копии, кроме оставляемой), папки, папка и UID оставляемой копии.
+        """
+        query = """
+            WITH duplicated AS (
+                SELECT fingerprint FROM messages GROUP BY fingerprint HAVING COUNT(*) > 1
+            ), ranked AS (
+                SELECT messages.*,
+                       ROW_NUMBER() OVER (PARTITION BY fingerprint ORDER BY folder, uid) AS position,
+                       ROW_NUMBER() OVER (PARTITION BY fingerprint, folder ORDER BY uid) AS folder_position
+                FROM messages JOIN duplicated USING (fingerprint)
+            )
+            SELECT fingerprint,
+                   MAX(CASE WHEN position = 1 THEN message_id END),
+                   MAX(CASE WHEN position = 1 THEN email END),
+                   MAX(CASE WHEN position = 1 THEN subject END),
+                   COUNT(*),
+                   MAX(CASE WHEN position = 1 THEN size END),
+                   SUM(CASE WHEN position > 1 THEN size ELSE 0 END) AS reclaimable,
+                   GROUP_CONCAT(CASE WHEN folder_position = 1 THEN folder END, char(10)),
+                   MAX(CASE WHEN position = 1 THEN folder END),
+                   MAX(CASE WHEN position = 1 THEN uid END)
+            FROM ranked
+            GROUP BY fingerprint
+            ORDER BY reclaimable DESC, fingerprint
+        """
+        for (fingerprint, message_id, email, subject, copies, size, reclaimable,
+             folders, keep_folder, keep_uid) in self.connection.execute(query):
+            yield (fingerprint_text(fingerprint), message_id or "", email or "", subject or "", copies, size or 0,
+                   reclaimable or 0, ", ".join(display_folder(folder) for folder in folders.split("\n")),
+                   display_folder(keep_folder), keep_uid)
+
+
+
+    def summary(self) -> Tuple[int, int, int]:
+        #MARK: summary
+        # (групп копий, лишних копий, освобождаемых байт)
+        row = self.connection.execute("""
+            SELECT COUNT(*), COALESCE(SUM(copies - 1), 0), COALESCE(SUM(total - kept), 0) FROM (
+                SELECT COUNT(*) AS copies, SUM(size) AS total,
+                       (SELECT size FROM messages AS copy WHERE copy.fingerprint = messages.fingerprint
+                        ORDER BY folder, uid LIMIT 1) AS kept
+                FROM messages GROUP BY fingerprint HAVING COUNT(*) > 1
+            )
+        """).fetchone()
+        return row[0], row[1], row[2]
@@ -2,28 +2,47 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from libraries.common_funcs import CustomFormatter, set_custom_logger
+from libraries.common_funcs import set_custom_logger
+from libraries.imap_fetch import (FULL_FETCH_ITEMS, METADATA_FETCH_ITEMS, get_header_bytes, parse_uid_list, iter_uid_fetch,
+                                  response_size, pack_fetch_response, unpack_fetch_response,
+                                   parse_fetch_response, compress_uid_set, chunked, parse_status_response, parse_list_flags)
+from libraries.bodystructure import parse_bodystructure, attachment_parts
+from libraries.state_store import SyncStateStore
+from libraries.report_writer import RowSpool, RAW_DATA_HEADERS
+from libraries.imap_pool import IMAPConnectionPool, get_process_pool, close_process_pool
+from libraries.excel_input import RawDataRecord
+from libraries.output_backends import get_output_backend
+from libraries.header_decode import decode_header_value, parse_address
+from libraries.aggregation import SummaryAggregator, UNIQUE_EXACT, UNIQUE_HLL
+from libraries.row_store import RowStore
+from libraries.deleter import DeletionRules, plan_deletion, write_deletion_report, delete_uids_in_folder
+from libraries.result_pipeline import (ResultWriter, ResultPipeline, MSG_FOLDER_STARTED, MSG_RESET, MSG_EXPUNGED,
+                                       MSG_ROWS, MSG_FOLDER_DONE, MSG_FOLDER_FAILED, MSG_METRICS)
+from libraries.metrics import (PipelineMetrics, STAGE_LIST, STAGE_STATUS, STAGE_SELECT, STAGE_SEARCH, STAGE_FETCH,
+                               STAGE_PARSE, STAGE_OUTPUT)
+from libraries.checkpoint import ScanCheckpoint, remove_checkpoint, FOLDER_DONE, FOLDER_FAILED
+from libraries.duplicates import DuplicateIndex, normalize_message_id
+from libraries.attachments import AttachmentIndex, encode_attachment_parts
+from libraries.search_criteria import SearchCriteria
+from libraries.parse_pipeline import ParsePipeline, BatchTracker
+from libraries.scheduler import (FolderPlan, WorkUnit, UnitQueue, ProgressTracker, split_by_windows, split_unit,
+                                 folder_excluded)
 
 from functools import partial
 import os
-import re
-import openpyxl
+import time
 import imaplib
 import email
 import concurrent.futures
-import logging
-import codecs
-from collections import defaultdict
-from email.header import decode_header
-from email.utils import parseaddr
+import threading
+import itertools
+from collections import deque
 from pathlib import Path
 from imapclient import imap_utf7
 
-logger = set_custom_logger(name_logger="DEBUGGER", level_logger="DEBUG")
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable, Iterator, Callable
 
 
-from typing import Tuple, Union, Optional, Dict, List, Any
-
 class EmailDataProcessor:
     #MARK: EmailDataProcessor
     def __init__(self,
@@ -32,13 +51,117 @@ class EmailDataProcessor:
                 email_password:str,
                 output_excel_file:str,
                 input_excel_file:str="",
-                exclude_folders:List[str]=[]):
+                exclude_folders:List[str]=[],
+                fetch_mode:str="full",
+                fetch_batch_size:int=500,
+                state_db:str="",
+                result_queue_size:int=64,
+                max_connections:int=4,
+                engine:str="process",
+                parse_workers:int=2,
+                async_pipeline_depth:int=4,
+                delete_dry_run:bool=True,
+                delete_mode:str="expunge",
+                trash_folder:str="",
+                unique_senders_mode:str="exact",
+                input_excel_cache:str="",
+                folder_retries:int=3,
+                retry_backoff:float=5.0,
+                search:Optional[Dict[str, Any]]=None,
+                max_unit_messages:int=5000,
+                progress_interval:float=10.0,
+                imap_port:int=0,
+                imap_ssl:bool=True,
+                metrics_json:str="",
+                metrics_prometheus:str="",
+                output_format:str="",
+                fetch_queue_size:int=16,
+                parse_batch_bytes:int=4 * 1024 * 1024,
+                find_duplicates:bool=True,
+                analyze_attachments:bool=True):
         self.imap_server = imap_server
+        # Порт IMAP (0 - стандартный: 993 с TLS, 143 без) и TLS; без TLS - только для локальных серверов и бенчмарков
+        self.imap_ssl = bool(imap_ssl)
+        self.imap_port = int(imap_port or (993 if self.imap_ssl else 143))
         self.email_user = email_user
         self.email_password = email_password
-        self.output_excel_file = Path(output_excel_file).resolve()
+        # Формат выходного файла: excel, parquet или sqlite (по умолчанию - по расширению output_excel_file)
+        self.output = get_output_backend(Path(output_excel_file).resolve(), output_format)
+        self.output_excel_file = self.output.path_to_file
+        # Промежуточный файл строк Raw Data рядом с выходным Excel
+        self.spool = RowSpool(f"{self.output_excel_file}.spool.jsonl")
+        # Контрольные точки выгрузки (записанные UID папок) для продолжения после сбоя
+        self.checkpoint_db = Path(f"{self.output_excel_file}.checkpoint.sqlite")
+        # Индекс отпечатков писем всех папок (Message-ID или From + Date + Subject + размер) для листа Duplicates
+        self.find_duplicates = bool(find_duplicates)
+        self.duplicates_db = Path(f"{self.output_excel_file}.duplicates.sqlite")
+        # Индекс вложений (имя, MIME-тип, размер, письмо) для листов Attachments и Attachment Summary
+        self.analyze_attachments = bool(analyze_attachments)
+        self.attachments_db = Path(f"{self.output_excel_file}.attachments.sqlite")
         self.input_excel_file = Path(input_excel_file).resolve() if input_excel_file else None
-        self.exclude_folders = set(exclude_folders or [])
+        # Метрики этапов в конце выгрузки: JSON (по умолчанию <выходной файл>_metrics.json) и, если задан, файл Prometheus
+        self.metrics_json = (Path(metrics_json).resolve() if metrics_json
+                             else self.output_excel_file.with_name(f"{self.output_excel_file.stem}_metrics.json"))
+        self.metrics_prometheus = Path(metrics_prometheus).resolve() if metrics_prometheus else None
+        self.metrics = PipelineMetrics()
+        # Колоночный кеш листа Raw Data входного файла (.feather/.parquet): xlsx разбирается один раз
+        self.input_excel_cache = Path(input_excel_cache).resolve() if input_excel_cache else None
+        # Имена папок или glob-шаблоны ("Спам", "Архив/*"), сравниваются с раскодированными из UTF-7 именами
+        self.exclude_folders = [str(pattern) for pattern in (exclude_folders or []) if str(pattern or "").strip()]
+        # full - скачиваем письмо целиком (RFC822), metadata - только размер, заголовки и BODYSTRUCTURE
+        self.fetch_mode = (fetch_mode or "full").lower()
+        if self.fetch_mode not in ("full", "metadata"):
+            raise ValueError(f"Неизвестный режим выгрузки писем: {fetch_mode}. Допустимо: full, metadata")
+        # Сколько писем запрашивать одной командой UID FETCH
+        self.fetch_batch_size = max(int(fetch_batch_size or 500), 1)
+        # SQLite с состоянием синхронизации папок: повторные запуски выгружают только новые письма
+        self.state_db = Path(state_db).resolve() if state_db else None
+        # Сколько пачек строк может ждать записи; при заполнении очереди воркеры ждут писателя
+        self.result_queue_size = max(int(result_queue_size or 64), 1)
+        # Сколько сессий IMAP держим одновременно (= количество воркеров выгрузки)
+        self.max_connections = max(int(max_connections or 4), 1)
+        # process - папки выгружаются воркерами ProcessPoolExecutor, async - asyncio в одном процессе,
+        # pipeline - потоки чтения IMAP, пул процессов разбора и писатель работают одновременно
+        self.engine = (engine or "process").lower()
+        if self.engine not in ("process", "async", "pipeline"):
+            raise ValueError(f"Неизвестный движок выгрузки: {engine}. Допустимо: process, async, pipeline")
+        # Размер пула процессов для разбора ответов (движки async и pipeline) и количество UID FETCH "в полете"
+        # на сессию (движок async)
+        self.parse_workers = max(int(parse_workers or 2), 1)
+        self.async_pipeline_depth = max(int(async_pipeline_depth or 4), 1)
+        # Движок pipeline: сколько ответов UID FETCH может ждать разбора и сколько байт ответов уходит одной задачей
+        self.fetch_queue_size = max(int(fetch_queue_size or 16), 1)
+        self.parse_batch_bytes = max(int(parse_batch_bytes or 4 * 1024 * 1024), 1)
+        # Удаление по входному Excel: по умолчанию только отчет, без изменений на сервере
+        self.delete_dry_run = bool(delete_dry_run)
+        self.delete_mode = (delete_mode or "expunge").lower()
+        if self.delete_mode not in ("expunge", "move"):
+            raise ValueError(f"Неизвестный режим удаления: {delete_mode}. Допустимо: expunge, move")
+        if self.delete_mode == "move" and not trash_folder:
+            raise ValueError("Для режима удаления move нужно указать trash_folder")
+        self.trash_folder = trash_folder
+        # Сколько раз повторять упавшие папки и базовая задержка перед повтором (удваивается с каждой попыткой)
+        self.folder_retries = max(int(folder_retries if folder_retries is not None else 3), 0)
+        self.retry_backoff = max(float(retry_backoff if retry_backoff is not None else 5.0), 0.0)
+        # Критерии UID SEARCH: сервер отдает только подходящие письма, большие папки делятся на окна по датам
+        self.search_criteria = SearchCriteria.from_config(search)
+        # Папки больше max_unit_messages писем делятся на части по диапазонам UID и выгружаются параллельно
+        # (0 - не делить). Прогресс и оценка оставшегося времени печатаются раз в progress_interval сек
+        self.max_unit_messages = max(int(max_unit_messages if max_unit_messages is not None else 5000), 0)
+        self.progress_interval = max(float(progress_interval if progress_interval is not None else 10.0), 0.0)
+        # Подсчет уникальных адресов на листе By Domain: exact - точно, hll - оценка HyperLogLog (память не растет)
+        self.unique_senders_mode = (unique_senders_mode or UNIQUE_EXACT).lower()
+        if self.unique_senders_mode not in (UNIQUE_EXACT, UNIQUE_HLL):
+            raise ValueError(f"Неизвестный режим подсчета уникальных адресов: {unique_senders_mode}. Допустимо: exact, hll")
+
+
+
+    def __getstate__(self):
+        # Объект передается воркерам с каждой задачей; общие метрики остаются в родителе
+        # (в это время их дополняет поток-писатель), воркеры собирают свои и присылают MSG_METRICS
+        state = self.__dict__.copy()
+        state["metrics"] = PipelineMetrics()
+        return state
 
 
 
@@ -52,13 +175,8 @@ class EmailDataProcessor:
                             raw_from
                             ) -> Tuple[str, str]:
         #MARK: parse_email_address
-        name, addr = parseaddr(raw_from)
-        decoded_name = decode_header(name)
-        name = ''.join(
-            part.decode(charset or 'utf-8') if isinstance(part, bytes) else part
-            for part, charset in decoded_name
-        )
-        return (name, addr)
+        # Имя расшифровывается только если в нем есть =?, результаты кешируются (см. header_decode)
+        return parse_address(raw_from)
 
 
 
@@ -67,190 +185,1303 @@ class EmailDataProcessor:
                        ) -> str:
         #MARK: decode_subject
         # Пробуем декодировать как заголовок письма
-        decoded_parts = decode_header(subject or "")
-        decoded_subject = ''.join(
-            part.decode(charset or 'utf-8', errors='replace') if isinstance(part, bytes) else part
-            for part, charset in decoded_parts
-        )
+        return decode_header_value(subject)
 
-        return decoded_subject
 
-
-    def extract_attachments(self,
-                            msg):
-        #MARK: extract_attachments
-        attachments = []
+    def extract_attachment_parts(self,
+                                 msg) -> List[Tuple[str, int, str]]:
+        #MARK: extract_attachment_parts
+        # (MIME-тип, размер в кодировке передачи, имя файла) вложений письма - как size в BODYSTRUCTURE
+        parts = []
         for part in msg.walk():
             if part.get_content_disposition() == 'attachment':
                 filename = part.get_filename()
                 if filename:
-                    decoded_filename = self.decode_subject(filename)
-                    attachments.append(decoded_filename)
-        return ", ".join(attachments)
+                    payload = part.get_payload()
+                    # Письмо разобрано из bytes: символ тела - один байт (surrogateescape)
+                    size = len(payload) if isinstance(payload, str) else sum(len(str(item)) for item in payload)
+                    parts.append((part.get_content_type(), size, self.decode_subject(filename)))
+        return parts
 
 
 
-    def fetch_emails_from_folder(self,
-                                folder_name:bytes):
-        #MARK: fetch_emails_from_folder
+    def extract_attachments(self,
+                            msg):
+        #MARK: extract_attachments
+        return ", ".join(filename for _, _, filename in self.extract_attachment_parts(msg))
+
+
+
+    def build_row_from_message(self,
+                               raw_message:bytes
+                               ) -> Tuple[str, str, str, Any, int, str, str, str]:
+        #MARK: build_row_from_message
+        # Строка Raw Data и вложения письма (encode_attachment_parts) последним значением
+        msg = email.message_from_bytes(raw_message)
+        name_sender, email_address = self.parse_email_address(msg['From'])
+        subject = self.decode_subject(msg['Subject'])
+        size = len(raw_message)
+        parts = self.extract_attachment_parts(msg)
+        attachments = ", ".join(filename for _, _, filename in parts)
+        date = msg['Date']
+        return (email_address, name_sender, subject, date, size, attachments, normalize_message_id(msg['Message-ID']),
+                encode_attachment_parts(parts))
+
+
+
+    def build_row_from_metadata(self,
+                                fields:Dict[str, Any]
+                                ) -> Tuple[str, str, str, Any, int, str, str, str]:
+        #MARK: build_row_from_metadata
+        # Строка Raw Data по ответу FETCH (RFC822.SIZE BODY.PEEK[HEADER.FIELDS (...)] BODYSTRUCTURE);
+        # вложения - из BODYSTRUCTURE, их содержимое не скачивается
+        msg = email.message_from_bytes(get_header_bytes(fields))
+        name_sender, email_address = self.parse_email_address(msg['From'])
+        subject = self.decode_subject(msg['Subject'])
+        try:
+            size = int(fields.get("RFC822.SIZE") or 0)
+        except ValueError:
+            size = 0
+        parts = [(part.mime_type, part.size, self.decode_subject(part.filename))
+                 for part in attachment_parts(parse_bodystructure(fields.get("BODYSTRUCTURE")))]
+        attachments = ", ".join(filename for _, _, filename in parts)
+        date = msg['Date']
+        return (email_address, name_sender, subject, date, size, attachments, normalize_message_id(msg['Message-ID']),
+                encode_attachment_parts(parts))
+
+
+
+    def build_row(self,
+                  fields:Dict[str, Any]
+                  ) -> Tuple[str, str, str, Any, int, str, str, str]:
+        #MARK: build_row
+        if self.fetch_mode == "metadata":
+            return self.build_row_from_metadata(fields)
+        return self.build_row_from_message(bytes(fields.get("RFC822") or b""))
+
+
+
+    def build_rows_from_response(self,
+                                 data:List[Any]
+                                 ) -> List[Tuple[int, Tuple[Any, ...]]]:
+        #MARK: build_rows_from_response
+        # Ответ UID FETCH на пачку писем -> [(UID, строка Raw Data), ...]. Вызывается в пуле разбора
+        rows = []
+        for _, fields in parse_fetch_response(data):
+            if fields.get("UID") is not None:
+                rows.append((int(fields["UID"]), self.build_row(fields)))
+        return rows
+
+
+
+    def build_rows_from_buffers(self,
+                                buffers:List[bytes]
+                                ) -> Tuple[List[List[Tuple[int, Tuple[Any, ...]]]], float]:
+        #MARK: build_rows_from_buffers
+        # Пачка упакованных ответов UID FETCH -> строки по каждому ответу и время разбора. Вызывается в пуле разбора
+        time_begin = time.perf_counter()
+        rows = [self.build_rows_from_response(unpack_fetch_response(buffer)) for buffer in buffers]
+        return rows, time.perf_counter() - time_begin
+
+
+
+    def decode_folder_name(self,
+                           folder_name:bytes
+                           ) -> Tuple[str, str]:
+        #MARK: decode_folder_name
+        # Строка ответа LIST -> (имя папки для команд IMAP, имя папки для людей)
+        folder_decoded = folder_name.decode().split('"')[-2]
+        folder_decoded_rus = imap_utf7.decode(folder_name).split('"')[-2]
+        return (folder_decoded, folder_decoded_rus)
+
+
+
+    def sync_folder_state(self,
+                          uidvalidity:int,
+                          store:SyncStateStore,
+                          folder_decoded:str,
+                          folder_decoded_rus:str,
+                          uids:List[int]
+                          ) -> Tuple[List[Tuple[str, str, Any]], List[int]]:
+        #MARK: sync_folder_state
+        """
+        Сверяет папку на сервере с локальным хранилищем (хранилище только читается).
+        При смене UIDVALIDITY папка сбрасывается и выгружается заново.
+
+        :return: Сообщения для писателя (сброс папки / удаленные с сервера UID) и список новых UID.
+        """
+        state = store.get_folder_state(folder_decoded)
+        if state is None or state[0] != uidvalidity:
+            if state is not None:
+                print(f"Папка {folder_decoded_rus}: изменился UIDVALIDITY, выгружаем папку заново")
+            return [(MSG_RESET, folder_decoded, uidvalidity)], uids
+        messages = []
+        known_uids = store.known_uids(folder_decoded)
+        expunged = known_uids.difference(uids)
+        if expunged:
+            messages.append((MSG_EXPUNGED, folder_decoded, sorted(expunged)))
+        new_uids = [uid for uid in uids if uid not in known_uids]
+        print(f"Папка {folder_decoded_rus}: новых писем {len(new_uids)}, удалено с сервера {len(expunged)}, "
+              f"уже в хранилище {len(known_uids) - len(expunged)}")
+        return messages, new_uids
+
+
+
+    def connection_pool(self,
+                        size:int=1
+                        ) -> IMAPConnectionPool:
+        #MARK: connection_pool
+        # Пул сессий текущего процесса: в воркере одна сессия обслуживает все его папки
+        return get_process_pool(self.imap_server, self.email_user, self.email_password, size=size,
+                                port=self.imap_port, use_ssl=self.imap_ssl)
+
+
+
+    def resume_uids(self,
+                    uidvalidity:int,
+                    folder_decoded:str,
+                    folder_decoded_rus:str,
+                    uids:List[int]
+                    ) -> List[int]:
+        #MARK: resume_uids
+        # Без хранилища состояния: пропускаем UID, строки которых уже записаны до контрольной точки
+        if not self.checkpoint_db.exists():
+            return uids
+        with ScanCheckpoint(self.checkpoint_db, readonly=True) as checkpoint:
+            progress = checkpoint.folder_progress(folder_decoded)
+            if progress is None or progress[0] != uidvalidity or not progress[1]:
+                return uids
+            spooled = checkpoint.spooled_uids(folder_decoded)
+        rest = [uid for uid in uids if uid not in spooled]
+        print(f"Папка {folder_decoded_rus}: продолжаем с контрольной точки, уже записано {len(uids) - len(rest)}, "
+              f"осталось {len(rest)} писем")
+        return rest
+
+
+
+    def plan_folder_state(self,
+                          uidvalidity:int,
+                          folder_decoded:str,
+                          folder_decoded_rus:str,
+                          uids:List[int]
+                          ) -> Tuple[List[Tuple[str, str, Any]], List[int]]:
+        #MARK: plan_folder_state
+        """
+        Сообщения писателю, которые отправляются до строк папки, и UID, которые осталось выгрузить.
+        С критериями поиска хранилище состояния повторяет отфильтрованный вид папки:
+        письма, которые перестали подходить под критерии, считаются удаленными.
+        """
+        messages = [(MSG_FOLDER_STARTED, folder_decoded, uidvalidity)]
+        if self.state_db:
+            with SyncStateStore(self.state_db, readonly=True) as store:
+                sync_messages, uids = self.sync_folder_state(uidvalidity, store, folder_decoded, folder_decoded_rus, uids)
+            messages += sync_messages
+        else:
+            uids = self.resume_uids(uidvalidity, folder_decoded, folder_decoded_rus, uids)
+        return messages, uids
+
+
+
+    def needs_windows(self,
+                      uids:List[int]) -> bool:
+        #MARK: needs_windows
+        # Делим папку на окна по датам, только если она достаточно большая: каждое окно - отдельный UID SEARCH
+        return bool(self.search_criteria.window_days) and len(uids) >= self.search_criteria.window_min_messages
+
+
+
+    def window_criteria(self) -> List[Tuple[str, List[str]]]:
+        #MARK: window_criteria
+        # (подпись окна, аргументы UID SEARCH) для каждого окна дат
+        return [(f"{since or '...'} - {before or '...'}", self.search_criteria.to_imap(since, before))
+                for since, before in self.search_criteria.date_windows()]
+
+
+
+    def make_folder_plan(self,
+                         folder_name:bytes,
+                         folder_decoded:str,
+                         folder_decoded_rus:str,
+                         uidvalidity:int,
+                         messages:List[Tuple[str, str, Any]],
+                         uids:List[int],
+                         windows:List[Tuple[str, List[int]]]
+                         ) -> FolderPlan:
+        #MARK: make_folder_plan
+        units = [part for unit in split_by_windows(folder_decoded, folder_decoded_rus, uidvalidity, uids, windows)
+                 for part in split_unit(unit, self.max_unit_messages)]
+        if len(units) > 1:
+            print(f"Папка {folder_decoded_rus}: {len(uids)} писем разделены на {len(units)} частей")
+        return FolderPlan(folder_name, folder_decoded, folder_decoded_rus, uidvalidity, messages, units)
+
+
+
+    def search_uids(self,
+                    mail:imaplib.IMAP4,
+                    criteria:List[str],
+                    folder_decoded_rus:str,
+                    metrics:PipelineMetrics,
+                    folder_decoded:str
+                    ) -> List[int]:
+        #MARK: search_uids
+        with metrics.stage(STAGE_SEARCH, folder_decoded) as record:
+            status, messages = mail.uid('SEARCH', None, *criteria)
+            if status != 'OK':
+                raise Exception(f"Не удалось извлечь письма из папки {folder_decoded_rus}")
+            uids = parse_uid_list(messages)
+            record.bytes = response_size(messages)
+            record.messages = len(uids)
+        return uids
+
+
+
+    def plan_folder(self,
+                    folder_name:bytes,
+                    emit:Callable[[Tuple[str, str, Any]], None]
+                    ) -> FolderPlan:
+        #MARK: plan_folder
+        """
+        Планирование папки: EXAMINE, UID SEARCH по критериям из конфига (search), сверка с хранилищем
+        или контрольными точками. Большая папка делится на окна по датам (window_days) - части выгружаются параллельно.
+        Метрики SELECT и SEARCH отправляются писателю (emit) и при ошибке.
+        """
+        folder_decoded, folder_decoded_rus = self.decode_folder_name(folder_name)
+        print(f"В работе папка {folder_decoded_rus}")
+        metrics = PipelineMetrics()
+        try:
+            with self.connection_pool().session() as mail:
+                with metrics.stage(STAGE_SELECT, folder_decoded):
+                    status, _ = mail.select(f'"{folder_decoded}"', readonly=True)
+                    if status != 'OK':
+                        raise Exception(f"Не удалось открыть папку {folder_decoded_rus}")
+                status, response = mail.response('UIDVALIDITY')
+                uidvalidity = int(response[0]) if response and response[0] else 0
+                uids = self.search_uids(mail, self.search_criteria.to_imap(), folder_decoded_rus, metrics, folder_decoded)
+                print(f"Количество писем в папке {folder_decoded_rus}: {len(uids)}"
+                      + (f" (критерии поиска: {self.search_criteria})" if self.search_criteria else ""))
+                messages, uids = self.plan_folder_state(uidvalidity, folder_decoded, folder_decoded_rus, uids)
+                windows = []
+                if self.needs_windows(uids):
+                    windows = [(label, self.search_uids(mail, criteria, folder_decoded_rus, metrics, folder_decoded))
+                               for label, criteria in self.window_criteria()]
+        finally:
+            emit((MSG_METRICS, folder_decoded, metrics.to_dict()))
+        return self.make_folder_plan(folder_name, folder_decoded, folder_decoded_rus, uidvalidity, messages, uids, windows)
+
+
+
+    def fetch_unit(self,
+                   unit:WorkUnit,
+                   emit:Callable[[Tuple[str, str, Any]], None]
+                   ) -> int:
+        #MARK: fetch_unit
+        """
+        Выгружает часть папки и отправляет строки писателю пачками.
+        Строки, выгруженные до ошибки, тоже отправляются - повтор их пропустит по контрольной точке.
+
+        :return: Количество выгруженных писем.
+        """
         emails = []
+        processed = 0
+        metrics = PipelineMetrics()
+        parse_seconds = 0.0
         try:
-            folder_decoded = folder_name.decode().split('"')[-2]
-            folder_decoded_rus = imap_utf7.decode(folder_name).split('"')[-2]
-            #if any(exclude in folder_decoded_rus for exclude in self.exclude_folders):
-            #    print(f"Папка находится среди исключений: {folder_decoded_rus}")
-            #    return
-            print(f"В работе папка {folder_decoded_rus}")
-            with imaplib.IMAP4_SSL(self.imap_server) as mail:
-                mail.login(self.email_user, self.email_password)
-                mail.select(f'"{folder_decoded}"', readonly=True)
-                status, messages = mail.search(None, 'ALL')
-                if status != 'OK':
-                    raise Exception(f"Не удалось извлечь письма из папки {folder_decoded_rus}")
-                email_ids = messages[0].split()
-                email_ids_size = len(email_ids)
-                print(f"Количество писем в папке {folder_decoded_rus}: {email_ids_size}")
-                for email_id in email_ids:
-                    status, msg_data = mail.fetch(email_id, '(RFC822)')
-                    for response_part in msg_data:
-                        if isinstance(response_part, tuple):
-                            msg = email.message_from_bytes(response_part[1])
-                            name_sender, email_address = self.parse_email_address(msg['From'])
-                            subject = self.decode_subject(msg['Subject'])
-                            size = len(response_part[1])
-                            attachments = self.extract_attachments(msg)
-                            date = msg['Date']
-                            emails.append((email_address, name_sender, subject, date, size, attachments))
-                            if len(emails) >= 100:
-                                print(f"Папка {folder_decoded_rus}: достигнута обработка 100 писем, записываем их в файл")
-                                self.append_to_excel(emails)
-                                emails.clear()
+            with self.connection_pool().session() as mail:
+                self.select_unit(mail, unit, metrics)
+                fetch_items = METADATA_FETCH_ITEMS if self.fetch_mode == "metadata" else FULL_FETCH_ITEMS
+                for uid, fields in iter_uid_fetch(mail, unit.uids, fetch_items, self.fetch_batch_size,
+                                                  metrics=metrics, folder=unit.folder):
+                    time_begin = time.perf_counter()
+                    emails.append((uid, self.build_row(fields)))
+                    parse_seconds += time.perf_counter() - time_begin
+                    processed += 1
+                    if len(emails) >= 100:
+                        emit((MSG_ROWS, unit.folder, emails))
+                        emails = []
+        finally:
             if emails:
-                print(f"Папка {folder_decoded_rus}: достигнут конец обработки папки, записываем письма в файл")
-                self.append_to_excel(emails)
+                emit((MSG_ROWS, unit.folder, emails))
+            # Сборка строк - тоже этап parse (разбор ответа FETCH записан в iter_uid_fetch)
+            metrics.add(STAGE_PARSE, parse_seconds, messages=processed, calls=0)
+            emit((MSG_METRICS, unit.folder, metrics.to_dict()))
+        return processed
+
+
+
+    def select_unit(self,
+                    mail:imaplib.IMAP4,
+                    unit:WorkUnit,
+                    metrics:PipelineMetrics):
+        #MARK: select_unit
+        # EXAMINE папки части и проверка, что UID с момента планирования не поменялись
+        with metrics.stage(STAGE_SELECT, unit.folder):
+            status, _ = mail.select(f'"{unit.folder}"', readonly=True)
+            if status != 'OK':
+                raise Exception(f"Не удалось открыть папку {unit.display}")
+        status, response = mail.response('UIDVALIDITY')
+        uidvalidity = int(response[0]) if response and response[0] else 0
+        if uidvalidity != unit.uidvalidity:
+            raise Exception(f"Папка {unit.display}: UIDVALIDITY изменился после планирования")
+
+
+
+    def fetch_unit_pipelined(self,
+                             parser:ParsePipeline,
+                             unit:WorkUnit,
+                             emit:Callable[[Tuple[str, str, Any]], None]
+                             ) -> Tuple[str, int]:
+        #MARK: fetch_unit_pipelined
+        """
+        Поток чтения движка pipeline: только UID FETCH, ответы уходят на разбор упакованными (parser),
+        следующая команда отправляется, не дожидаясь разбора. Часть завершена, когда строки всех ее пачек
+        отправлены писателю - до этого поток ждет (в том числе после ошибки: разобранное попадет в контрольную точку).
+
+        :return: (воркер, количество писем) для прогресса.
+        """
+        tracker = BatchTracker()
+        metrics = PipelineMetrics()
+        error = None
+        try:
+            with self.connection_pool().session() as mail:
+                self.select_unit(mail, unit, metrics)
+                fetch_items = METADATA_FETCH_ITEMS if self.fetch_mode == "metadata" else FULL_FETCH_ITEMS
+                for batch in chunked(unit.uids, self.fetch_batch_size):
+                    with metrics.stage(STAGE_FETCH, unit.folder) as record:
+                        status, data = mail.uid('FETCH', compress_uid_set(batch), fetch_items)
+                        if status != 'OK':
+                            raise Exception(f"Не удалось выполнить UID FETCH: {data}")
+                        record.bytes = response_size(data)
+                        record.messages = len(batch)
+                    parser.submit(tracker, unit.folder, pack_fetch_response(data))
         except Exception as e:
+            error = e
+        emit((MSG_METRICS, unit.folder, metrics.to_dict()))
+        processed, parse_error = tracker.wait()
+        if error is not None or parse_error is not None:
+            raise error or parse_error
+        return f"поток {threading.current_thread().name}", processed
+
+
+
+    def run_unit(self,
+                 unit:WorkUnit,
+                 emit:Callable[[Tuple[str, str, Any]], None]
+                 ) -> Tuple[str, int]:
+        #MARK: run_unit
+        # Часть папки в воркере ProcessPoolExecutor: (воркер, количество писем) для прогресса
+        return f"pid {os.getpid()}", self.fetch_unit(unit, emit)
+
+
+
+    def select_folders(self,
+                       folders:List[bytes]
+                       ) -> List[bytes]:
+        #MARK: select_folders
+        # Строки ответа LIST -> папки к выгрузке: без \Noselect и без папок из exclude_folders
+        selected = []
+        for folder_name in folders:
+            if not isinstance(folder_name, bytes):
+                continue
+            try:
+                folder_decoded, folder_decoded_rus = self.decode_folder_name(folder_name)
+            except Exception as e:
+                print(f"Не удалось разобрать имя папки {folder_name}: {str(e)} - пропускаем")
+                continue
+            if "\\NOSELECT" in parse_list_flags(folder_name):
+                print(f"Папка {folder_decoded_rus} не содержит писем (\\Noselect) - пропускаем")
+                continue
+            pattern = folder_excluded((folder_decoded_rus, folder_decoded), self.exclude_folders)
+            if pattern is not None:
+                print(f"Папка находится среди исключений ({pattern}): {folder_decoded_rus}")
+                continue
+            selected.append(folder_name)
+        return selected
+
+
+
+    def folder_size(self,
+                    folder_name:bytes,
+                    status:str,
+                    data:List[Any]
+                    ) -> int:
+        #MARK: folder_size
+        # Ответ STATUS (MESSAGES) -> количество писем (0, если сервер не ответил)
+        if status != 'OK':
+            print(f"Не удалось получить STATUS папки {folder_name}: {data}")
+            return 0
+        return parse_status_response(data).get("MESSAGES", 0)
+
+
+
+    def schedule_folders(self,
+                         folders:List[bytes],
+                         sizes:Dict[bytes, int]
+                         ) -> Tuple[List[bytes], ProgressTracker]:
+        #MARK: schedule_folders
+        # Большие папки планируются и выгружаются первыми, общий объем по STATUS - первая оценка для прогресса
+        folders = sorted(folders, key=lambda folder_name: sizes.get(folder_name, 0), reverse=True)
+        progress = ProgressTracker(self.progress_interval)
+        for folder_name in folders:
+            progress.set_total(folder_name, sizes.get(folder_name, 0))
+        print(f"Папок к выгрузке: {len(folders)}, писем по STATUS: {progress.total}")
+        return folders, progress
+
+
+
+    def fetch_emails_from_folder(self,
+                                folder_name:bytes,
+                                result_queue=None):
+        #MARK: fetch_emails_from_folder
+        """
+        Выгружает одну папку последовательно (планирование и все части в одной сессии).
+        Результаты не пишутся здесь, а отправляются единственному писателю:
+        в очередь result_queue или сразу в локальный ResultWriter.
+
+        :return: True, если папка выгружена полностью; False - папку нужно повторить.
+        """
+        local_writer = None
+        if result_queue is not None:
+            emit = result_queue.put
+        else:
+            local_writer = ResultWriter(self.spool, self.state_db, self.unique_senders_mode, self.checkpoint_db,
+                                        self.metrics)
+            emit = local_writer.handle
+        folder_decoded = None
+        folder_decoded_rus = folder_name
+        try:
+            folder_decoded, folder_decoded_rus = self.decode_folder_name(folder_name)
+            plan = self.plan_folder(folder_name, emit)
+            for message in plan.messages:
+                emit(message)
+            time_begin = time.monotonic()
+            processed = sum(self.fetch_unit(unit, emit) for unit in plan.units)
+            print(f"Папка {folder_decoded_rus}: достигнут конец обработки папки, записываем письма в файл")
+            emit((MSG_FOLDER_DONE, folder_decoded, folder_decoded_rus))
+            duration = max(time.monotonic() - time_begin, 1e-6)
+            print(f"Папка {folder_decoded_rus}: обработано {processed} писем за {round(duration, 3)} сек "
+                  f"({round(processed / duration, 1)} писем/сек)")
+            return True
+        except Exception as e:
+            print(f"Произошла ошибка в папке {folder_decoded_rus}: {str(e)}")
+            if folder_decoded is not None:
+                emit((MSG_FOLDER_FAILED, folder_decoded, str(e)))
+            return False
+        finally:
+            if local_writer:
+                local_writer.close()
+
+
+
+    def new_writer(self) -> ResultWriter:
+        #MARK: new_writer
+        writer = ResultWriter(self.spool, self.state_db, self.unique_senders_mode, self.checkpoint_db, self.metrics,
+                              self.duplicates_db if self.find_duplicates else None,
+                              self.attachments_db if self.analyze_attachments else None)
+        # При продолжении выгрузки в промежуточном файле уже есть строки - учитываем их в итогах
+        writer.summary.update(self.spool.iter_rows())
+        return writer
+
+
+
+    def pending_folders(self,
+                        folders:List[bytes]
+                        ) -> List[bytes]:
+        #MARK: pending_folders
+        # Папки, которые по контрольным точкам еще не выгружены полностью
+        if not self.checkpoint_db.exists():
+            return list(folders)
+        with ScanCheckpoint(self.checkpoint_db, readonly=True) as checkpoint:
+            done = set(checkpoint.folders_with_status(FOLDER_DONE))
+        pending = []
+        for folder_name in folders:
             try:
-                print(f"Произошла ошибка в папке {folder_decoded_rus}")
+                folder_decoded, folder_decoded_rus = self.decode_folder_name(folder_name)
             except Exception:
-                pass
-            print(f"Произошла ошибка: {str(e)}")
-            pass
+                pending.append(folder_name)
+                continue
+            if folder_decoded in done:
+                print(f"Папка {folder_decoded_rus} уже выгружена до остановки - пропускаем")
+            else:
+                pending.append(folder_name)
+        return pending
+
 
 
+    def retry_delay(self,
+                    attempt:int) -> float:
+        #MARK: retry_delay
+        # Экспоненциальная задержка перед повтором упавших папок: 5, 10, 20 ... сек (не больше 10 минут)
+        return min(self.retry_backoff * (2 ** (attempt - 1)), 600.0)
 
-    def fetch_emails(self):
+
+
+    def fetch_emails(self) -> SummaryAggregator:
         #MARK: fetch_emails
-        with imaplib.IMAP4_SSL(self.imap_server) as mail:
-            mail.login(self.email_user, self.email_password)
-            status, folders = mail.list()
-            if status != 'OK':
-                raise Exception("Failed to retrieve folders")
+        # Возвращает итоги для листов By Email / By Domain, посчитанные писателем по ходу выгрузки
+        if self.engine == "async":
+            return self.fetch_emails_async()
+        if self.engine == "pipeline":
+            return self.fetch_emails_pipeline()
+        folders, sizes = self.list_folders()
+        # Сессия родителя больше не нужна: одновременно к серверу подключены только воркеры
+        close_process_pool()
+        folders, progress = self.schedule_folders(folders, sizes)
+        # Воркеры только выгружают письма и отправляют пачки строк в очередь, пишет один поток-писатель
+        writer = self.new_writer()
+        with ResultPipeline(writer, queue_size=self.result_queue_size) as pipeline:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_connections) as executor:
+                self.fetch_rounds(executor, pipeline, folders, progress)
+        progress.report(force=True)
+        print(f"Писатель результатов: папок зафиксировано {writer.folders_done}, строк записано {writer.rows_written}")
+        return writer.summary
+
+
+
+    def fetch_emails_pipeline(self) -> SummaryAggregator:
+        #MARK: fetch_emails_pipeline
+        """
+        Движок pipeline: три стадии работают одновременно.
+        max_connections потоков чтения (планирование папок и UID FETCH частей) -> ограниченная очередь ответов
+        (fetch_queue_size) -> пул из parse_workers процессов разбора (пачки ответов до parse_batch_bytes)
+        -> очередь результатов (result_queue_size) -> писатель. Заполненность очередей печатается с прогрессом.
+        """
+        folders, sizes = self.list_folders()
+        close_process_pool()
+        # Один пул сессий на все потоки чтения этого процесса
+        self.connection_pool(size=self.max_connections)
+        folders, progress = self.schedule_folders(folders, sizes)
+        writer = self.new_writer()
+        try:
+            with ResultPipeline(writer, queue_size=self.result_queue_size, processes=False) as pipeline, \
+                    ParsePipeline(self.build_rows_from_buffers, pipeline.queue.put, workers=self.parse_workers,
+                                  queue_size=self.fetch_queue_size, batch_bytes=self.parse_batch_bytes) as parser, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=self.max_connections,
+                                                          thread_name_prefix="imap") as executor:
+                progress.queue_depths = lambda: dict(parser.depths(),
+                                                     запись=(pipeline.queue.qsize(), pipeline.queue_size))
+                self.fetch_rounds(executor, pipeline, folders, progress, partial(self.fetch_unit_pipelined, parser))
+        finally:
+            close_process_pool()
+        progress.queue_depths = None
+        progress.report(force=True)
+        print(f"Писатель результатов: папок зафиксировано {writer.folders_done}, строк записано {writer.rows_written}")
+        return writer.summary
+
+
+
+    def fetch_rounds(self,
+                     executor:concurrent.futures.Executor,
+                     pipeline:ResultPipeline,
+                     folders:List[bytes],
+                     progress:ProgressTracker,
+                     run_unit:Optional[Callable[[WorkUnit, Callable], Tuple[str, int]]]=None):
+        #MARK: fetch_rounds
+        # Проходы по папкам: первый и повторы упавших папок с нарастающей задержкой
+        for attempt in range(self.folder_retries + 1):
+            if attempt:
+                # Повтор продолжит папку с контрольной точки - ждем, пока писатель ее запишет
+                pipeline.wait_idle()
+                delay = self.retry_delay(attempt)
+                print(f"Повторяем папки с ошибками ({len(folders)}), попытка {attempt}/{self.folder_retries} "
+                      f"через {delay} сек")
+                time.sleep(delay)
+            folders = self.fetch_round(executor, pipeline.queue.put, folders, progress, run_unit)
+            if not folders:
+                break
+
+
+
+    def list_folders(self) -> Tuple[List[bytes], Dict[bytes, int]]:
+        #MARK: list_folders
+        # LIST и STATUS (MESSAGES): папки к выгрузке и их размеры
+        with self.connection_pool().session() as mail:
+            with self.metrics.stage(STAGE_LIST) as record:
+                status, folders = mail.list()
+                if status != 'OK':
+                    raise Exception("Failed to retrieve folders")
+                record.bytes = response_size(folders)
             print("Получили список папок на обработку")
-            # folders = [folder_name.decode().split('"')[-2] for folder_name in folders]
-            with concurrent.futures.ProcessPoolExecutor() as executor:
-                all_emails = executor.map(self.fetch_emails_from_folder, folders)
+            folders = self.pending_folders(self.select_folders(folders))
+            sizes = {}
+            for folder_name in folders:
+                folder_decoded = self.decode_folder_name(folder_name)[0]
+                with self.metrics.stage(STAGE_STATUS, folder_decoded) as record:
+                    status, data = mail.status(f'"{folder_decoded}"', '(MESSAGES)')
+                    record.bytes = response_size(data)
+                    record.errors = int(status != 'OK')
+                sizes[folder_name] = self.folder_size(folder_name, status, data)
+        return folders, sizes
 
 
 
+    def fetch_round(self,
+                    executor:concurrent.futures.Executor,
+                    emit:Callable[[Tuple[str, str, Any]], None],
+                    folders:List[bytes],
+                    progress:ProgressTracker,
+                    run_unit:Optional[Callable[[WorkUnit, Callable], Tuple[str, int]]]=None
+                    ) -> List[bytes]:
+        #MARK: fetch_round
+        """
+        Один проход по папкам: папки планируются воркерами (большие первыми), затем их части выгружаются параллельно.
+        Готовые к выгрузке части ждут в UnitQueue и отдаются воркерам по одной, начиная с самой большой.
+        Начало папки отправляется писателю до постановки ее частей в работу,
+        итог (DONE / FAILED) - после завершения всех частей.
 
+        run_unit - выгрузка части (по умолчанию run_unit в воркере ProcessPoolExecutor).
 
-    def append_to_excel(self,
-                        emails):
-        #MARK: append_to_excel
-        lock_file = f"{self.output_excel_file}.lock"
-        with open(lock_file, 'w') as lock:
+        :return: Папки, которые нужно повторить.
+        """
+        run_unit = run_unit or self.run_unit
+        pending = {executor.submit(self.plan_folder, folder_name, emit): (folder_name, None) for folder_name in folders}
+        units = UnitQueue()
+        # Папка -> [план, осталось частей, выгружено писем, время начала, ошибка]
+        folder_states = {}
+        names = {}
+        failed = []
+
+        def finish_folder(folder_name:bytes):
+            plan, _, processed, time_begin, error = folder_states.pop(folder_name)
+            if error is not None:
+                emit((MSG_FOLDER_FAILED, plan.folder, error))
+                failed.append(folder_name)
+                return
+            emit((MSG_FOLDER_DONE, plan.folder, plan.display))
+            duration = max(time.monotonic() - time_begin, 1e-6)
+            print(f"Папка {plan.display}: обработано {processed} писем за {round(duration, 3)} сек "
+                  f"({round(processed / duration, 1)} писем/сек)")
+
+        def submit_units():
+            # В работе не больше частей, чем воркеров: остальные ждут в очереди по размеру
+            running = sum(1 for _, unit in pending.values() if unit is not None)
+            while units and running < self.max_connections:
+                unit = units.pop()
+                pending[executor.submit(run_unit, unit, emit)] = (names[unit.folder], unit)
+                running += 1
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                folder_name, unit = pending.pop(future)
+                if unit is None:
+                    try:
+                        plan = future.result()
+                    except Exception as e:
+                        print(f"Произошла ошибка в папке {folder_name}: {str(e)}")
+                        emit((MSG_FOLDER_FAILED, self.decode_folder_name(folder_name)[0], str(e)))
+                        failed.append(folder_name)
+                        continue
+                    for message in plan.messages:
+                        emit(message)
+                    names[plan.folder] = folder_name
+                    progress.set_total(folder_name, sum(len(unit.uids) for unit in plan.units))
+                    folder_states[folder_name] = [plan, len(plan.units), 0, time.monotonic(), None]
+                    for unit in plan.units:
+                        units.push(unit)
+                    if not plan.units:
+                        finish_folder(folder_name)
+                    continue
+                state = folder_states[folder_name]
+                state[1] -= 1
+                try:
+                    worker, processed = future.result()
+                    state[2] += processed
+                    progress.unit_done(worker, folder_name, processed)
+                except Exception as e:
+                    print(f"Произошла ошибка в папке {unit.display} ({unit.label or 'вся папка'}): {str(e)}")
+                    state[4] = str(e)
+                if not state[1]:
+                    finish_folder(folder_name)
+            submit_units()
+            progress.report()
+        return failed
+
+
+
+    def fetch_emails_async(self) -> SummaryAggregator:
+        #MARK: fetch_emails_async
+        """
+        Асинхронный движок выгрузки: max_connections сессий в одном процессе, в каждой сессии
+        до async_pipeline_depth команд UID FETCH отправляются не дожидаясь ответов.
+        Разбор ответов выполняется в небольшом пуле процессов (parse_workers), запись - одним писателем.
+        """
+        import asyncio
+
+        writer = self.new_writer()
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.parse_workers) as parse_executor, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=1) as write_executor:
+                asyncio.run(self._fetch_emails_async(writer, parse_executor, write_executor))
+        finally:
+            writer.close()
+        print(f"Писатель результатов: папок зафиксировано {writer.folders_done}, строк записано {writer.rows_written}")
+        return writer.summary
+
+
+
+    async def _open_async_client(self) -> "AsyncIMAPClient":
+        #MARK: _open_async_client
+        from libraries.async_imap import AsyncIMAPClient
+
+        client = AsyncIMAPClient(self.imap_server, self.imap_port, use_ssl=self.imap_ssl)
+        await client.connect()
+        await client.login(self.email_user, self.email_password)
+        return client
+
+
+
+    async def _fetch_emails_async(self,
+                                  writer:ResultWriter,
+                                  parse_executor:concurrent.futures.Executor,
+                                  write_executor:concurrent.futures.Executor):
+        #MARK: _fetch_emails_async
+        import asyncio
+        from libraries.async_imap import AsyncIMAPError
+
+        loop = asyncio.get_running_loop()
+        # Ограниченная очередь результатов: при медленной записи выгрузка ждет (backpressure)
+        result_queue = asyncio.Queue(maxsize=self.result_queue_size)
+
+        async def write_results():
+            while True:
+                message = await result_queue.get()
+                try:
+                    if message is None:
+                        return
+                    # Один поток записи - один писатель, порядок сообщений сохраняется
+                    await loop.run_in_executor(write_executor, writer.handle, message)
+                finally:
+                    result_queue.task_done()
+
+        writer_task = asyncio.ensure_future(write_results())
+
+        client = await self._open_async_client()
+        with self.metrics.stage(STAGE_LIST) as record:
+            folders = await client.list_folders()
+            record.bytes = response_size(folders)
+        folders = self.pending_folders(self.select_folders(folders))
+        print("Получили список папок на обработку")
+        sizes = {}
+        for folder_name in folders:
+            folder_decoded = self.decode_folder_name(folder_name)[0]
+            with self.metrics.stage(STAGE_STATUS, folder_decoded) as record:
+                try:
+                    data = await client.status(folder_decoded)
+                    record.bytes = response_size(data)
+                    sizes[folder_name] = self.folder_size(folder_name, "OK", data)
+                except AsyncIMAPError as e:
+                    record.errors = 1
+                    sizes[folder_name] = self.folder_size(folder_name, "NO", str(e))
+        await client.logout()
+        folders, progress = self.schedule_folders(folders, sizes)
+
+        for attempt in range(self.folder_retries + 1):
+            if attempt:
+                # Повтор продолжит папку с контрольной точки - ждем, пока писатель ее запишет
+                await result_queue.join()
+                delay = self.retry_delay(attempt)
+                print(f"Повторяем папки с ошибками ({len(folders)}), попытка {attempt}/{self.folder_retries} "
+                      f"через {delay} сек")
+                await asyncio.sleep(delay)
+            folders = await self._fetch_round_async(folders, result_queue, parse_executor, progress)
+            if not folders:
+                break
+        progress.report(force=True)
+        await result_queue.put(None)
+        await writer_task
+
+
+
+    async def _fetch_round_async(self,
+                                 folders:List[bytes],
+                                 result_queue:"asyncio.Queue",
+                                 parse_executor:concurrent.futures.Executor,
+                                 progress:ProgressTracker
+                                 ) -> List[bytes]:
+        #MARK: _fetch_round_async
+        """
+        Один проход по папкам в асинхронном движке: общая очередь заданий (планирование папки или часть папки),
+        которую разбирают max_connections сессий. Планирование ставит части папки в ту же очередь.
+        Очередь с приоритетом: сначала планирование (большие папки первыми), затем части - от самой большой.
+
+        :return: Папки, которые нужно повторить.
+        """
+        import asyncio
+
+        jobs = asyncio.PriorityQueue()
+        order = itertools.count()
+        for index, folder_name in enumerate(folders):
+            jobs.put_nowait(((0, index), next(order), folder_name, None))
+        # Папка -> [план, осталось частей, выгружено писем, время начала, ошибка]
+        folder_states = {}
+        failed = []
+
+        async def finish_folder(folder_name:bytes):
+            plan, _, processed, time_begin, error = folder_states.pop(folder_name)
+            if error is not None:
+                await result_queue.put((MSG_FOLDER_FAILED, plan.folder, error))
+                failed.append(folder_name)
+                return
+            await result_queue.put((MSG_FOLDER_DONE, plan.folder, plan.display))
+            duration = max(time.monotonic() - time_begin, 1e-6)
+            print(f"Папка {plan.display}: обработано {processed} писем за {round(duration, 3)} сек "
+                  f"({round(processed / duration, 1)} писем/сек)")
+
+        async def run_job(client:"AsyncIMAPClient",
+                          worker_name:str,
+                          folder_name:bytes,
+                          unit:Optional[WorkUnit]):
+            if unit is None:
+                plan = await self._plan_folder_async(client, folder_name, result_queue)
+                for message in plan.messages:
+                    await result_queue.put(message)
+                progress.set_total(folder_name, sum(len(unit.uids) for unit in plan.units))
+                folder_states[folder_name] = [plan, len(plan.units), 0, time.monotonic(), None]
+                for unit in plan.units:
+                    jobs.put_nowait(((1, -len(unit.uids)), next(order), folder_name, unit))
+                if not plan.units:
+                    await finish_folder(folder_name)
+                return
+            state = folder_states[folder_name]
             try:
-                wb = openpyxl.load_workbook(self.output_excel_file)
-            except FileNotFoundError:
-                wb = openpyxl.Workbook()
+                processed = await self._fetch_unit_async(client, unit, result_queue, parse_executor)
+                state[2] += processed
+                progress.unit_done(worker_name, folder_name, processed)
+                progress.report()
+            except Exception as e:
+                state[4] = str(e)
+                raise
+            finally:
+                state[1] -= 1
+                if not state[1]:
+                    await finish_folder(folder_name)
 
-            headers = ["Email", "Name_Address", "Subject", "Date", "Size (bytes)", "Attachments"]
-            ws = wb.active
-            if ws.title != "Raw Data":
-                ws = wb.create_sheet("Raw Data")
+        async def worker(worker_name:str):
+            client = None
+            try:
+                while True:
+                    _, _, folder_name, unit = await jobs.get()
+                    try:
+                        if client is None:
+                            client = await self._open_async_client()
+                        await run_job(client, worker_name, folder_name, unit)
+                    except Exception as e:
+                        where = f"{unit.display} ({unit.label or 'вся папка'})" if unit else folder_name
+                        print(f"Произошла ошибка в папке {where}: {str(e)}")
+                        if unit is None and folder_name not in folder_states:
+                            try:
+                                await result_queue.put((MSG_FOLDER_FAILED, self.decode_folder_name(folder_name)[0], str(e)))
+                            except Exception:
+                                pass
+                            failed.append(folder_name)
+                        # После ошибки сессию не переиспользуем
+                        if client is not None:
+                            await client.logout()
+                            client = None
+                    finally:
+                        jobs.task_done()
+            finally:
+                if client is not None:
+                    await client.logout()
+
+        # Сессия открывается при первом задании, поэтому лишние воркеры не подключаются к серверу
+        workers = [asyncio.ensure_future(worker(f"сессия {index + 1}")) for index in range(self.max_connections)]
+        try:
+            await jobs.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return failed
 
-            for content in emails:
-                ws.append(list(content))
-            wb.save(self.output_excel_file)
-        os.remove(lock_file)
+
+
+    async def _plan_folder_async(self,
+                                 client:"AsyncIMAPClient",
+                                 folder_name:bytes,
+                                 result_queue:"asyncio.Queue"
+                                 ) -> FolderPlan:
+        #MARK: _plan_folder_async
+        # То же, что plan_folder, в асинхронной сессии
+        folder_decoded, folder_decoded_rus = self.decode_folder_name(folder_name)
+        print(f"В работе папка {folder_decoded_rus}")
+        metrics = PipelineMetrics()
+
+        async def search(criteria:List[str]) -> List[int]:
+            with metrics.stage(STAGE_SEARCH, folder_decoded) as record:
+                response = await client.uid_search(*criteria)
+                uids = parse_uid_list(response)
+                record.bytes = response_size(response)
+                record.messages = len(uids)
+            return uids
+
+        try:
+            with metrics.stage(STAGE_SELECT, folder_decoded):
+                untagged = await client.examine(folder_decoded)
+            uidvalidity = int((untagged.get("UIDVALIDITY") or [b"0"])[0] or 0)
+            uids = await search(self.search_criteria.to_imap())
+            print(f"Количество писем в папке {folder_decoded_rus}: {len(uids)}"
+                  + (f" (критерии поиска: {self.search_criteria})" if self.search_criteria else ""))
+            messages, uids = self.plan_folder_state(uidvalidity, folder_decoded, folder_decoded_rus, uids)
+            windows = []
+            if self.needs_windows(uids):
+                for label, criteria in self.window_criteria():
+                    windows.append((label, await search(criteria)))
+        finally:
+            await result_queue.put((MSG_METRICS, folder_decoded, metrics.to_dict()))
+        return self.make_folder_plan(folder_name, folder_decoded, folder_decoded_rus, uidvalidity, messages, uids, windows)
+
+
+
+    async def _fetch_unit_async(self,
+                                client:"AsyncIMAPClient",
+                                unit:WorkUnit,
+                                result_queue:"asyncio.Queue",
+                                parse_executor:concurrent.futures.Executor
+                                ) -> int:
+        #MARK: _fetch_unit_async
+        # Конвейерная выгрузка части папки: до async_pipeline_depth команд UID FETCH в полете
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        in_flight = deque()
+        metrics = PipelineMetrics()
+        try:
+            with metrics.stage(STAGE_SELECT, unit.folder):
+                untagged = await client.examine(unit.folder)
+            uidvalidity = int((untagged.get("UIDVALIDITY") or [b"0"])[0] or 0)
+            if uidvalidity != unit.uidvalidity:
+                raise Exception(f"Папка {unit.display}: UIDVALIDITY изменился после планирования")
+            fetch_items = METADATA_FETCH_ITEMS if self.fetch_mode == "metadata" else FULL_FETCH_ITEMS
+            processed = 0
+
+            async def drain_one():
+                # fetch - ожидание ответа, который еще не пришел (остальное время команды перекрыто конвейером)
+                with metrics.stage(STAGE_FETCH, unit.folder) as record:
+                    status, untagged, text = await asyncio.wait_for(in_flight.popleft(), client.timeout)
+                    if status != "OK":
+                        raise Exception(f"Не удалось выполнить UID FETCH: {text}")
+                    response = untagged.get("FETCH", [])
+                    record.bytes = response_size(response)
+                with metrics.stage(STAGE_PARSE, unit.folder) as record:
+                    rows = await loop.run_in_executor(parse_executor, self.build_rows_from_response, response)
+                    record.messages = len(rows)
+                metrics.add(STAGE_FETCH, messages=len(rows), folder=unit.folder, calls=0)
+                await result_queue.put((MSG_ROWS, unit.folder, rows))
+                return len(rows)
+
+            for batch in chunked(unit.uids, self.fetch_batch_size):
+                in_flight.append(client.uid_fetch(compress_uid_set(batch), fetch_items))
+                await client.writer.drain()
+                if len(in_flight) >= self.async_pipeline_depth:
+                    processed += await drain_one()
+            while in_flight:
+                processed += await drain_one()
+            return processed
+        except Exception:
+            # Ответы на оставшиеся конвейерные FETCH больше не нужны
+            for future in in_flight:
+                if future.done():
+                    future.exception()
+                else:
+                    future.cancel()
+            raise
+        finally:
+            await result_queue.put((MSG_METRICS, unit.folder, metrics.to_dict()))
+
+
+
+    def append_to_excel(self,
+                        emails):
+        #MARK: append_to_excel
+        # Строки дописываются в промежуточный файл, сам Excel собирается один раз в create_excel
+        self.spool.append(emails)
 
 
 
     def group_by_email(self,
-                       emails
-                       ) -> Dict[str, int]:
+                       emails:Union[RowStore, Iterable[Tuple[Any, ...]]]
+                       ) -> Dict[str, Any]:
         #MARK: group_by_email
-        email_summary = defaultdict(lambda: {'count': 0, 'size': 0})
-        for email, _, size in emails:
-            email_summary[email]['count'] += 1
-            email_summary[email]['size'] += size
-        return email_summary
+        # emails - RowStore, строки Raw Data или тройки (email, name, size); итоги - редукцией по номерам адресов
+        store = emails if isinstance(emails, RowStore) else RowStore.from_rows(emails)
+        return {email: {'count': count, 'size': size} for email, count, size in store.group_by_email()}
 
 
     def group_by_domain(self,
-                        emails
+                        emails:Union[RowStore, Iterable[Tuple[Any, ...]]]
                         ) -> Dict[str, Any]:
         #MARK: group_by_domain
-        domain_summary = defaultdict(lambda: {'count': 0, 'unique_emails': set(), 'size': 0})
-        for email, _, size in emails:
-            domain = '.'.join(email.split('@')[-1].split('.')[-2:])
-            domain_summary[domain]['count'] += 1
-            domain_summary[domain]['unique_emails'].add(email)
-            domain_summary[domain]['size'] += size
-        return domain_summary
+        # unique_emails - множество адресов домена, как раньше; итоги считаются редукцией по номерам адресов
+        store = emails if isinstance(emails, RowStore) else RowStore.from_rows(emails)
+        addresses = store.domain_emails()
+        return {domain: {'count': count, 'unique_emails': addresses[domain], 'size': size}
+                for domain, count, _, size in store.group_by_domain()}
 
 
 
-    def create_excel(self,
-                    emails
-                    ):
-        #MARK: create_excel
-        wb = openpyxl.Workbook()
+    def write_output(self,
+                     emails:Iterable[Tuple[Any, ...]],
+                     summary:Optional[SummaryAggregator]=None,
+                     duplicates:Optional[Callable[[], Iterator[Tuple[Any, ...]]]]=None,
+                     attachments:Optional[Callable[[], Iterator[Tuple[Any, ...]]]]=None,
+                     attachment_summary:Optional[Callable[[], Iterator[Tuple[Any, ...]]]]=None
+                     ):
+        #MARK: write_output
+        """
+        Собирает выходной файл в формате output_format (Excel, Parquet или SQLite): строки пишутся потоком.
 
-        ws1 = wb.active
-        ws1.title = "By Email"
-        #ws1.append(["Email", "Count", "Total Size (bytes)"])
-        #for email, data in self.group_by_email(emails).items():
-        #    ws1.append([email, data['count'], data['size']])
+        :param emails: Итерируемый источник строк Raw Data (или функция без аргументов, возвращающая итератор).
+        :param summary: Итоги By Email / By Domain, посчитанные во время выгрузки.
+            Если не переданы, считаются отдельным проходом по emails - тогда источник читается дважды.
+        :param duplicates: Функция, возвращающая группы копий (DuplicateIndex.groups) для листа Duplicates.
+        :param attachments: Функция, возвращающая вложения (AttachmentIndex.records) для листа Attachments.
+        :param attachment_summary: Функция, возвращающая итоги по вложениям (AttachmentIndex.groups)
+            для листа Attachment Summary.
+        """
+        rows = emails if callable(emails) else (lambda: iter(emails))
+        if summary is None and isinstance(emails, RowStore):
+            summary = emails.summary()
+        if summary is None:
+            summary = SummaryAggregator(self.unique_senders_mode)
+            summary.update(rows())
+        self.output.write(rows, summary, duplicates, attachments, attachment_summary)
 
-        ws2 = wb.create_sheet("By Domain")
-        ws2.append(["Domain", "Count", "Unique Emails", "Total Size (bytes)"])
-        #for domain, data in self.group_by_domain(emails).items():
-        #    ws2.append([domain, data['count'], len(data['unique_emails']), data['size']])
 
-        ws3 = wb.create_sheet("Raw Data")
-        ws3.append(["folder_name", "email_address", "name_address", "subject", "size"])
-        for folder_name, email_address, name_address, subject, size in emails:
-            ws3.append([folder_name, email_address, name_address, subject, size])
 
-        wb.save(self.output_excel_file)
+    def create_excel(self,
+                    emails:Iterable[Tuple[Any, ...]],
+                    summary:Optional[SummaryAggregator]=None
+                    ):
+        #MARK: create_excel
+        # Прежнее имя write_output: файл собирается в формате output_format
+        self.write_output(emails, summary)
 
 
 
     def load_emails_from_excel(self,
                                 path_to_excel:str
-                                ) -> Tuple[List[Any], List[Tuple[Any]]]:
+                                ) -> Tuple[List[str], Iterator[RawDataRecord]]:
         #MARK: load_emails_from_excel
-        wb = openpyxl.load_workbook(path_to_excel)
-        ws = wb["Raw Data"]
+        # Заголовки Raw Data и генератор записей: файл (Excel, Parquet или SQLite) читается потоком, а не в список
+        return RAW_DATA_HEADERS, get_output_backend(path_to_excel, path_to_cache=self.input_excel_cache).iter_records()
 
-        # Извлекаем заголовки из первой строки
-        headers = [cell.value for cell in next(ws.iter_rows(min_row=1, max_row=1))]
 
-        # Извлекаем значения из остальных строк
-        data = [tuple(cell.value for cell in row) for row in ws.iter_rows(min_row=2)]
-        return headers, data
 
+    def delete_emails(self,
+                      path_to_excel:Union[str, Path]):
+        #MARK: delete_emails
+        """
+        Фаза удаления: правила из входного Excel сопоставляются с письмами из хранилища состояния
+        (UID прошлой выгрузки), совпадения удаляются пачками по диапазонам UID, папки - параллельно.
+        В режиме delete_dry_run на сервере ничего не меняется, формируется только отчет.
+        """
+        if not self.state_db or not self.state_db.exists():
+            print("Для удаления нужна локальная база state_db с результатами прошлой выгрузки - удаление пропущено")
+            return
+        rules = DeletionRules.from_file(path_to_excel, self.input_excel_cache)
+        print(f"Загружено правил удаления: {len(rules)}")
+        if rules.duplicates:
+            print(f"Групп копий к удалению (лист Duplicates): {len(rules.duplicates)}, в каждой остается одна копия")
+        if rules.index.domains.skipped:
+            print(f"Пропущены правила-домены, которые являются публичными суффиксами: "
+                  f"{', '.join(rules.index.domains.skipped)}")
+        with SyncStateStore(self.state_db) as store:
+            plan = plan_deletion(store, rules)
+            uidvalidity = {folder: (store.get_folder_state(folder) or (0, 0))[0] for folder in plan}
+        path_to_report = self.output_excel_file.with_name(f"{self.output_excel_file.stem}_deletion_report.csv")
+        write_deletion_report(path_to_report, plan)
+        for folder, matches in plan.items():
+            print(f"Папка {imap_utf7.decode(folder.encode())}: к удалению {len(matches)} писем, "
+                  f"{sum(row[4] or 0 for _, row, _ in matches)} байт")
+        print(f"Отчет об удалении: {path_to_report}")
+        if self.delete_dry_run:
+            print("Режим delete_dry_run: письма на сервере не удаляются")
+            return
 
+        pool = IMAPConnectionPool(self.imap_server, self.email_user, self.email_password, size=self.max_connections,
+                                  port=self.imap_port, use_ssl=self.imap_ssl)
 
-    def run(self):
-        #MARK: run
-        if self.input_excel_file:
-            if self.input_excel_file.exists():
-                print(f"Обнаружен входной файл Excel: {self.input_excel_file}")
-                headers_excel, data_excel = self.load_emails_from_excel(path_to_excel=self.input_excel_file)
-                print(f"Loaded {len(data_excel)} emails from {self.output_excel_file}")
-            else:
-                print(f"Обнаружен параметр входящего Excel, однако этот файл не существует: {self.input_excel_file}")
+        def delete_folder(folder:str) -> Tuple[List[int], Optional[str]]:
+            with pool.session() as mail:
+                return delete_uids_in_folder(mail, folder, uidvalidity[folder],
+                                             [uid for uid, _, _ in plan[folder]],
+                                             delete_mode=self.delete_mode, trash_folder=self.trash_folder)
+
+        results = {}
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+                futures = {executor.submit(delete_folder, folder): folder for folder in plan}
+                with SyncStateStore(self.state_db) as store:
+                    for future in concurrent.futures.as_completed(futures):
+                        folder = futures[future]
+                        try:
+                            deleted, error = future.result()
+                        except Exception as e:
+                            deleted, error = [], str(e)
+                        results[folder] = (deleted, error)
+                        # Удаленные письма убираем и из хранилища (пишет только этот поток) - даже если папка
+                        # упала на середине: пачки до ошибки на сервере уже удалены
+                        store.delete_uids(folder, deleted)
+                        print(f"Папка {imap_utf7.decode(folder.encode())}: удалено {len(deleted)} писем")
+                        if error:
+                            print(f"Произошла ошибка при удалении в папке {folder}: {error}")
+        finally:
+            pool.close_all()
+            # В отчете - что удалено на самом деле
+            write_deletion_report(path_to_report, plan, results)
+
+
+
+    def export_metrics(self):
+        #MARK: export_metrics
+        # Итоги этапов - в лог и в файлы; ошибка записи метрик не должна ронять выгрузку
+        self.metrics.log_summary()
+        try:
+            self.metrics.write_json(self.metrics_json)
+            print(f"Метрики выгрузки: {self.metrics_json}")
+            if self.metrics_prometheus:
+                self.metrics.write_prometheus(self.metrics_prometheus)
+                print(f"Метрики Prometheus: {self.metrics_prometheus}")
+        except OSError as e:
+            print(f"Не удалось записать метрики: {str(e)}")
+
+
+
+    def build_output(self,
+                     rows:Callable[[], Iterator[Tuple[Any, ...]]],
+                     summary:SummaryAggregator):
+        #MARK: build_output
+        # Выходной файл с листом Duplicates по индексу копий (если find_duplicates)
+        # и листами вложений по индексу вложений (если analyze_attachments)
+        duplicates = DuplicateIndex(self.duplicates_db) if self.find_duplicates else None
+        attachments = AttachmentIndex(self.attachments_db) if self.analyze_attachments else None
+        try:
+            with self.metrics.stage(STAGE_OUTPUT) as record:
+                self.write_output(rows, summary=summary,
+                                  duplicates=duplicates.groups if duplicates else None,
+                                  attachments=attachments.records if attachments else None,
+                                  attachment_summary=attachments.groups if attachments else None)
+                record.messages = summary.rows
+                record.bytes = self.output.size()
+            if duplicates:
+                groups, copies, reclaimable = duplicates.summary()
+                print(f"Копии писем: групп {groups}, лишних копий {copies}, "
+                      f"можно освободить {reclaimable / 1024.0 / 1024.0:.1f} МБ (лист Duplicates)")
+            if attachments:
+                count, size, top = attachments.summary()
+                print(f"Вложения: {count} файлов, {size / 1024.0 / 1024.0:.1f} МБ"
+                      + ("; больше всего места занимают "
+                         + ", ".join(f"{extension or 'без расширения'} - {total / 1024.0 / 1024.0:.1f} МБ"
+                                     for extension, total in top) if top else "")
+                      + " (листы Attachments, Attachment Summary)")
+        finally:
+            if duplicates:
+                duplicates.close()
+            if attachments:
+                attachments.close()
+
+
+
+    def scan(self,
+             resume:bool=False):
+        #MARK: scan
+        """
+        Выгрузка информации о письмах с сервера и сборка выходного файла.
+
+        :param resume: Продолжить прерванную выгрузку по контрольным точкам: полностью выгруженные папки
+            пропускаются, остальные продолжаются с последнего записанного UID.
+        """
         print(f"Начинаем выгружать информацию из email. Выходной файл: {self.output_excel_file}")
-        self.fetch_emails()
+        if resume and self.checkpoint_db.exists():
+            with ScanCheckpoint(self.checkpoint_db) as checkpoint:
+                # Строки после последней контрольной точки могли записаться не полностью
+                self.spool.truncate(checkpoint.spool_size())
+                print(f"Продолжаем прерванную выгрузку: папок уже выгружено "
+                      f"{len(checkpoint.folders_with_status(FOLDER_DONE))}")
+        else:
+            if resume:
+                print("Контрольных точек прошлой выгрузки нет - начинаем с начала")
+            self.spool.reset()
+            remove_checkpoint(self.checkpoint_db)
+            remove_checkpoint(self.duplicates_db)
+            remove_checkpoint(self.attachments_db)
+        self.metrics = PipelineMetrics()
+        summary = self.fetch_emails()
+        print(f"Выгрузка завершена, формируем выходной файл ({self.output.format}): {self.output_excel_file}")
+        self.build_output(self.spool.iter_rows, summary)
+        self.export_metrics()
+        with ScanCheckpoint(self.checkpoint_db, readonly=True) as checkpoint:
+            failed = checkpoint.folders_with_status(FOLDER_FAILED)
+        if failed:
+            # Промежуточный файл и контрольные точки оставляем для запуска с --resume
+            print(f"Не удалось выгрузить папки: {', '.join(failed)}. Чтобы догрузить их, запустите с --resume")
+            return
+        self.spool.remove()
+        remove_checkpoint(self.checkpoint_db)
+        remove_checkpoint(self.duplicates_db)
+        remove_checkpoint(self.attachments_db)
+
+
+
+    def report(self):
+        #MARK: report
+        """
+        Сборка выходного файла по локальной базе state_db без подключения к серверу:
+        например, в другом формате (output_format) или после удаления писем.
+        Индексы копий и вложений строятся заново по письмам из базы.
+        """
+        if not self.state_db or not self.state_db.exists():
+            print("Для отчета без подключения к серверу нужна локальная база state_db с результатами выгрузки")
+            return
+        print(f"Формируем выходной файл ({self.output.format}) по базе {self.state_db}: {self.output_excel_file}")
+        self.metrics = PipelineMetrics()
+        remove_checkpoint(self.duplicates_db)
+        remove_checkpoint(self.attachments_db)
+        with SyncStateStore(self.state_db, readonly=True) as store:
+            indexes = []
+            if self.find_duplicates:
+                indexes.append(DuplicateIndex(self.duplicates_db))
+            if self.analyze_attachments:
+                indexes.append(AttachmentIndex(self.attachments_db))
+            try:
+                for folder, messages in itertools.groupby(store.iter_messages(), key=lambda message: message[0]):
+                    uidvalidity = (store.get_folder_state(folder) or (0, 0))[0]
+                    for index in indexes:
+                        index.start_folder(folder, uidvalidity)
+                    while True:
+                        chunk = [(message[1], message[2:]) for message in itertools.islice(messages, 1000)]
+                        if not chunk:
+                            break
+                        for index in indexes:
+                            index.add(folder, chunk)
+            finally:
+                for index in indexes:
+                    index.close()
+            if self.unique_senders_mode == UNIQUE_EXACT:
+                # База читается один раз: строки в колоночном RowStore, итоги - его редукциями
+                rows = RowStore.from_rows(store.iter_rows())
+                self.build_output(lambda: iter(rows), rows.summary())
+            else:
+                summary = SummaryAggregator(self.unique_senders_mode)
+                summary.update(store.iter_rows())
+                self.build_output(store.iter_rows, summary)
+        self.export_metrics()
+        remove_checkpoint(self.duplicates_db)
+        remove_checkpoint(self.attachments_db)
+
+
+
+    def run(self,
+            resume:bool=False):
+        #MARK: run
+        """
+        Запуск без подкоманды: только выгрузка. Удаление меняет ящик безвозвратно, поэтому само по себе
+        не запускается, даже если задан input_excel - для него есть delete_emails (python main.py delete).
+
+        :param resume: См. scan.
+        """
+        if self.input_excel_file and self.input_excel_file.exists():
+            print(f"Обнаружен входной файл {self.input_excel_file}: удаление по нему запускается только командой "
+                  f"python main.py delete")
+        self.scan(resume=resume)
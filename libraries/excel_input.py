@@ -0,0 +1,153 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from libraries.report_writer import RAW_DATA_HEADERS
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterator, NamedTuple
+
+# Без этих колонок лист Raw Data нельзя сопоставить с письмами
+REQUIRED_RAW_DATA_HEADERS = ["Email", "Subject", "Date", "Size (bytes)"]
+# Сколько строк читать из колоночного кеша за раз
+_CACHE_BATCH_ROWS = 65536
+
+
+class RawDataRecord(NamedTuple):
+    #MARK: RawDataRecord
+    # Строка листа Raw Data с приведенными типами
+    email: str
+    name_address: str
+    subject: str
+    date: str
+    size: int
+    attachments: str
+    message_id: str = ""
+
+
+RECORD_FIELDS = list(RawDataRecord._fields)
+
+
+def _text(value:Any) -> str:
+    return "" if value is None else str(value)
+
+
+def _size(value:Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return 0
+
+
+def _header_indexes(headers:Tuple[Any, ...],
+                    path_to_excel:Union[str, Path]) -> List[Optional[int]]:
+    # Номер колонки для каждого поля RawDataRecord (None - необязательной колонки нет)
+    normalized = [str(value).strip().lower() if value is not None else "" for value in headers]
+    missing = [name for name in REQUIRED_RAW_DATA_HEADERS if name.lower() not in normalized]
+    if missing:
+        raise ValueError(f"В листе Raw Data файла {path_to_excel} нет колонок: {', '.join(missing)}. "
+                         f"Ожидаемая структура: {', '.join(RAW_DATA_HEADERS)}")
+    return [normalized.index(name.lower()) if name.lower() in normalized else None for name in RAW_DATA_HEADERS]
+
+
+def iter_raw_data(path_to_excel:Union[str, Path],
+                  sheet_name:str="Raw Data"
+                  ) -> Iterator[RawDataRecord]:
+    #MARK: iter_raw_data
+    """
+    Построчное чтение листа Raw Data (read_only, values_only): в памяти только текущая строка.
+    Заголовки проверяются по структуре выходного файла, пустые строки пропускаются.
+    Если листа нет - записей нет.
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path_to_excel, read_only=True, data_only=True)
+    try:
+        if sheet_name not in wb.sheetnames:
+            return
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        indexes = _header_indexes(next(rows, ()), path_to_excel)
+        for row in rows:
+            if not row or all(value is None for value in row):
+                continue
+            values = [row[i] if i is not None and i < len(row) else None for i in indexes]
+            yield RawDataRecord(_text(values[0]).strip(), _text(values[1]), _text(values[2]),
+                                _text(values[3]), _size(values[4]), _text(values[5]), _text(values[6]).strip())
+    finally:
+        wb.close()
+
+
+def _cache_is_fresh(path_to_excel:Path,
+                    path_to_cache:Path) -> bool:
+    return path_to_cache.exists() and path_to_cache.stat().st_mtime >= path_to_excel.stat().st_mtime
+
+
+def build_columnar_cache(path_to_excel:Union[str, Path],
+                         path_to_cache:Union[str, Path]) -> Path:
+    #MARK: build_columnar_cache
+    """
+    Однократно переводит лист Raw Data в колоночный файл (.feather или .parquet) через pandas.
+    Feather пишется без сжатия, чтобы следующие запуски читали его через memory-map.
+    """
+    import pandas as pd
+
+    path_to_cache = Path(path_to_cache)
+    df = pd.DataFrame.from_records(iter_raw_data(path_to_excel), columns=RECORD_FIELDS)
+    df["size"] = df["size"].astype("int64")
+    tmp_path = path_to_cache.with_name(path_to_cache.name + ".tmp")
+    try:
+        if path_to_cache.suffix.lower() == ".parquet":
+            df.to_parquet(tmp_path, index=False)
+        elif path_to_cache.suffix.lower() == ".feather":
+            df.to_feather(tmp_path, compression="uncompressed")
+        else:
+            raise ValueError(f"Неизвестный формат кеша {path_to_cache}. Допустимо: .feather, .parquet")
+    except ImportError as e:
+        raise ImportError(f"Для кеша {path_to_cache.suffix} нужен пакет pyarrow (pip install pyarrow): {e}")
+    # Кеш появляется целиком или не появляется вовсе
+    tmp_path.replace(path_to_cache)
+    return path_to_cache
+
+
+def iter_columnar_cache(path_to_cache:Union[str, Path]) -> Iterator[RawDataRecord]:
+    #MARK: iter_columnar_cache
+    # Чтение кеша пачками строк; feather отображается в память, а не разбирается целиком
+    path_to_cache = Path(path_to_cache)
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as parquet
+    except ImportError as e:
+        raise ImportError(f"Для чтения кеша {path_to_cache} нужен пакет pyarrow (pip install pyarrow): {e}")
+    # В файлах прошлых версий нет колонки message_id - для них она пустая
+    if path_to_cache.suffix.lower() == ".parquet":
+        file = parquet.ParquetFile(path_to_cache, memory_map=True)
+        fields = [name for name in RECORD_FIELDS if name in file.schema_arrow.names]
+        batches = file.iter_batches(batch_size=_CACHE_BATCH_ROWS, columns=fields)
+    else:
+        table = feather.read_table(path_to_cache, memory_map=True)
+        fields = [name for name in RECORD_FIELDS if name in table.column_names]
+        batches = table.select(fields).to_batches(_CACHE_BATCH_ROWS)
+    for batch in batches:
+        columns = [batch.column(name).to_pylist() for name in fields]
+        for values in zip(*columns):
+            yield RawDataRecord(*values)
+
+
+def iter_input_records(path_to_excel:Union[str, Path],
+                       path_to_cache:Union[str, Path, None]=None
+                       ) -> Iterator[RawDataRecord]:
+    #MARK: iter_input_records
+    """
+    Записи Raw Data входного файла. С path_to_cache xlsx разбирается только при первом запуске
+    (или если Excel изменился позже кеша), дальше записи читаются из колоночного кеша.
+    """
+    if not path_to_cache:
+        yield from iter_raw_data(path_to_excel)
+        return
+    path_to_excel, path_to_cache = Path(path_to_excel), Path(path_to_cache)
+    if not _cache_is_fresh(path_to_excel, path_to_cache):
+        print(f"Создаем колоночный кеш входного файла: {path_to_cache}")
+        build_columnar_cache(path_to_excel, path_to_cache)
+    yield from iter_columnar_cache(path_to_cache)
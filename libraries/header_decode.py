@@ -0,0 +1,92 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import codecs
+from functools import lru_cache
+from email.header import decode_header
+from email.utils import parseaddr
+
+from typing import Tuple, Union, Optional, Dict, List, Any
+
+# Одни и те же отправители и темы рассылок повторяются тысячи раз - храним последние расшифровки
+HEADER_CACHE_SIZE = 16384
+
+# Кодировки, которые почтовые клиенты пишут с ошибками, и чем их читать
+_CHARSET_ALIASES = {
+    "unknown-8bit": "utf-8",
+    "x-unknown": "utf-8",
+    "unknown": "utf-8",
+    "x-user-defined": "cp1251",
+    "cp-1251": "cp1251",
+    "win-1251": "cp1251",
+    "windows-1251-1": "cp1251",
+    "ks_c_5601-1987": "cp949",
+}
+
+
+@lru_cache(maxsize=256)
+def _resolve_charset(charset:Optional[str]) -> str:
+    # Имя кодировки, которое точно есть в Python; неизвестные читаем как utf-8
+    charset = (charset or "utf-8").strip().strip('"').lower()
+    charset = _CHARSET_ALIASES.get(charset, charset)
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return "utf-8"
+
+
+def _decode_part(part:Union[bytes, str],
+                 charset:Optional[str]) -> str:
+    if isinstance(part, str):
+        return part
+    return part.decode(_resolve_charset(charset), errors="replace")
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _decode_encoded_words(value:str) -> str:
+    try:
+        parts = decode_header(value)
+    except Exception:
+        # Битый base64/quoted-printable: лучше показать заголовок как есть, чем потерять письмо
+        return value
+    return "".join(_decode_part(part, charset) for part, charset in parts)
+
+
+def decode_header_value(value:Any) -> str:
+    #MARK: decode_header_value
+    """
+    Расшифровка заголовка (RFC 2047: =?utf-8?B?...?=) в строку.
+
+    * заголовки без "=?" возвращаются без разбора (decode_header вернул бы их без изменений);
+    * результаты для повторяющихся заголовков берутся из LRU-кеша;
+    * неизвестные и ошибочные кодировки не вызывают исключений - читаются как utf-8 с заменой символов.
+    """
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        # email.header.Header (заголовки с 8-битными байтами) и прочее
+        value = str(value)
+    if "=?" not in value:
+        return value
+    return _decode_encoded_words(value)
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _parse_address(value:str) -> Tuple[str, str]:
+    name, address = parseaddr(value)
+    return (decode_header_value(name), address)
+
+
+def parse_address(value:Any) -> Tuple[str, str]:
+    #MARK: parse_address
+    # "=?utf-8?B?...?= <user@mail.ru>" -> ("Имя", "user@mail.ru"), с кешем по исходной строке
+    if value is None:
+        return ("", "")
+    return _parse_address(value if isinstance(value, str) else str(value))
+
+
+def clear_header_caches():
+    #MARK: clear_header_caches
+    _decode_encoded_words.cache_clear()
+    _parse_address.cache_clear()
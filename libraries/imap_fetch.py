@@ -0,0 +1,300 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import re
+import struct
+import time
+
+from libraries.metrics import STAGE_FETCH, STAGE_PARSE
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterator
+
+# Набор полей для режима "metadata": размер письма, только нужные заголовки и структура вложений.
+# BODY.PEEK не выставляет флаг \Seen, тело письма и вложения не скачиваются.
+METADATA_HEADER_FIELDS = "FROM SUBJECT DATE MESSAGE-ID"
+METADATA_FETCH_ITEMS = f"(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS ({METADATA_HEADER_FIELDS})] BODYSTRUCTURE)"
+FULL_FETCH_ITEMS = "(UID RFC822)"
+
+# Маркер литерала в конце строки ответа imaplib: ... {123}
+_LITERAL_MARKER = re.compile(rb"\{(\d+)\}$")
+# Ответ STATUS: "INBOX" (MESSAGES 231 UIDNEXT 44292)
+_STATUS_ITEMS = re.compile(rb"\(([^()]*)\)\s*$")
+# Флаги в начале ответа LIST: (\HasNoChildren \Noselect) "/" "INBOX"
+_LIST_FLAGS = re.compile(rb"^\s*\(([^()]*)\)")
+# Упакованный ответ imaplib: элемент - (вид: 0 строка / 1 строка с литералом, длина), длина литерала
+_PACKED_ITEM = struct.Struct("<BI")
+_PACKED_LENGTH = struct.Struct("<I")
+
+
+class _Literal(bytes):
+    """ Литерал IMAP ({n} + n байт) - всегда остается байтами """
+
+
+# Скобки - отдельные объекты, чтобы не путать их со строкой "(" в кавычках
+_OPEN = object()
+_CLOSE = object()
+
+
+def _tokenize(data: List[Union[bytes, Tuple[bytes, bytes]]]) -> Iterator[Any]:
+    #MARK: _tokenize
+    """
+    Разбивает ответ imaplib (список bytes и кортежей (заголовок, литерал)) на токены IMAP.
+    Токены: _OPEN, _CLOSE, None (NIL), str (атомы и строки в кавычках), _Literal (литералы).
+    """
+    for item in data:
+        if isinstance(item, tuple):
+            head, literal = item[0], item[1]
+            head = _LITERAL_MARKER.sub(b"", head)
+            yield from _tokenize_line(head)
+            yield _Literal(literal)
+        elif isinstance(item, bytes):
+            yield from _tokenize_line(item)
+
+
+def _tokenize_line(line: bytes) -> Iterator[Any]:
+    #MARK: _tokenize_line
+    i = 0
+    length = len(line)
+    while i < length:
+        char = line[i:i + 1]
+        if char in (b" ", b"\r", b"\n"):
+            i += 1
+        elif char == b"(":
+            yield _OPEN
+            i += 1
+        elif char == b")":
+            yield _CLOSE
+            i += 1
+        elif char == b'"':
+            # Строка в кавычках с экранированием \" и \\
+            i += 1
+            chunk = bytearray()
+            while i < length:
+                c = line[i:i + 1]
+                if c == b"\\" and i + 1 < length:
+                    chunk += line[i + 1:i + 2]
+                    i += 2
+                elif c == b'"':
+                    i += 1
+                    break
+                else:
+                    chunk += c
+                    i += 1
+            yield chunk.decode("utf-8", errors="replace")
+        else:
+            # Атом. Секция в квадратных скобках (BODY[HEADER.FIELDS (FROM)]) входит в атом целиком
+            start = i
+            while i < length and line[i:i + 1] not in (b" ", b"(", b")", b"\r", b"\n"):
+                if line[i:i + 1] == b"[":
+                    end = line.find(b"]", i)
+                    i = length if end == -1 else end + 1
+                else:
+                    i += 1
+            atom = line[start:i].decode("ascii", errors="replace")
+            yield None if atom.upper() == "NIL" else atom
+
+
+def _read_list(tokens: Iterator[Any]) -> List[Any]:
+    #MARK: _read_list
+    # Открывающая скобка уже прочитана, читаем до закрывающей
+    result = []
+    for token in tokens:
+        if token is _OPEN:
+            result.append(_read_list(tokens))
+        elif token is _CLOSE:
+            return result
+        else:
+            result.append(token)
+    return result
+
+
+def parse_fetch_response(data: List[Union[bytes, Tuple[bytes, bytes]]]
+                         ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    #MARK: parse_fetch_response
+    """
+    Разбирает ответ FETCH (в том числе на несколько писем сразу) и по одному отдает письма.
+
+    :param data: Ответ imaplib.IMAP4.fetch / uid('FETCH', ...).
+    :return: Генератор пар (номер письма, {ИМЯ_ПОЛЯ: значение}).
+    """
+    tokens = _tokenize(data)
+    for token in tokens:
+        if not isinstance(token, str) or not token.isdigit():
+            continue
+        seq = int(token)
+        opening = next(tokens, None)
+        if opening is not _OPEN:
+            continue
+        items = _read_list(tokens)
+        fields = {}
+        for i in range(0, len(items) - 1, 2):
+            key = items[i]
+            if isinstance(key, str):
+                fields[key.upper()] = items[i + 1]
+        yield seq, fields
+
+
+def get_header_bytes(fields: Dict[str, Any]) -> bytes:
+    #MARK: get_header_bytes
+    """ Возвращает байты заголовков из поля BODY[HEADER.FIELDS (...)] (или BODY[HEADER]) """
+    for key, value in fields.items():
+        if key.startswith("BODY[HEADER"):
+            if isinstance(value, bytes):
+                return bytes(value)
+            if isinstance(value, str):
+                return value.encode("utf-8", errors="replace")
+    return b""
+
+
+def parse_uid_list(search_data: List[Any]) -> List[int]:
+    #MARK: parse_uid_list
+    # Ответ SEARCH / UID SEARCH: [b'1 2 3 ...'] -> [1, 2, 3, ...]
+    uids = []
+    for item in search_data or []:
+        if isinstance(item, bytes):
+            uids.extend(int(uid) for uid in item.split() if uid.isdigit())
+    return uids
+
+
+def parse_status_response(status_data: List[Any]) -> Dict[str, int]:
+    #MARK: parse_status_response
+    # Ответ STATUS: [b'"INBOX" (MESSAGES 231 UIDNEXT 44292)'] -> {"MESSAGES": 231, "UIDNEXT": 44292}
+    result = {}
+    for item in status_data or []:
+        line = item[0] if isinstance(item, tuple) else item
+        if not isinstance(line, bytes):
+            continue
+        match = _STATUS_ITEMS.search(line)
+        if not match:
+            continue
+        tokens = match.group(1).split()
+        for name, value in zip(tokens[::2], tokens[1::2]):
+            if value.isdigit():
+                result[name.decode().upper()] = int(value)
+    return result
+
+
+def parse_list_flags(list_line: bytes) -> set:
+    #MARK: parse_list_flags
+    # Строка ответа LIST -> {"\\HASNOCHILDREN", "\\NOSELECT"}
+    match = _LIST_FLAGS.match(list_line or b"")
+    if not match:
+        return set()
+    return {flag.decode(errors="replace").upper() for flag in match.group(1).split()}
+
+
+def response_size(data: List[Any]) -> int:
+    #MARK: response_size
+    # Объем ответа imaplib в байтах: строки и литералы (кортежи (заголовок, литерал))
+    size = 0
+    for item in data or []:
+        if isinstance(item, tuple):
+            size += sum(len(part) for part in item if isinstance(part, bytes))
+        elif isinstance(item, bytes):
+            size += len(item)
+    return size
+
+
+def pack_fetch_response(data: List[Union[bytes, Tuple[bytes, bytes]]]) -> bytes:
+    #MARK: pack_fetch_response
+    """
+    Ответ imaplib (список bytes и кортежей (заголовок, литерал)) -> один буфер bytes.
+    Для передачи в пул процессов: pickle одного буфера дешевле, чем тысяч мелких объектов.
+    """
+    parts = []
+    for item in data or []:
+        if isinstance(item, tuple):
+            head, literal = item[0], item[1]
+            parts += [_PACKED_ITEM.pack(1, len(head)), head, _PACKED_LENGTH.pack(len(literal)), literal]
+        elif isinstance(item, bytes):
+            parts += [_PACKED_ITEM.pack(0, len(item)), item]
+    return b"".join(parts)
+
+
+def unpack_fetch_response(buffer: bytes) -> List[Union[bytes, Tuple[bytes, bytes]]]:
+    #MARK: unpack_fetch_response
+    # Обратно к виду ответа imaplib (для parse_fetch_response)
+    data = []
+    offset = 0
+    while offset < len(buffer):
+        kind, size = _PACKED_ITEM.unpack_from(buffer, offset)
+        offset += _PACKED_ITEM.size
+        item = buffer[offset:offset + size]
+        offset += size
+        if kind == 1:
+            (size,) = _PACKED_LENGTH.unpack_from(buffer, offset)
+            offset += _PACKED_LENGTH.size
+            item = (item, buffer[offset:offset + size])
+            offset += size
+        data.append(item)
+    return data
+
+
+def compress_uid_set(uids: List[int]) -> str:
+    #MARK: compress_uid_set
+    """
+    Сжимает список UID в message-set IMAP: [1, 2, 3, 5, 7, 8] -> "1:3,5,7:8".
+    """
+    ranges = []
+    start = previous = None
+    for uid in sorted(set(uids)):
+        if start is None:
+            start = previous = uid
+        elif uid == previous + 1:
+            previous = uid
+        else:
+            ranges.append(f"{start}:{previous}" if start != previous else str(start))
+            start = previous = uid
+    if start is not None:
+        ranges.append(f"{start}:{previous}" if start != previous else str(start))
+    return ",".join(ranges)
+
+
+def chunked(items: List[Any], size: int) -> Iterator[List[Any]]:
+    #MARK: chunked
+    size = max(int(size), 1)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def iter_uid_fetch(mail,
+                   uids: List[int],
+                   fetch_items: str,
+                   batch_size: int = 500,
+                   metrics=None,
+                   folder: Optional[str] = None
+                   ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    #MARK: iter_uid_fetch
+    """
+    Выгружает письма пачками: одна команда UID FETCH на batch_size писем вместо одной на каждое письмо.
+
+    :param mail: Сессия imaplib с выбранной папкой.
+    :param uids: UID писем (результат UID SEARCH).
+    :param fetch_items: Набор полей FETCH (FULL_FETCH_ITEMS или METADATA_FETCH_ITEMS).
+    :param batch_size: Количество писем в одной команде.
+    :param metrics: PipelineMetrics - время и объем UID FETCH (этап fetch) и разбора ответа (этап parse).
+    :param folder: Папка для итогов metrics.
+    :return: Генератор пар (UID, {ИМЯ_ПОЛЯ: значение}).
+    """
+    for batch in chunked(uids, batch_size):
+        time_begin = time.perf_counter()
+        try:
+            status, data = mail.uid('FETCH', compress_uid_set(batch), fetch_items)
+            if status != 'OK':
+                raise Exception(f"Не удалось выполнить UID FETCH: {data}")
+        except Exception:
+            if metrics is not None:
+                metrics.add(STAGE_FETCH, time.perf_counter() - time_begin, errors=1, folder=folder)
+            raise
+        time_parse = time.perf_counter()
+        messages = list(parse_fetch_response(data))
+        if metrics is not None:
+            time_end = time.perf_counter()
+            metrics.add(STAGE_FETCH, time_parse - time_begin, response_size(data), len(messages), folder=folder)
+            metrics.add(STAGE_PARSE, time_end - time_parse, folder=folder)
+        for _, fields in messages:
+            uid = fields.get("UID")
+            if uid is None:
+                continue
+            yield int(uid), fields
@@ -0,0 +1,218 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import imaplib
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Callable, Iterator
+
+# Ошибки, после которых сессию нельзя использовать дальше
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, ConnectionError, socket.timeout, ssl.SSLError, OSError)
+
+
+# Предел длины строки ответа: imaplib._MAXLINE (1 000 000 байт) мал для * SEARCH больших папок,
+# но строка без перевода строки не должна съедать всю память
+MAX_LINE = 64 * 1024 * 1024
+
+
+class _UnlimitedLines:
+    # imaplib обрывает сессию на строке длиннее imaplib._MAXLINE, а ответ * SEARCH папки
+    # на 200 тысяч писем - около 1.3 МБ в одну строку. Строки читаются до MAX_LINE, литералы - как обычно
+    def readline(self) -> bytes:
+        line = self.file.readline(MAX_LINE + 1)
+        if len(line) > MAX_LINE:
+            raise self.error(f"Строка ответа сервера длиннее {MAX_LINE} байт")
+        return line
+
+
+class IMAP4(_UnlimitedLines, imaplib.IMAP4):
+    #MARK: IMAP4
+    pass
+
+
+class IMAP4_SSL(_UnlimitedLines, imaplib.IMAP4_SSL):
+    #MARK: IMAP4_SSL
+    pass
+
+
+class IMAPConnectionPool:
+    #MARK: IMAPConnectionPool
+    """
+    Пул авторизованных IMAP-сессий.
+
+    Держит не больше size сессий к серверу, отдает их по очереди и переиспользует между папками
+    (папка переключается командой SELECT/EXAMINE, без нового TLS-рукопожатия и LOGIN).
+    Упавшие сессии выбрасываются, новые создаются с экспоненциальной задержкой между попытками.
+
+    with pool.session() as mail:
+        mail.select('"INBOX"', readonly=True)
+    """
+    def __init__(self,
+                 imap_server:str,
+                 email_user:str,
+                 email_password:str,
+                 size:int=4,
+                 max_retries:int=5,
+                 backoff_base:float=1.0,
+                 backoff_max:float=60.0,
+                 connection_factory:Optional[Callable[[], imaplib.IMAP4]]=None,
+                 port:int=0,
+                 use_ssl:bool=True):
+        self.imap_server = imap_server
+        # 0 - стандартный порт: 993 для IMAPS, 143 без TLS
+        self.port = int(port or (993 if use_ssl else 143))
+        self.use_ssl = bool(use_ssl)
+        self.email_user = email_user
+        self.email_password = email_password
+        self.size = max(int(size), 1)
+        self.max_retries = max(int(max_retries), 1)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connection_factory = connection_factory or self._default_connection
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self.connections_opened = 0
+
+
+
+    def _default_connection(self) -> imaplib.IMAP4:
+        if self.use_ssl:
+            return IMAP4_SSL(self.imap_server, self.port)
+        return IMAP4(self.imap_server, self.port)
+
+
+
+    def connect(self) -> imaplib.IMAP4:
+        #MARK: connect
+        # Новая сессия: подключение + LOGIN, при ошибке сети повторяем с нарастающей задержкой
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                mail = self.connection_factory()
+                mail.login(self.email_user, self.email_password)
+                self.connections_opened += 1
+                return mail
+            except CONNECTION_ERRORS as e:
+                last_error = e
+                delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+                print(f"Не удалось подключиться к {self.imap_server} (попытка {attempt + 1}/{self.max_retries}): "
+                      f"{e}. Повтор через {delay} сек")
+                time.sleep(delay)
+        raise ConnectionError(f"Не удалось подключиться к {self.imap_server}: {last_error}")
+
+
+
+    def _is_alive(self,
+                  mail:imaplib.IMAP4) -> bool:
+        try:
+            status, _ = mail.noop()
+            return status == 'OK'
+        except CONNECTION_ERRORS + (imaplib.IMAP4.error,):
+            return False
+
+
+
+    def _discard(self,
+                 mail:imaplib.IMAP4):
+        try:
+            mail.shutdown()
+        except Exception:
+            pass
+
+
+
+    def acquire(self) -> imaplib.IMAP4:
+        #MARK: acquire
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    mail = self._idle.pop() if self._idle else None
+                if mail is None:
+                    return self.connect()
+                if self._is_alive(mail):
+                    return mail
+                self._discard(mail)
+        except BaseException:
+            self._slots.release()
+            raise
+
+
+
+    def release(self,
+                mail:imaplib.IMAP4,
+                broken:bool=False):
+        #MARK: release
+        try:
+            if broken:
+                self._discard(mail)
+            else:
+                with self._lock:
+                    self._idle.append(mail)
+        finally:
+            self._slots.release()
+
+
+
+    @contextmanager
+    def session(self) -> Iterator[imaplib.IMAP4]:
+        #MARK: session
+        mail = self.acquire()
+        try:
+            yield mail
+        except CONNECTION_ERRORS:
+            self.release(mail, broken=True)
+            raise
+        except BaseException:
+            # Ошибка не сетевая - сессия исправна, возвращаем ее в пул
+            self.release(mail)
+            raise
+        else:
+            self.release(mail)
+
+
+
+    def close_all(self):
+        #MARK: close_all
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for mail in idle:
+            try:
+                mail.logout()
+            except Exception:
+                self._discard(mail)
+
+
+
+# Пул текущего процесса: воркер ProcessPoolExecutor живет дольше одной задачи,
+# поэтому его сессия переиспользуется для всех папок, которые ему достались
+_process_pool: Optional[IMAPConnectionPool] = None
+
+
+def get_process_pool(imap_server:str,
+                     email_user:str,
+                     email_password:str,
+                     size:int=1,
+                     **kwargs) -> IMAPConnectionPool:
+    #MARK: get_process_pool
+    global _process_pool
+    if (_process_pool is None
+            or (_process_pool.imap_server, _process_pool.email_user) != (imap_server, email_user)
+            or any(getattr(_process_pool, name) != value for name, value in kwargs.items()
+                   if name in ("port", "use_ssl"))):
+        _process_pool = IMAPConnectionPool(imap_server, email_user, email_password, size=size, **kwargs)
+    return _process_pool
+
+
+def close_process_pool():
+    #MARK: close_process_pool
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.close_all()
+        _process_pool = None
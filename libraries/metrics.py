@@ -0,0 +1,312 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import datetime
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from libraries.common_funcs import set_custom_logger, prepare_ThroughputStatistic
+from imapclient import imap_utf7
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterator
+
+# Этапы обработки
+STAGE_LIST = "list"            # LIST - список папок
+STAGE_STATUS = "status"        # STATUS (MESSAGES) - размер папок для планирования
+STAGE_SELECT = "select"        # SELECT / EXAMINE папки
+STAGE_SEARCH = "search"        # UID SEARCH
+STAGE_FETCH = "fetch"          # UID FETCH: ожидание и чтение ответа сервера
+STAGE_PARSE = "parse"          # разбор ответа FETCH и сборка строк Raw Data
+STAGE_AGGREGATE = "aggregate"  # итоги By Email / By Domain
+STAGE_WRITE = "write"          # промежуточный файл, хранилище состояния, контрольные точки
+STAGE_OUTPUT = "output"        # сборка выходного файла (Excel, Parquet, SQLite)
+STAGES = [STAGE_LIST, STAGE_STATUS, STAGE_SELECT, STAGE_SEARCH, STAGE_FETCH, STAGE_PARSE,
+          STAGE_AGGREGATE, STAGE_WRITE, STAGE_OUTPUT]
+
+_STAGE_FIELDS = ("calls", "seconds", "bytes", "messages", "errors")
+_FOLDER_FIELDS = ("bytes", "messages", "errors")
+
+_logger = None
+
+
+def get_metrics_logger() -> logging.Logger:
+    #MARK: get_metrics_logger
+    # Структурированный лог метрик: одна строка JSON на событие (создается при первом обращении)
+    global _logger
+    if _logger is None:
+        _logger = set_custom_logger("email_metrics")
+    return _logger
+
+
+def log_event(event:str,
+              **fields):
+    #MARK: log_event
+    get_metrics_logger().info(json.dumps(dict(event=event, **fields), ensure_ascii=False, default=str))
+
+
+class StageRecord:
+    #MARK: StageRecord
+    # Счетчики одного замера (PipelineMetrics.stage): заполняются внутри блока with
+    __slots__ = ("bytes", "messages", "errors")
+
+    def __init__(self):
+        self.bytes = 0
+        self.messages = 0
+        self.errors = 0
+
+
+class PipelineMetrics:
+    #MARK: PipelineMetrics
+    """
+    Метрики этапов обработки: время, байты, письма и ошибки по каждому этапу и итоги по папкам.
+
+    Воркеры собирают свои метрики локально и отправляют их писателю сообщением MSG_METRICS (to_dict),
+    писатель складывает их в общие (merge). Время папки (начало - конец) отмечает только писатель,
+    по нему и объему выгруженного считается скорость папки: длительность, МБ, Mbit/s.
+
+    with metrics.stage(STAGE_FETCH, folder) as record:
+        status, data = mail.uid('FETCH', ...)
+        record.bytes = response_size(data)  # imap_fetch.response_size
+    """
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.folders: Dict[str, Dict[str, Any]] = {}
+
+
+
+    def __bool__(self) -> bool:
+        return bool(self.stages or self.folders)
+
+
+
+    def _folder(self,
+                folder:str) -> Dict[str, Any]:
+        stats = self.folders.get(folder)
+        if stats is None:
+            stats = self.folders[folder] = dict.fromkeys(_FOLDER_FIELDS, 0)
+        return stats
+
+
+
+    def add(self,
+            stage:str,
+            seconds:float=0.0,
+            bytes:int=0,
+            messages:int=0,
+            errors:int=0,
+            folder:Optional[str]=None,
+            calls:int=1):
+        #MARK: add
+        # В итоги папки попадают объем и письма этапа FETCH и ошибки любого этапа
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = dict.fromkeys(_STAGE_FIELDS, 0)
+        stats["calls"] += calls
+        stats["seconds"] += seconds
+        stats["bytes"] += bytes
+        stats["messages"] += messages
+        stats["errors"] += errors
+        if folder is not None:
+            folder_stats = self._folder(folder)
+            if stage == STAGE_FETCH:
+                folder_stats["bytes"] += bytes
+                folder_stats["messages"] += messages
+            folder_stats["errors"] += errors
+
+
+
+    @contextmanager
+    def stage(self,
+              stage:str,
+              folder:Optional[str]=None) -> Iterator[StageRecord]:
+        #MARK: stage
+        # Замер блока кода; исключение внутри блока считается ошибкой этапа и пробрасывается дальше
+        record = StageRecord()
+        time_begin = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record.errors += 1
+            raise
+        finally:
+            self.add(stage, time.perf_counter() - time_begin, record.bytes, record.messages, record.errors, folder)
+
+
+
+    def folder_started(self,
+                       folder:str):
+        #MARK: folder_started
+        # Повтор папки продолжает отсчет с первого начала
+        stats = self._folder(folder)
+        stats.setdefault("date_begin", datetime.datetime.now())
+
+
+
+    def folder_finished(self,
+                        folder:str,
+                        status:str) -> Dict[str, Any]:
+        #MARK: folder_finished
+        stats = self._folder(folder)
+        stats.setdefault("date_begin", datetime.datetime.now())
+        stats["date_end"] = datetime.datetime.now()
+        stats["status"] = status
+        return self.folder_throughput(folder)
+
+
+
+    def folder_throughput(self,
+                          folder:str) -> Dict[str, Any]:
+        #MARK: folder_throughput
+        # Длительность, МБ и Mbit/s - как в prepare_ResponseStatisticInsert
+        stats = self._folder(folder)
+        date_begin = stats.get("date_begin")
+        date_end = stats.get("date_end") or datetime.datetime.now()
+        throughput = prepare_ThroughputStatistic(date_begin or date_end, date_end, stats["bytes"])
+        try:
+            display = imap_utf7.decode(folder.encode("ascii"))
+        except Exception:
+            display = folder
+        return {
+            "folder": folder,
+            "display": display,
+            "status": stats.get("status"),
+            "messages": stats["messages"],
+            "bytes": stats["bytes"],
+            "errors": stats["errors"],
+            "duration_sec": round(throughput["duration"], 3),
+            "size_mb": round(throughput["size_mb"], 3),
+            "speed_mbit": round(throughput["speed_mbit"], 3),
+            "messages_per_sec": round(stats["messages"] / throughput["duration"], 1),
+        }
+
+
+
+    def to_dict(self) -> Dict[str, Any]:
+        #MARK: to_dict
+        # Счетчики для передачи писателю (без времени начала и конца папок)
+        return {
+            "stages": {stage: dict(stats) for stage, stats in self.stages.items()},
+            "folders": {folder: {name: stats[name] for name in _FOLDER_FIELDS}
+                        for folder, stats in self.folders.items()},
+        }
+
+
+
+    def merge(self,
+              data:Dict[str, Any]):
+        #MARK: merge
+        # Счетчики из to_dict() (метрики воркера) добавляются к этим
+        for stage, stats in (data.get("stages") or {}).items():
+            target = self.stages.get(stage)
+            if target is None:
+                target = self.stages[stage] = dict.fromkeys(_STAGE_FIELDS, 0)
+            for name in _STAGE_FIELDS:
+                target[name] += stats.get(name, 0)
+        for folder, stats in (data.get("folders") or {}).items():
+            target = self._folder(folder)
+            for name in _FOLDER_FIELDS:
+                target[name] += stats.get(name, 0)
+
+
+
+    def summary(self) -> Dict[str, Any]:
+        #MARK: summary
+        stages = {}
+        for stage in sorted(self.stages, key=lambda name: (STAGES.index(name) if name in STAGES else len(STAGES), name)):
+            stats = self.stages[stage]
+            seconds = stats["seconds"]
+            stages[stage] = {
+                "calls": stats["calls"],
+                "seconds": round(seconds, 4),
+                "bytes": stats["bytes"],
+                "size_mb": round(stats["bytes"] / 1024.0 / 1024.0, 3),
+                "messages": stats["messages"],
+                "errors": stats["errors"],
+                "messages_per_sec": round(stats["messages"] / seconds, 1) if seconds > 0 and stats["messages"] else None,
+            }
+        folders = [self.folder_throughput(folder) for folder in sorted(self.folders)]
+        return {
+            "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "stages": stages,
+            "folders": folders,
+            "totals": {
+                "messages": sum(folder["messages"] for folder in folders),
+                "bytes": sum(folder["bytes"] for folder in folders),
+                "errors": sum(stats["errors"] for stats in self.stages.values()),
+            },
+        }
+
+
+
+    def write_json(self,
+                   path_to_file:Union[str, Path]):
+        #MARK: write_json
+        _write_atomic(path_to_file, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+
+
+
+    def write_prometheus(self,
+                         path_to_file:Union[str, Path],
+                         prefix:str="email_cleaner"):
+        #MARK: write_prometheus
+        """
+        Текстовый формат Prometheus (например, для textfile collector node_exporter).
+        Файл заменяется целиком, поэтому сборщик не прочитает его наполовину записанным.
+        """
+        lines = []
+
+        def metric(name:str, kind:str, text:str, samples:List[Tuple[Dict[str, str], Any]]):
+            lines.append(f"# HELP {prefix}_{name} {text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}")
+
+        stages = sorted(self.stages.items())
+        metric("stage_calls_total", "counter", "Calls of the processing stage",
+               [({"stage": stage}, stats["calls"]) for stage, stats in stages])
+        metric("stage_seconds_total", "counter", "Time spent in the processing stage, seconds",
+               [({"stage": stage}, round(stats["seconds"], 6)) for stage, stats in stages])
+        metric("stage_bytes_total", "counter", "Bytes handled by the processing stage",
+               [({"stage": stage}, stats["bytes"]) for stage, stats in stages])
+        metric("stage_messages_total", "counter", "Messages handled by the processing stage",
+               [({"stage": stage}, stats["messages"]) for stage, stats in stages])
+        metric("stage_errors_total", "counter", "Errors in the processing stage",
+               [({"stage": stage}, stats["errors"]) for stage, stats in stages])
+        folders = [self.folder_throughput(folder) for folder in sorted(self.folders)]
+        metric("folder_messages_total", "counter", "Messages fetched from the folder",
+               [({"folder": folder["display"]}, folder["messages"]) for folder in folders])
+        metric("folder_bytes_total", "counter", "Bytes fetched from the folder",
+               [({"folder": folder["display"]}, folder["bytes"]) for folder in folders])
+        metric("folder_duration_seconds", "gauge", "Folder processing time, seconds",
+               [({"folder": folder["display"]}, folder["duration_sec"]) for folder in folders])
+        metric("folder_speed_mbit", "gauge", "Folder fetch speed, Mbit/s",
+               [({"folder": folder["display"]}, folder["speed_mbit"]) for folder in folders])
+        _write_atomic(path_to_file, "\n".join(lines) + "\n")
+
+
+
+    def log_summary(self):
+        #MARK: log_summary
+        for stage, stats in self.summary()["stages"].items():
+            log_event("stage", stage=stage, **stats)
+
+
+
+def _escape_label(value:Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+
+def _write_atomic(path_to_file:Union[str, Path],
+                  text:str):
+    # Запись во временный файл и замена: читатель видит либо старый файл, либо новый целиком
+    path_to_file = Path(path_to_file)
+    path_to_temp = path_to_file.with_name(f"{path_to_file.name}.tmp")
+    with open(path_to_temp, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(path_to_temp, path_to_file)
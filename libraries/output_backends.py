@@ -0,0 +1,520 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import os
+import re
+import sqlite3
+
+from libraries.report_writer import (RAW_DATA_HEADERS, BY_EMAIL_HEADERS, BY_DOMAIN_HEADERS, DUPLICATES_HEADERS,
+                                     ATTACHMENTS_HEADERS, ATTACHMENT_SUMMARY_HEADERS)
+from libraries.aggregation import SummaryAggregator
+from libraries.duplicates import DUPLICATES_FIELDS
+from libraries.attachments import ATTACHMENTS_FIELDS, ATTACHMENT_SUMMARY_FIELDS
+from libraries.excel_input import RawDataRecord, RECORD_FIELDS, iter_input_records, iter_columnar_cache
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterator, Iterable, Callable
+
+OUTPUT_EXCEL = "excel"
+OUTPUT_PARQUET = "parquet"
+OUTPUT_SQLITE = "sqlite"
+
+# Строк Raw Data на листе Excel: 1 048 576 строк листа минус заголовок
+EXCEL_MAX_DATA_ROWS = 1048575
+# Сколько строк писать в Parquet / SQLite за раз
+_WRITE_BATCH_ROWS = 65536
+
+# Колонки итогов в Parquet и SQLite (Raw Data - RECORD_FIELDS, как в колоночном кеше входного файла)
+BY_EMAIL_FIELDS = ["email", "count", "total_size"]
+BY_DOMAIN_FIELDS = ["domain", "count", "unique_emails", "total_size"]
+
+RowsSource = Callable[[], Iterator[Tuple[Any, ...]]]
+# Колонки-числа таблиц дубликатов и вложений (остальные - текст)
+_DUPLICATES_NUMBERS = {"copies", "size", "reclaimable", "keep_uid"}
+_ATTACHMENTS_NUMBERS = {"uid", "size"}
+_ATTACHMENT_SUMMARY_NUMBERS = {"attachments", "messages", "size"}
+# Как openpyxl.cell.cell.ILLEGAL_CHARACTERS_RE: openpyxl импортируется только при работе с xlsx
+_ILLEGAL_CHARACTERS_RE = re.compile(r"[\000-\010]|[\013-\014]|[\016-\037]")
+
+
+def _excel_safe(value):
+    # openpyxl не принимает управляющие символы в строках (бывают в темах писем)
+    if isinstance(value, str):
+        return _ILLEGAL_CHARACTERS_RE.sub("", value)
+    return value
+
+
+def _sheet_column(ws, header:str) -> List[Any]:
+    #MARK: _sheet_column
+    # Значения колонки листа по имени заголовка (без учета регистра), пустые пропускаются
+    rows = ws.iter_rows(values_only=True)
+    headers = [str(value).strip().lower() if value is not None else "" for value in next(rows, ())]
+    if header.lower() not in headers:
+        return []
+    index = headers.index(header.lower())
+    return [row[index] for row in rows if len(row) > index and row[index] not in (None, "")]
+
+
+def _record(row:Tuple[Any, ...]) -> Tuple[str, str, str, str, int, str, str]:
+    # Строка Raw Data с типами колонок Parquet / SQLite (пустые значения - "", как при чтении из Excel).
+    # В строках прошлых версий нет Message-ID
+    values = [("" if value is None else str(value)) for value in row[:7]]
+    values += [""] * (len(RECORD_FIELDS) - len(values))
+    try:
+        values[4] = int(row[4] or 0)
+    except (TypeError, ValueError):
+        values[4] = 0
+    return tuple(values)
+
+
+def _optional_tables(duplicates:Optional[RowsSource],
+                     attachments:Optional[RowsSource],
+                     attachment_summary:Optional[RowsSource]
+                     ) -> List[Tuple[str, List[str], set, Optional[RowsSource]]]:
+    # Необязательные таблицы Parquet / SQLite: (имя, колонки, колонки-числа, источник строк или None)
+    return [("duplicates", DUPLICATES_FIELDS, _DUPLICATES_NUMBERS, duplicates),
+            ("attachments", ATTACHMENTS_FIELDS, _ATTACHMENTS_NUMBERS, attachments),
+            ("attachment_summary", ATTACHMENT_SUMMARY_FIELDS, _ATTACHMENT_SUMMARY_NUMBERS, attachment_summary)]
+
+
+def _batches(rows:Iterable[Any],
+             size:int=_WRITE_BATCH_ROWS) -> Iterator[List[Any]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class OutputBackend:
+    #MARK: OutputBackend
+    """
+    Формат выходного файла: запись Raw Data, итогов By Email / By Domain, групп копий (Duplicates)
+    и вложений (Attachments, Attachment Summary) в конце выгрузки и чтение того же файла как входного при следующем запуске (правила удаления).
+    Файл пишется во временный и заменяет старый целиком.
+    """
+    format = ""
+    suffix = ""
+
+    def __init__(self,
+                 path_to_file:Union[str, Path]):
+        self.path_to_file = Path(path_to_file)
+
+
+
+    def write(self,
+              rows:RowsSource,
+              summary:SummaryAggregator,
+              duplicates:Optional[RowsSource]=None,
+              attachments:Optional[RowsSource]=None,
+              attachment_summary:Optional[RowsSource]=None):
+        #MARK: write
+        # duplicates - группы копий (DUPLICATES_FIELDS), attachments - вложения (ATTACHMENTS_FIELDS),
+        # attachment_summary - итоги по вложениям (ATTACHMENT_SUMMARY_FIELDS); None - без листа
+        raise NotImplementedError
+
+
+
+    def iter_records(self) -> Iterator[RawDataRecord]:
+        #MARK: iter_records
+        raise NotImplementedError
+
+
+
+    def rule_columns(self) -> Tuple[List[str], List[str], List[str]]:
+        #MARK: rule_columns
+        # Адреса (By Email), домены (By Domain) и подстроки тем (By Subject) для правил удаления
+        raise NotImplementedError
+
+
+
+    def duplicate_fingerprints(self) -> List[str]:
+        #MARK: duplicate_fingerprints
+        # Отпечатки групп копий (Duplicates), в которых нужно удалить все копии, кроме одной
+        raise NotImplementedError
+
+
+
+    def paths(self) -> List[Path]:
+        #MARK: paths
+        return [self.path_to_file]
+
+
+
+    def size(self) -> int:
+        #MARK: size
+        return sum(path.stat().st_size for path in self.paths() if path.exists())
+
+
+
+class ExcelOutput(OutputBackend):
+    #MARK: ExcelOutput
+    """
+    Excel (write_only): листы By Email, By Domain, Duplicates, Attachment Summary, Attachments и Raw Data.
+    На лист помещается не больше EXCEL_MAX_DATA_ROWS строк - остальные не записываются,
+    для таких ящиков нужен формат parquet или sqlite.
+    """
+    format = OUTPUT_EXCEL
+    suffix = ".xlsx"
+
+    def __init__(self,
+                 path_to_file:Union[str, Path],
+                 path_to_cache:Union[str, Path, None]=None):
+        super().__init__(path_to_file)
+        # Колоночный кеш листа Raw Data при чтении (.feather/.parquet), см. excel_input
+        self.path_to_cache = path_to_cache
+
+
+
+    def write(self,
+              rows:RowsSource,
+              summary:SummaryAggregator,
+              duplicates:Optional[RowsSource]=None,
+              attachments:Optional[RowsSource]=None,
+              attachment_summary:Optional[RowsSource]=None):
+        #MARK: write
+        import openpyxl
+
+        wb = openpyxl.Workbook(write_only=True)
+
+        # Все листы пишутся через _append_rows: лист длиннее EXCEL_MAX_DATA_ROWS Excel не откроет
+        self._append_rows(wb.create_sheet("By Email"), BY_EMAIL_HEADERS, summary.by_email.items())
+        self._append_rows(wb.create_sheet("By Domain"), BY_DOMAIN_HEADERS, summary.by_domain.items())
+
+        if duplicates is not None:
+            self._append_rows(wb.create_sheet("Duplicates"), DUPLICATES_HEADERS, duplicates())
+
+        if attachment_summary is not None:
+            self._append_rows(wb.create_sheet("Attachment Summary"), ATTACHMENT_SUMMARY_HEADERS, attachment_summary())
+
+        if attachments is not None:
+            self._append_rows(wb.create_sheet("Attachments"), ATTACHMENTS_HEADERS, attachments())
+
+        self._append_rows(wb.create_sheet("Raw Data"), RAW_DATA_HEADERS, rows())
+
+        path_to_temp = self.path_to_file.with_name(f"{self.path_to_file.name}.tmp")
+        wb.save(path_to_temp)
+        os.replace(path_to_temp, self.path_to_file)
+
+
+
+    @staticmethod
+    def _append_rows(ws,
+                     headers:List[str],
+                     rows:Iterable[Tuple[Any, ...]]):
+        # Строки сверх EXCEL_MAX_DATA_ROWS не записываются, о чем выводится предупреждение
+        ws.append(headers)
+        written = 0
+        skipped = 0
+        for row in rows:
+            if written >= EXCEL_MAX_DATA_ROWS:
+                skipped += 1
+                continue
+            ws.append([_excel_safe(value) for value in row[:len(headers)]])
+            written += 1
+        if skipped:
+            print(f"Лист {ws.title}: в Excel помещается {EXCEL_MAX_DATA_ROWS} строк, не записано {skipped}. "
+                  f"Для больших ящиков используйте output_format: parquet или sqlite")
+
+
+
+    def iter_records(self) -> Iterator[RawDataRecord]:
+        #MARK: iter_records
+        return iter_input_records(self.path_to_file, self.path_to_cache)
+
+
+
+    def rule_columns(self) -> Tuple[List[str], List[str], List[str]]:
+        #MARK: rule_columns
+        import openpyxl
+
+        wb = openpyxl.load_workbook(self.path_to_file, read_only=True)
+        try:
+            emails = _sheet_column(wb["By Email"], "Email") if "By Email" in wb.sheetnames else []
+            domains = _sheet_column(wb["By Domain"], "Domain") if "By Domain" in wb.sheetnames else []
+            subjects = _sheet_column(wb["By Subject"], "Subject") if "By Subject" in wb.sheetnames else []
+        finally:
+            wb.close()
+        return emails, domains, subjects
+
+
+
+    def duplicate_fingerprints(self) -> List[str]:
+        #MARK: duplicate_fingerprints
+        import openpyxl
+
+        wb = openpyxl.load_workbook(self.path_to_file, read_only=True)
+        try:
+            return _sheet_column(wb["Duplicates"], "Fingerprint") if "Duplicates" in wb.sheetnames else []
+        finally:
+            wb.close()
+
+
+
+class ParquetOutput(OutputBackend):
+    #MARK: ParquetOutput
+    """
+    Parquet (pyarrow): Raw Data - в самом файле (колонки RECORD_FIELDS), итоги - в соседних
+    <имя>_by_email.parquet и <имя>_by_domain.parquet, копии писем - в <имя>_duplicates.parquet,
+    вложения - в <имя>_attachments.parquet и <имя>_attachment_summary.parquet.
+    Для правил удаления можно добавить <имя>_by_subject.parquet с колонкой subject.
+    Raw Data пишется пачками row group, в памяти не больше одной пачки.
+    """
+    format = OUTPUT_PARQUET
+    suffix = ".parquet"
+
+    def table_path(self,
+                   table:str) -> Path:
+        #MARK: table_path
+        return self.path_to_file.with_name(f"{self.path_to_file.stem}_{table}{self.path_to_file.suffix}")
+
+
+
+    def paths(self) -> List[Path]:
+        #MARK: paths
+        return [self.path_to_file, self.table_path("by_email"), self.table_path("by_domain"),
+                self.table_path("duplicates"), self.table_path("attachments"), self.table_path("attachment_summary")]
+
+
+
+    @staticmethod
+    def _pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError(f"Для формата parquet нужен пакет pyarrow (pip install pyarrow): {e}")
+        return pyarrow
+
+
+
+    def _write_table(self,
+                     path_to_file:Path,
+                     schema,
+                     batches:Iterable[List[Tuple[Any, ...]]]):
+        pa = self._pyarrow()
+        path_to_temp = path_to_file.with_name(f"{path_to_file.name}.tmp")
+        with pa.parquet.ParquetWriter(path_to_temp, schema) as writer:
+            for batch in batches:
+                columns = [pa.array(list(column), type=field.type) for column, field in zip(zip(*batch), schema)]
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+        os.replace(path_to_temp, path_to_file)
+
+
+
+    def write(self,
+              rows:RowsSource,
+              summary:SummaryAggregator,
+              duplicates:Optional[RowsSource]=None,
+              attachments:Optional[RowsSource]=None,
+              attachment_summary:Optional[RowsSource]=None):
+        #MARK: write
+        pa = self._pyarrow()
+        text, number = pa.string(), pa.int64()
+        self._write_table(self.path_to_file,
+                          pa.schema([(name, number if name == "size" else text) for name in RECORD_FIELDS]),
+                          _batches(_record(row) for row in rows()))
+        self._write_table(self.table_path("by_email"),
+                          pa.schema([("email", text), ("count", number), ("total_size", number)]),
+                          _batches(summary.by_email.items()))
+        self._write_table(self.table_path("by_domain"),
+                          pa.schema([("domain", text), ("count", number), ("unique_emails", number),
+                                     ("total_size", number)]),
+                          _batches(summary.by_domain.items()))
+        for table, fields, numbers, source in _optional_tables(duplicates, attachments, attachment_summary):
+            if source is not None:
+                self._write_table(self.table_path(table),
+                                  pa.schema([(name, number if name in numbers else text) for name in fields]),
+                                  _batches(source()))
+            elif self.table_path(table).exists():
+                # Таблица прошлой выгрузки к новому файлу не относится
+                os.remove(self.table_path(table))
+
+
+
+    def iter_records(self) -> Iterator[RawDataRecord]:
+        #MARK: iter_records
+        return iter_columnar_cache(self.path_to_file)
+
+
+
+    def _column(self,
+                table:str,
+                column:str) -> List[Any]:
+        path_to_table = self.table_path(table)
+        if not path_to_table.exists():
+            return []
+        parquet = self._pyarrow().parquet
+        values = parquet.read_table(path_to_table, columns=[column]).column(column).to_pylist()
+        return [value for value in values if value not in (None, "")]
+
+
+
+    def rule_columns(self) -> Tuple[List[str], List[str], List[str]]:
+        #MARK: rule_columns
+        return self._column("by_email", "email"), self._column("by_domain", "domain"), self._column("by_subject", "subject")
+
+
+
+    def duplicate_fingerprints(self) -> List[str]:
+        #MARK: duplicate_fingerprints
+        return self._column("duplicates", "fingerprint")
+
+
+
+class SQLiteOutput(OutputBackend):
+    #MARK: SQLiteOutput
+    """
+    SQLite: таблицы raw_data (колонки RECORD_FIELDS), by_email, by_domain, duplicates (DUPLICATES_FIELDS),
+    attachments (ATTACHMENTS_FIELDS) и attachment_summary (ATTACHMENT_SUMMARY_FIELDS), индексы по адресу и по ключу письма (email, subject, date, size).
+    Для правил удаления можно добавить таблицу by_subject (subject).
+    """
+    format = OUTPUT_SQLITE
+    suffix = ".sqlite"
+
+    def write(self,
+              rows:RowsSource,
+              summary:SummaryAggregator,
+              duplicates:Optional[RowsSource]=None,
+              attachments:Optional[RowsSource]=None,
+              attachment_summary:Optional[RowsSource]=None):
+        #MARK: write
+        path_to_temp = self.path_to_file.with_name(f"{self.path_to_file.name}.tmp")
+        if path_to_temp.exists():
+            os.remove(path_to_temp)
+        connection = sqlite3.connect(path_to_temp)
+        try:
+            # Файл собирается один раз и подменяет старый: журнал не нужен
+            connection.execute("PRAGMA journal_mode=OFF")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.executescript("""
+                CREATE TABLE raw_data (
+                    email TEXT,
+                    name_address TEXT,
+                    subject TEXT,
+                    date TEXT,
+                    size INTEGER,
+                    attachments TEXT,
+                    message_id TEXT
+                );
+                CREATE TABLE by_email (
+                    email TEXT PRIMARY KEY,
+                    count INTEGER,
+                    total_size INTEGER
+                );
+                CREATE TABLE by_domain (
+                    domain TEXT PRIMARY KEY,
+                    count INTEGER,
+                    unique_emails INTEGER,
+                    total_size INTEGER
+                );
+            """)
+            for batch in _batches(_record(row) for row in rows()):
+                connection.executemany("INSERT INTO raw_data VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            connection.executemany("INSERT INTO by_email VALUES (?, ?, ?)", summary.by_email.items())
+            connection.executemany("INSERT INTO by_domain VALUES (?, ?, ?, ?)", summary.by_domain.items())
+            for table, fields, numbers, source in _optional_tables(duplicates, attachments, attachment_summary):
+                if source is None:
+                    continue
+                columns = ", ".join(f"{name} {'INTEGER' if name in numbers else 'TEXT'}" for name in fields)
+                connection.execute(f"CREATE TABLE {table} ({columns})")
+                for batch in _batches(source()):
+                    connection.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(fields))})", batch)
+            # Индексы после вставки: так быстрее, чем поддерживать их на каждой строке
+            connection.executescript("""
+                CREATE INDEX raw_data_email ON raw_data (email);
+                CREATE INDEX raw_data_message ON raw_data (email, subject, date, size);
+            """)
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(path_to_temp, self.path_to_file)
+
+
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"{self.path_to_file.resolve().as_uri()}?mode=ro", uri=True)
+
+
+
+    def iter_records(self) -> Iterator[RawDataRecord]:
+        #MARK: iter_records
+        connection = self._connect()
+        try:
+            # В файлах прошлых версий нет колонки message_id
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(raw_data)")}
+            fields = [name for name in RECORD_FIELDS if name in columns]
+            for row in connection.execute(f"SELECT {', '.join(fields)} FROM raw_data ORDER BY rowid"):
+                yield RawDataRecord(*_record(row))
+        finally:
+            connection.close()
+
+
+
+    def rule_columns(self) -> Tuple[List[str], List[str], List[str]]:
+        #MARK: rule_columns
+        connection = self._connect()
+        try:
+            tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+            def column(table:str, name:str) -> List[Any]:
+                if table not in tables:
+                    return []
+                return [row[0] for row in connection.execute(f"SELECT {name} FROM {table}")
+                        if row[0] not in (None, "")]
+
+            return column("by_email", "email"), column("by_domain", "domain"), column("by_subject", "subject")
+        finally:
+            connection.close()
+
+
+
+    def duplicate_fingerprints(self) -> List[str]:
+        #MARK: duplicate_fingerprints
+        connection = self._connect()
+        try:
+            if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'duplicates'"
+                                      ).fetchone():
+                return []
+            return [row[0] for row in connection.execute("SELECT fingerprint FROM duplicates") if row[0]]
+        finally:
+            connection.close()
+
+
+
+OUTPUT_BACKENDS = {backend.format: backend for backend in (ExcelOutput, ParquetOutput, SQLiteOutput)}
+# Формат по расширению файла (остальные расширения - Excel)
+_SUFFIX_FORMATS = {".parquet": OUTPUT_PARQUET, ".sqlite": OUTPUT_SQLITE, ".sqlite3": OUTPUT_SQLITE, ".db": OUTPUT_SQLITE}
+
+
+def output_format_for(path_to_file:Union[str, Path],
+                      output_format:str="") -> str:
+    #MARK: output_format_for
+    # Формат из конфига (output_format) или по расширению файла
+    if output_format:
+        output_format = output_format.lower()
+        if output_format not in OUTPUT_BACKENDS:
+            raise ValueError(f"Неизвестный формат выходного файла: {output_format}. "
+                             f"Допустимо: {', '.join(OUTPUT_BACKENDS)}")
+        return output_format
+    return _SUFFIX_FORMATS.get(Path(path_to_file).suffix.lower(), OUTPUT_EXCEL)
+
+
+def get_output_backend(path_to_file:Union[str, Path],
+                       output_format:str="",
+                       path_to_cache:Union[str, Path, None]=None) -> OutputBackend:
+    #MARK: get_output_backend
+    """
+    Формат для файла. Если формат задан явно, а расширение файла от другого формата,
+    расширение заменяется (output_excel: result.xlsx + output_format: sqlite -> result.sqlite).
+    """
+    output_format = output_format_for(path_to_file, output_format)
+    path_to_file = Path(path_to_file)
+    if output_format_for(path_to_file) != output_format:
+        path_to_file = path_to_file.with_suffix(OUTPUT_BACKENDS[output_format].suffix)
+    if output_format == OUTPUT_EXCEL:
+        return ExcelOutput(path_to_file, path_to_cache)
+    return OUTPUT_BACKENDS[output_format](path_to_file)
@@ -3,6 +3,8 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 import pandas as pd
+import atexit
+import csv
 import os
 from io import StringIO
 
@@ -18,6 +20,8 @@ def create_empty_csv(file_path:str, column_names:list, overwrite=False):
     :param overwrite: Флаг, указывающий, нужно ли перезаписать существующий файл.
     :return: Путь к созданному файлу.
     """
+    # Строки, накопленные append_to_csv, относятся к файлу до изменения
+    flush_csv(file_path)
     if overwrite or not os.path.isfile(file_path):
         df = pd.DataFrame(columns=column_names)
         df.to_csv(file_path, index=False, sep=';', quoting=1, na_rep='')  # quoting=1 соответствует csv.QUOTE_ALL
@@ -40,107 +44,164 @@ def create_empty_csv(file_path:str, column_names:list, overwrite=False):
     return file_path
 
 
-def append_to_csv(file_path:str, data):
+class CsvSink:
+    """
+    Дописывание строк в CSV (разделитель ";", все значения в кавычках) без перечитывания файла.
+
+    Заголовок читается один раз (первая строка файла), строки копятся в памяти и дописываются
+    модулем csv пачками по batch_size. Файл переписывается целиком только если появились новые колонки:
+    ключи словаря, которых нет в заголовке, или позиционная строка длиннее заголовка (колонки unnamed_N).
+
+    :param file_path: Полный путь к файлу (если его нет - будет создан).
+    :param batch_size: Сколько строк держать в памяти до записи.
+    """
+    def __init__(self, file_path:str, batch_size:int=1000):
+        self.file_path = os.path.abspath(file_path)
+        self.batch_size = max(int(batch_size), 1)
+        self.columns = self._read_header()
+        self._rows = []
+        self._stat = self._file_stat()
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _read_header(self) -> list:
+        try:
+            with open(self.file_path, 'r', encoding='utf-8', newline='') as file:
+                return next(csv.reader(file, delimiter=';'), [])
+        except FileNotFoundError:
+            return []
+
+    def is_stale(self) -> bool:
+        # Файл изменили в обход этого объекта (например, create_empty_csv) - заголовок нужно перечитать
+        return not self._rows and self._stat != self._file_stat()
+
+    def reload(self):
+        self.columns = self._read_header()
+        self._stat = self._file_stat()
+
+    def append(self, data):
+        """
+        :param data: Строка ("a;b;c"), список значений, список списков или словарь {колонка: значение}.
+        """
+        if isinstance(data, str) and data:
+            # Строка может содержать несколько строк CSV
+            self._rows.extend(row for row in csv.reader(StringIO(data), delimiter=';') if row)
+        elif isinstance(data, list) and data:
+            if isinstance(data[0], list):
+                self._rows.extend(list(row) for row in data)
+            else:
+                self._rows.append(list(data))
+        elif isinstance(data, dict) and data:
+            self._rows.append(dict(data))
+        else:
+            raise ValueError("Unsupported data format")
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def _new_columns(self) -> list:
+        # Заголовок с учетом колонок, которых требуют накопленные строки
+        columns = list(self.columns)
+        known = set(columns)
+        for row in self._rows:
+            if isinstance(row, dict):
+                for column in row:
+                    if column not in known:
+                        columns.append(column)
+                        known.add(column)
+            else:
+                i = 0
+                while len(row) > len(columns):
+                    i += 1
+                    if f"unnamed_{i}" not in known:
+                        columns.append(f"unnamed_{i}")
+                        known.add(f"unnamed_{i}")
+        return columns
+
+    def _rewrite(self, columns:list):
+        # Единственный случай полного прохода по файлу: расширение заголовка
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as target:
+            writer = csv.writer(target, delimiter=';', quoting=csv.QUOTE_ALL)
+            writer.writerow(columns)
+            if os.path.isfile(self.file_path):
+                with open(self.file_path, 'r', encoding='utf-8', newline='') as source:
+                    reader = csv.reader(source, delimiter=';')
+                    next(reader, None)
+                    for row in reader:
+                        writer.writerow(row + [''] * (len(columns) - len(row)))
+        os.replace(tmp_path, self.file_path)
+        self.columns = columns
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = self._new_columns()
+        if columns != self.columns or not os.path.isfile(self.file_path):
+            self._rewrite(columns)
+        width = len(columns)
+        with open(self.file_path, 'a', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file, delimiter=';', quoting=csv.QUOTE_ALL)
+            for row in self._rows:
+                if isinstance(row, dict):
+                    row = [row.get(column, '') for column in columns]
+                writer.writerow(['' if value is None else value for value in row] + [''] * (width - len(row)))
+        self._rows = []
+        self._stat = self._file_stat()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Кеш заголовков: один CsvSink на файл, чтобы не читать заголовок при каждом append_to_csv
+_sinks = {}
+
+
+def append_to_csv(file_path:str, data, flush:bool=False):
     """
     Добавляет данные в существующий CSV-файл.
 
+    Строки копятся в памяти и дописываются пачками по batch_size; остаток дописывает flush_csv -
+    явно или при выходе из процесса (atexit).
+
     :param file_path: Полный путь к файлу.
-    :param data: Данные для добавления (строка, список или список списков).
+    :param data: Данные для добавления (строка, список, список списков или словарь).
+    :param flush: Записать сразу, не дожидаясь пачки (например, перед чтением файла).
     """
     # Определяем, существует ли файл
-    file_exists = os.path.isfile(file_path)
-    # И если да, то
-    if file_exists:
-        # Определяем количество столбцов в существующем файле
-        existing_df = pd.read_csv(file_path, sep=';')
-        existing_columns = list(existing_df.columns)
-        num_existing_columns = len(existing_columns)
-    else: return
-
-
-    # Если в качестве данных строка, например - "chtoto;Чото2;ПУСТОТА С ПРОБЕЛОМ", то
-    if isinstance(data, str) and data:
-        # Добавляем новую строку в конец данных, если ее нет
-        if not data.endswith('\n'):
-            data += '\n'
-        # Оборачиваем строку как файл (объект StringIO)
-        file_like_object = StringIO(data)
-        # Дата фрейм - полученный объект
-        new_data_frame = pd.read_csv(file_like_object, sep=';', header=None)
-        # у DataFrame из STRING по умолчанию нет заголовков
-        flag_has_headers_new_dataframe = False
-
-    # Если в качестве данных список, например ["знач1","Значение2", "Value 3"] то
-    elif isinstance(data, list) and data:
-        # Если внутри LIST еще один LIST (или несколько), например [[1,2,3],[4,5,6]], то
-        if data and isinstance(data[0], list):
-            new_data_frame = pd.DataFrame(data)
-        # Иначе читаем список по-другому
-        else:
-            new_data_frame = pd.DataFrame([data])
-        # у DataFrame из LIST по умолчанию нет заголовков
-        flag_has_headers_new_dataframe = False
-
-    # И пробуем читать DICT, если в качестве данных словарь
-    elif isinstance(data, dict) and data:
-        # у DataFrame из DICT по любому в качестве ключей - headers (заголовки)
-        flag_has_headers_new_dataframe = True
-        # Убедимся, что словарь имеет все существующие столбцы
-        new_data_frame = pd.DataFrame([data])
-        for column in existing_columns:
-            if column not in new_data_frame.columns:
-                new_data_frame[column] = ''
-        new_columns = [col for col in new_data_frame.columns if col not in existing_columns]
-        existing_df = existing_df.reindex(columns=existing_columns + new_columns)
-        existing_columns = list(existing_df.columns)
-        num_existing_columns = len(existing_columns)
-        new_data_frame = new_data_frame.reindex(columns=existing_columns)
-    else:
-        raise ValueError("Unsupported data format")
-
-    # Убедимся, что у новой строки нужное количество столбцов
-    num_new_columns = new_data_frame.shape[1]
-    if num_new_columns < num_existing_columns:
-        for _ in range(num_existing_columns - num_new_columns):
-            new_data_frame[num_new_columns] = ''
-            num_new_columns += 1
-    elif num_new_columns > num_existing_columns:
-        for i in range(num_existing_columns, num_new_columns):
-            existing_df[f"unnamed_{i - num_existing_columns + 1}"] = ''
-
-    # Сохраняем DataFrame в CSV-файл с добавлением строки в конец файла
-    new_data_frame.to_csv(file_path, mode='a', header=False, index=False, sep=';', quoting=1, na_rep='')
-    existing_df.to_csv(file_path, index=False, sep=';', quoting=1, na_rep='')
-
-    # Понимаем сколько колонок у нового dataframe + сколько МАКСИМУМ колонок (у существующего файла или новых данных)
-    num_new_columns = new_data_frame.shape[1]
-    num_final_columns = max(num_existing_columns, num_new_columns)
-    # Сколько колонок нужно добавить в существующий файл
-    how_much_add_columns = num_final_columns - existing_df.shape[1]
-
-    # Если у вставляемых данных есть заголовки
-    i_tmp = 0
-    if flag_has_headers_new_dataframe:
-        for i in range(num_new_columns):
-            if existing_df.columns[i] in new_data_frame.columns:
-                pass
-            else:
-                extracted_col = existing_df[existing_df.columns[i]]
-                new_data_frame.insert(1, existing_df.columns[i], extracted_col)
-    for i in range(1, how_much_add_columns+1):
-        i_tmp += 1
-        name_column_new = f"unnamed_{i_tmp}"
-        while name_column_new not in new_data_frame.columns:
-            i_tmp += 1
-            name_column_new = f"unnamed_{i_tmp}"
-            new_data_frame.columns = [*new_data_frame.columns[:-i], name_column_new]
-
-
-    # Сохраняем DataFrame в CSV-файл с добавлением строки в конец файла
-    if file_exists:
-        new_data_frame.to_csv(file_path, mode='a', header=False, index=False, sep=';', quoting=1, na_rep='')
-    else:
-        new_data_frame.to_csv(file_path, mode='a', header=True, index=False, sep=';', quoting=1, na_rep='')
+    if not os.path.isfile(file_path):
+        return
+    sink = _sinks.get(os.path.abspath(file_path))
+    if sink is None:
+        sink = _sinks[os.path.abspath(file_path)] = CsvSink(file_path)
+    elif sink.is_stale():
+        sink.reload()
+    sink.append(data)
+    if flush:
+        sink.flush()
+
+
+def flush_csv(file_path:str=None):
+    """
+    Дописывает накопленные append_to_csv(..., flush=False) строки файла (или всех файлов).
+    """
+    for path, sink in list(_sinks.items()):
+        if file_path is None or path == os.path.abspath(file_path):
+            sink.flush()
+
+
+# Накопленные строки не должны теряться при завершении процесса
+atexit.register(flush_csv)
 
 
 
@@ -0,0 +1,187 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import concurrent.futures
+import queue
+import threading
+
+from libraries.result_pipeline import MSG_ROWS, MSG_METRICS
+from libraries.metrics import PipelineMetrics, STAGE_PARSE
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Callable
+
+
+class BatchTracker:
+    #MARK: BatchTracker
+    """
+    Учет пачек одной части папки, отправленных на разбор: часть выгружена, когда строки
+    всех ее пачек отправлены писателю. Поток чтения ждет этого в wait().
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.pending = 0
+        self.rows = 0
+        self.error = None
+
+
+
+    def add(self):
+        #MARK: add
+        with self._condition:
+            self.pending += 1
+
+
+
+    def done(self,
+             rows:int=0,
+             error:Optional[BaseException]=None):
+        #MARK: done
+        with self._condition:
+            self.pending -= 1
+            self.rows += rows
+            if error is not None and self.error is None:
+                self.error = error
+            self._condition.notify_all()
+
+
+
+    def wait(self) -> Tuple[int, Optional[BaseException]]:
+        #MARK: wait
+        # (строк отправлено писателю, первая ошибка разбора или None)
+        with self._condition:
+            self._condition.wait_for(lambda: self.pending <= 0)
+            return self.rows, self.error
+
+
+
+class ParsePipeline:
+    #MARK: ParsePipeline
+    """
+    Стадии между потоками чтения IMAP и писателем результатов.
+
+    Потоки чтения кладут упакованные ответы UID FETCH (imap_fetch.pack_fetch_response) в ограниченную очередь,
+    поток-диспетчер собирает из очереди пачку ответов до batch_bytes и отдает ее пулу процессов (одна задача -
+    список буферов bytes, pickle почти ничего не стоит), поток-сборщик забирает результаты по порядку
+    и отправляет строки писателю (emit). При заполнении очередей потоки чтения ждут (backpressure).
+
+    parse_function(buffers) -> (строки по каждому буферу, секунды разбора) - выполняется в пуле процессов.
+
+    with ParsePipeline(processor.build_rows_from_buffers, pipeline.queue.put, workers=2) as parser:
+        parser.submit(tracker, folder, pack_fetch_response(data))
+    """
+    def __init__(self,
+                 parse_function:Callable[[List[bytes]], Tuple[List[List[Tuple[int, Tuple[Any, ...]]]], float]],
+                 emit:Callable[[Tuple[str, str, Any]], None],
+                 workers:int=2,
+                 queue_size:int=16,
+                 batch_bytes:int=4 * 1024 * 1024):
+        self.parse_function = parse_function
+        self.emit = emit
+        self.workers = max(int(workers), 1)
+        self.batch_bytes = max(int(batch_bytes), 1)
+        self.raw_queue = queue.Queue(maxsize=max(int(queue_size), 1))
+        # Задачи разбора в полете: по две на процесс, чтобы процесс не простаивал, пока сборщик забирает результат
+        self.parsed_queue = queue.Queue(maxsize=self.workers * 2)
+        self.executor = None
+        self.threads = []
+
+
+
+    def __enter__(self):
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        self.threads = [threading.Thread(target=self._dispatch, name="parse-dispatcher", daemon=True),
+                        threading.Thread(target=self._collect, name="parse-collector", daemon=True)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+
+
+    def submit(self,
+               tracker:BatchTracker,
+               folder:str,
+               buffer:bytes):
+        #MARK: submit
+        tracker.add()
+        self.raw_queue.put((tracker, folder, buffer))
+
+
+
+    def depths(self) -> Dict[str, Tuple[int, int]]:
+        #MARK: depths
+        # Заполненность очередей стадий: (сейчас, максимум)
+        return {
+            "ответы на разбор": (self.raw_queue.qsize(), self.raw_queue.maxsize),
+            "разбор": (self.parsed_queue.qsize(), self.parsed_queue.maxsize),
+        }
+
+
+
+    def _dispatch(self):
+        while True:
+            item = self.raw_queue.get()
+            if item is None:
+                self.parsed_queue.put(None)
+                return
+            items = [item]
+            size = len(item[2])
+            stop = False
+            # Все, что уже накопилось в очереди, уходит одной задачей
+            while size < self.batch_bytes:
+                try:
+                    item = self.raw_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+                size += len(item[2])
+            try:
+                future = self.executor.submit(self.parse_function, [buffer for _, _, buffer in items])
+            except Exception as e:
+                future = concurrent.futures.Future()
+                future.set_exception(e)
+            self.parsed_queue.put((items, future))
+            if stop:
+                self.parsed_queue.put(None)
+                return
+
+
+
+    def _collect(self):
+        while True:
+            entry = self.parsed_queue.get()
+            if entry is None:
+                return
+            items, future = entry
+            try:
+                results, seconds = future.result()
+            except Exception as e:
+                for tracker, _, _ in items:
+                    tracker.done(error=e)
+                continue
+            metrics = PipelineMetrics()
+            metrics.add(STAGE_PARSE, seconds, sum(len(buffer) for _, _, buffer in items),
+                        sum(len(rows) for rows in results))
+            for (tracker, folder, _), rows in zip(items, results):
+                try:
+                    if rows:
+                        self.emit((MSG_ROWS, folder, rows))
+                    tracker.done(len(rows))
+                except Exception as e:
+                    tracker.done(error=e)
+            try:
+                self.emit((MSG_METRICS, None, metrics.to_dict()))
+            except Exception:
+                pass
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Потоки чтения уже остановлены: дорабатываем очередь и закрываем пул
+        self.raw_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.executor.shutdown()
@@ -0,0 +1,149 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import threading
+from functools import lru_cache
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable
+
+# Public Suffix List (https://publicsuffix.org), поставляется вместе с программой - сеть не нужна
+PUBLIC_SUFFIX_LIST_PATH = Path(__file__).resolve().parent / "data" / "public_suffix_list.dat"
+
+# Служебные ключи узла дерева (метка домена не может быть пустой и не содержит "!")
+_RULE = ""
+_EXCEPTION = "!"
+_WILDCARD = "*"
+
+
+def _idna_variants(rule:str) -> List[str]:
+    # Правила в списке записаны в Unicode, а в адресах встречается и punycode (xn--...)
+    variants = [rule]
+    try:
+        ascii_rule = ".".join(label if label == _WILDCARD else label.encode("idna").decode("ascii")
+                              for label in rule.split("."))
+    except UnicodeError:
+        return variants
+    if ascii_rule != rule:
+        variants.append(ascii_rule)
+    return variants
+
+
+class PublicSuffixTrie:
+    #MARK: PublicSuffixTrie
+    """
+    Дерево правил Public Suffix List по меткам в обратном порядке (uk -> co -> ...).
+    Поддерживаются обычные правила (co.uk), шаблоны (*.ck) и исключения (!www.ck).
+    """
+    def __init__(self,
+                 rules:Iterable[str]=()):
+        self.root: Dict[str, Any] = {}
+        self.size = 0
+        for rule in rules:
+            self.add(rule)
+
+
+
+    @classmethod
+    def from_file(cls,
+                  path_to_list:Union[str, Path]=PUBLIC_SUFFIX_LIST_PATH
+                  ) -> "PublicSuffixTrie":
+        #MARK: from_file
+        trie = cls()
+        with open(path_to_list, 'r', encoding='utf-8') as file:
+            for line in file:
+                # Правило - первое слово строки, комментарии начинаются с //
+                rule = line.split(None, 1)[0] if line.strip() else ""
+                if rule and not rule.startswith("//"):
+                    trie.add(rule)
+        return trie
+
+
+
+    def add(self,
+            rule:str):
+        #MARK: add
+        rule = rule.strip().lower()
+        exception = rule.startswith(_EXCEPTION)
+        for variant in _idna_variants(rule.lstrip(_EXCEPTION)):
+            labels = variant.split(".")
+            node = self.root
+            for label in reversed(labels[1:]):
+                node = node.setdefault(label, {})
+            if labels[0] == _WILDCARD:
+                node[_WILDCARD] = True
+            else:
+                node = node.setdefault(labels[0], {})
+                node[_EXCEPTION if exception else _RULE] = True
+        self.size += 1
+
+
+
+    def suffix_length(self,
+                      labels:List[str]
+                      ) -> int:
+        #MARK: suffix_length
+        # Количество меток публичного суффикса; labels - метки хоста в обратном порядке
+        node = self.root
+        length = 1  # правило по умолчанию "*": суффикс - последняя метка
+        for i, label in enumerate(labels):
+            child = node.get(label)
+            if child is not None and _EXCEPTION in child:
+                # Исключение: суффикс - правило без самой левой метки
+                return i
+            if _WILDCARD in node:
+                length = i + 1
+            if child is None:
+                break
+            if _RULE in child:
+                length = i + 1
+            node = child
+        return length
+
+
+
+_trie: Optional[PublicSuffixTrie] = None
+_trie_lock = threading.Lock()
+
+
+def get_public_suffix_trie() -> PublicSuffixTrie:
+    #MARK: get_public_suffix_trie
+    # Список разбирается один раз при первом обращении
+    global _trie
+    if _trie is None:
+        with _trie_lock:
+            if _trie is None:
+                _trie = PublicSuffixTrie.from_file()
+    return _trie
+
+
+@lru_cache(maxsize=65536)
+def public_suffix(host:str) -> str:
+    #MARK: public_suffix
+    # sub.example.co.uk -> co.uk
+    labels = host.split(".")
+    length = get_public_suffix_trie().suffix_length(labels[::-1])
+    return ".".join(labels[-length:])
+
+
+@lru_cache(maxsize=65536)
+def registrable_domain(host:str) -> str:
+    #MARK: registrable_domain
+    """
+    Домен, который можно зарегистрировать: публичный суффикс + одна метка слева.
+    sub.example.co.uk -> example.co.uk, gos.mail.ru -> mail.ru.
+    Если хост сам является публичным суффиксом (или пуст), возвращается как есть.
+    Результат кешируется по хосту: одни и те же домены повторяются в миллионах писем.
+    """
+    labels = host.split(".")
+    if not host or len(labels) < 2:
+        return host
+    length = get_public_suffix_trie().suffix_length(labels[::-1])
+    if length >= len(labels):
+        return host
+    return ".".join(labels[-(length + 1):])
+
+
+def is_public_suffix(host:str) -> bool:
+    #MARK: is_public_suffix
+    return bool(host) and public_suffix(host) == host
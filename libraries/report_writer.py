@@ -0,0 +1,122 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import os
+import json
+import shutil
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterator, Iterable
+
+# Структура листов итогового Excel
+RAW_DATA_HEADERS = ["Email", "Name_Address", "Subject", "Date", "Size (bytes)", "Attachments", "Message-ID"]
+BY_EMAIL_HEADERS = ["Email", "Count", "Total Size (bytes)"]
+BY_DOMAIN_HEADERS = ["Domain", "Count", "Unique Emails", "Total Size (bytes)"]
+DUPLICATES_HEADERS = ["Fingerprint", "Message-ID", "Email", "Subject", "Copies", "Size (bytes)",
+                      "Reclaimable (bytes)", "Folders", "Keep Folder", "Keep UID"]
+ATTACHMENT_SUMMARY_HEADERS = ["Group By", "Value", "Attachments", "Messages", "Size (bytes)"]
+ATTACHMENTS_HEADERS = ["Email", "Subject", "Date", "Message-ID", "Folder", "UID", "Filename", "Extension",
+                       "MIME Type", "Size (bytes)"]
+# Строка Raw Data во время выгрузки несет еще и вложения (attachments.encode_attachment_parts) -
+# в промежуточный и выходной файлы попадают только первые RAW_DATA_COLUMNS значений
+RAW_DATA_COLUMNS = len(RAW_DATA_HEADERS)
+
+_COPY_CHUNK = 1 << 20
+
+
+class RowSpool:
+    #MARK: RowSpool
+    """
+    Промежуточный файл строк Raw Data (JSON Lines), в который можно только дописывать.
+
+    Во время выгрузки строки дописываются в конец файла (O(1) на пачку писем),
+    итоговый Excel строится по нему один раз в конце работы.
+    """
+    def __init__(self,
+                 path_to_spool:Union[str, Path]):
+        self.path_to_spool = Path(path_to_spool)
+
+
+
+    def reset(self):
+        #MARK: reset
+        # Начинаем новую выгрузку с пустого файла
+        self.path_to_spool.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path_to_spool, 'w', encoding='utf-8'):
+            pass
+
+
+
+    def append(self,
+               rows:Iterable[Tuple[Any, ...]]):
+        #MARK: append
+        # Пачка пишется одним вызовом write, чтобы строки разных пачек не перемешивались
+        chunk = "".join(json.dumps(list(row), ensure_ascii=False, default=str) + "\n" for row in rows)
+        if not chunk:
+            return
+        with open(self.path_to_spool, 'a', encoding='utf-8') as file:
+            file.write(chunk)
+
+
+
+    def size(self) -> int:
+        #MARK: size
+        # Размер файла в байтах - позиция для контрольной точки
+        return self.path_to_spool.stat().st_size if self.path_to_spool.exists() else 0
+
+
+
+    def truncate(self,
+                 size:int):
+        #MARK: truncate
+        # Продолжение выгрузки: отбрасываем строки после последней контрольной точки
+        if not self.path_to_spool.exists():
+            self.reset()
+            return
+        with open(self.path_to_spool, 'r+b') as file:
+            file.truncate(size)
+
+
+
+    def remove_ranges(self,
+                      ranges:List[Tuple[int, int]]) -> int:
+        #MARK: remove_ranges
+        """
+        Вырезает из файла диапазоны байт [start, end) (строки папки, выгружаемой заново): файл переписывается
+        во временный и подменяется, поэтому при сбое на середине остается прежний.
+
+        :return: Новый размер файла.
+        """
+        if not ranges or not self.path_to_spool.exists():
+            return self.size()
+        path_to_temp = self.path_to_spool.with_name(self.path_to_spool.name + ".tmp")
+        with open(self.path_to_spool, 'rb') as source, open(path_to_temp, 'wb') as target:
+            for start, end in sorted(ranges):
+                # Копируем все до начала диапазона и перескакиваем через него
+                while source.tell() < start:
+                    chunk = source.read(min(start - source.tell(), _COPY_CHUNK))
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                source.seek(end)
+            shutil.copyfileobj(source, target, _COPY_CHUNK)
+        os.replace(path_to_temp, self.path_to_spool)
+        return self.size()
+
+
+
+    def iter_rows(self) -> Iterator[Tuple[Any, ...]]:
+        #MARK: iter_rows
+        if not self.path_to_spool.exists():
+            return
+        with open(self.path_to_spool, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield tuple(json.loads(line))
+
+
+
+    def remove(self):
+        #MARK: remove
+        if self.path_to_spool.exists():
+            os.remove(self.path_to_spool)
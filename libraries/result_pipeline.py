@@ -0,0 +1,300 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import multiprocessing
+import queue
+import threading
+import time
+
+from libraries.report_writer import RowSpool, RAW_DATA_COLUMNS
+from libraries.state_store import SyncStateStore
+from libraries.aggregation import SummaryAggregator, UNIQUE_EXACT
+from libraries.checkpoint import ScanCheckpoint, FOLDER_DONE, FOLDER_FAILED
+from libraries.duplicates import DuplicateIndex
+from libraries.attachments import AttachmentIndex
+from libraries.metrics import PipelineMetrics, STAGE_AGGREGATE, STAGE_WRITE, log_event
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable
+
+# Сообщения от воркеров: (тип, папка, данные)
+MSG_FOLDER_STARTED = "folder_started"  # данные: UIDVALIDITY - начало (или продолжение) выгрузки папки
+MSG_RESET = "reset"              # данные: UIDVALIDITY - папку выгружаем заново
+MSG_EXPUNGED = "expunged"        # данные: список UID, которых больше нет на сервере
+MSG_ROWS = "rows"                # данные: список (UID, строка Raw Data [+ вложения, см. attachments])
+MSG_FOLDER_DONE = "folder_done"  # данные: имя папки для вывода - точка фиксации результатов папки
+MSG_FOLDER_FAILED = "folder_failed"  # данные: текст ошибки - фиксируем то, что успели выгрузить
+MSG_METRICS = "metrics"          # данные: PipelineMetrics.to_dict() воркера (папка может быть None)
+
+_SPOOL_CHUNK = 1000
+
+
+class ResultWriter:
+    #MARK: ResultWriter
+    """
+    Единственный писатель результатов: промежуточный файл строк и хранилище состояния.
+    Воркеры ничего не пишут сами, а присылают сообщения, которые применяются здесь по порядку.
+    Вместе с записью строк считаются итоги для листов By Email / By Domain (summary):
+    у каждой папки свои частичные итоги, при фиксации папки они добавляются к общим.
+    С checkpoint_db после каждой пачки, попавшей в промежуточный файл, сохраняется контрольная точка
+    (UID пачки и размер файла), по которой выгрузку можно продолжить.
+    В metrics собираются метрики этапов: свои (write, aggregate) и присланные воркерами (MSG_METRICS).
+    С duplicates_db строки, попавшие в промежуточный файл, добавляются в индекс отпечатков (поиск копий писем),
+    с attachments_db - их вложения в индекс вложений; в сам промежуточный файл вложения не пишутся.
+    """
+    def __init__(self,
+                 spool:RowSpool,
+                 state_db:Optional[Union[str, Path]]=None,
+                 unique_mode:str=UNIQUE_EXACT,
+                 checkpoint_db:Optional[Union[str, Path]]=None,
+                 metrics:Optional[PipelineMetrics]=None,
+                 duplicates_db:Optional[Union[str, Path]]=None,
+                 attachments_db:Optional[Union[str, Path]]=None):
+        self.spool = spool
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self.store = SyncStateStore(state_db) if state_db else None
+        self.checkpoint = ScanCheckpoint(checkpoint_db) if checkpoint_db else None
+        self.duplicates = DuplicateIndex(duplicates_db) if duplicates_db else None
+        self.attachments = AttachmentIndex(attachments_db) if attachments_db else None
+        self.unique_mode = unique_mode
+        self.summary = SummaryAggregator(unique_mode)
+        self._folder_summaries: Dict[str, SummaryAggregator] = {}
+        self.folders_done = 0
+        self.rows_written = 0
+
+
+
+    def handle(self,
+               message:Tuple[str, str, Any]):
+        #MARK: handle
+        kind, folder, payload = message
+        if kind == MSG_METRICS:
+            self.metrics.merge(payload)
+        elif kind == MSG_FOLDER_STARTED:
+            self.metrics.folder_started(folder)
+            if self.checkpoint and self.checkpoint.start_folder(folder, payload):
+                self.drop_folder_rows(folder)
+            if self.duplicates:
+                self.duplicates.start_folder(folder, payload)
+            if self.attachments:
+                self.attachments.start_folder(folder, payload)
+        elif kind == MSG_RESET:
+            if self.store:
+                self.store.reset_folder(folder, payload)
+        elif kind == MSG_EXPUNGED:
+            if self.store:
+                self.store.delete_uids(folder, payload)
+        elif kind == MSG_ROWS:
+            if self.store:
+                with self.metrics.stage(STAGE_WRITE) as record:
+                    self.store.save_rows(folder, payload)
+                    record.messages = len(payload)
+            elif payload:
+                self._spool_rows(folder, payload, self._folder_summary(folder))
+        elif kind == MSG_FOLDER_DONE:
+            self.commit_folder(folder)
+            self.folders_done += 1
+            if self.checkpoint:
+                self.checkpoint.finish_folder(folder, FOLDER_DONE, self.spool.size())
+            log_event("folder", **self.metrics.folder_finished(folder, FOLDER_DONE))
+        elif kind == MSG_FOLDER_FAILED:
+            # Успевшее выгрузиться фиксируем, повтор папки продолжит с последнего записанного UID
+            self.commit_folder(folder)
+            if self.checkpoint:
+                self.checkpoint.finish_folder(folder, FOLDER_FAILED, self.spool.size(), str(payload))
+            self.metrics.add(STAGE_WRITE, calls=0, errors=1, folder=folder)
+            log_event("folder", error=str(payload), **self.metrics.folder_finished(folder, FOLDER_FAILED))
+        else:
+            raise ValueError(f"Неизвестный тип сообщения: {kind}")
+
+
+
+    def _folder_summary(self,
+                        folder:str) -> SummaryAggregator:
+        summary = self._folder_summaries.get(folder)
+        if summary is None:
+            summary = self._folder_summaries[folder] = SummaryAggregator(self.unique_mode)
+        return summary
+
+
+
+    def drop_folder_rows(self,
+                         folder:str):
+        #MARK: drop_folder_rows
+        """
+        UIDVALIDITY папки изменился после контрольной точки: ее строки со старыми UID вырезаются
+        из промежуточного файла, иначе после повторной выгрузки они попадут в выходной файл дважды.
+        Итоги пересчитываются по оставшимся строкам: вычесть адреса из счетчика уникальных нельзя.
+        Частичные итоги незафиксированных папок входят в пересчет (их строки уже в файле), поэтому сбрасываются.
+        """
+        size = self.spool.remove_ranges(self.checkpoint.spool_ranges(folder))
+        self.checkpoint.drop_folder_ranges(folder, size)
+        self._folder_summaries.clear()
+        self.summary = SummaryAggregator(self.unique_mode)
+        self.summary.update(self.spool.iter_rows())
+
+
+
+    def commit_folder(self,
+                      folder:str):
+        #MARK: commit_folder
+        # При работе с хранилищем в выходной файл попадают все письма папки (и старые, и новые),
+        # кроме тех, что уже записаны до контрольной точки
+        if self.store:
+            summary = self._folder_summary(folder)
+            spooled = self.checkpoint.spooled_uids(folder) if self.checkpoint else set()
+            chunk = []
+            for _, uid, *row in self.store.iter_messages(folder):
+                if uid in spooled:
+                    continue
+                chunk.append((uid, tuple(row)))
+                if len(chunk) >= _SPOOL_CHUNK:
+                    self._spool_rows(folder, chunk, summary)
+                    chunk = []
+            if chunk:
+                self._spool_rows(folder, chunk, summary)
+        self.merge_summary(folder)
+
+
+
+    def _spool_rows(self,
+                    folder:str,
+                    chunk:List[Tuple[int, Tuple[Any, ...]]],
+                    summary:SummaryAggregator):
+        # Пачка строк: промежуточный файл и контрольная точка (этап write), итоги папки, индексы копий и вложений
+        # (этап aggregate)
+        rows = [row[:RAW_DATA_COLUMNS] for _, row in chunk]
+        time_begin = time.perf_counter()
+        size_before = self.spool.size()
+        self.spool.append(rows)
+        if self.checkpoint:
+            self.checkpoint.record_batch(folder, [uid for uid, _ in chunk], size_before, self.spool.size())
+        time_write = time.perf_counter()
+        summary.update(rows)
+        if self.duplicates:
+            self.duplicates.add(folder, chunk)
+        if self.attachments:
+            self.attachments.add(folder, chunk)
+        self.metrics.add(STAGE_WRITE, time_write - time_begin, max(self.spool.size() - size_before, 0), len(rows))
+        self.metrics.add(STAGE_AGGREGATE, time.perf_counter() - time_write, messages=len(rows))
+        self.rows_written += len(rows)
+
+
+
+    def merge_summary(self,
+                      folder:Optional[str]=None):
+        #MARK: merge_summary
+        # Частичные итоги папки (или всех незафиксированных папок) добавляются к общим
+        folders = [folder] if folder is not None else list(self._folder_summaries)
+        for name in folders:
+            summary = self._folder_summaries.pop(name, None)
+            if summary is not None:
+                self.summary.merge(summary)
+
+
+
+    def consume(self,
+                result_queue):
+        #MARK: consume
+        # Читаем очередь до сигнала остановки (None); task_done нужен для ResultPipeline.wait_idle
+        while True:
+            message = result_queue.get()
+            try:
+                if message is None:
+                    return
+                self.handle(message)
+            finally:
+                result_queue.task_done()
+
+
+
+    def close(self):
+        #MARK: close
+        # Строки папок без сообщения о завершении уже в промежуточном файле - их итоги тоже нужны
+        self.merge_summary()
+        if self.store:
+            self.store.close()
+            self.store = None
+        if self.checkpoint:
+            self.checkpoint.close()
+            self.checkpoint = None
+        if self.duplicates:
+            self.duplicates.close()
+            self.duplicates = None
+        if self.attachments:
+            self.attachments.close()
+            self.attachments = None
+
+
+
+class ResultPipeline:
+    #MARK: ResultPipeline
+    """
+    Очередь результатов с ограниченным размером и поток-писатель в родительском процессе.
+
+    Пока писатель не успевает, put() в воркерах блокируется (backpressure),
+    поэтому память не растет, даже если сеть быстрее диска.
+
+    with ResultPipeline(writer, queue_size=64) as pipeline:
+        executor.map(partial(worker, result_queue=pipeline.queue), ...)
+
+    processes=False - результаты присылают потоки этого же процесса: обычная queue.Queue без менеджера.
+    """
+    def __init__(self,
+                 writer:ResultWriter,
+                 queue_size:int=64,
+                 processes:bool=True):
+        self.writer = writer
+        self.queue_size = max(int(queue_size), 1)
+        self.processes = processes
+        self.manager = None
+        self.queue = None
+        self.thread = None
+        self.error = None
+
+
+
+    def __enter__(self):
+        if self.processes:
+            # Очередь менеджера можно передавать в задачи ProcessPoolExecutor
+            self.manager = multiprocessing.Manager()
+            self.queue = self.manager.Queue(maxsize=self.queue_size)
+        else:
+            self.queue = queue.Queue(maxsize=self.queue_size)
+        self.thread = threading.Thread(target=self._run_writer, name="result-writer", daemon=True)
+        self.thread.start()
+        return self
+
+
+
+    def _run_writer(self):
+        try:
+            self.writer.consume(self.queue)
+        except Exception as e:
+            self.error = e
+            # Продолжаем вычитывать очередь, чтобы воркеры не зависли на put()
+            while True:
+                message = self.queue.get()
+                self.queue.task_done()
+                if message is None:
+                    return
+
+
+
+    def wait_idle(self):
+        #MARK: wait_idle
+        # Ждем, пока писатель применит все отправленные сообщения (перед повтором упавших папок)
+        self.queue.join()
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.queue.put(None)
+            self.thread.join()
+        finally:
+            self.writer.close()
+            if self.manager is not None:
+                self.manager.shutdown()
+        if self.error is not None and exc_type is None:
+            raise self.error
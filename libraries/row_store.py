@@ -0,0 +1,297 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import array
+import datetime
+from email.utils import parsedate_to_datetime, format_datetime
+
+from libraries.rules import registered_domain
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable, Iterator
+
+# Дата, которую не удалось разобрать (или ее нет)
+NO_DATE = -(1 << 63)
+
+
+class StringTable:
+    #MARK: StringTable
+    # Интернирование строк: одинаковые значения хранятся один раз, в колонках - их номера
+    __slots__ = ("ids", "values")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+
+
+    def intern(self,
+               value:str) -> int:
+        #MARK: intern
+        index = self.ids.get(value)
+        if index is None:
+            index = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+
+    def __getitem__(self,
+                    index:int) -> str:
+        return self.values[index]
+
+
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+
+def _column(values:array.array):
+    # Колонка array как массив NumPy без копирования
+    import numpy as np
+    return np.frombuffer(values, dtype=values.typecode)
+
+
+def group_by(ids:array.array,
+             sizes:array.array,
+             groups:int) -> Tuple[Any, Any]:
+    #MARK: group_by
+    """
+    Количество строк и суммарный размер по номерам групп (ids - колонка номеров 0..groups-1).
+
+    :return: (количество, размер) - массивы NumPy длины groups, индекс - номер группы.
+    """
+    import numpy as np
+
+    keys = _column(ids)
+    counts = np.bincount(keys, minlength=groups)
+    # bincount с весами считает во float64: суммы точны до 2^53 байт (8 ПБ)
+    totals = np.bincount(keys, weights=_column(sizes), minlength=groups).astype(np.int64)
+    return counts, totals
+
+
+def parse_date(value:Any) -> Tuple[int, int]:
+    #MARK: parse_date
+    # Заголовок Date -> (секунды с начала эпохи UTC, смещение пояса в минутах); NO_DATE - не разобрать
+    if not value:
+        return NO_DATE, 0
+    try:
+        date = parsedate_to_datetime(str(value))
+    except (TypeError, ValueError, IndexError):
+        return NO_DATE, 0
+    offset = date.utcoffset()
+    if offset is None:
+        return int(date.timestamp()), 0
+    return int(date.timestamp()), int(offset.total_seconds() // 60)
+
+
+def format_date(timestamp:int,
+                offset:int) -> str:
+    #MARK: format_date
+    zone = datetime.timezone(datetime.timedelta(minutes=offset))
+    return format_datetime(datetime.datetime.fromtimestamp(timestamp, zone))
+
+
+class RowStore:
+    #MARK: RowStore
+    """
+    Колоночное хранилище строк Raw Data (email, name, subject, date, size, attachments, message_id) в памяти.
+
+    Адреса, имена, темы, вложения и домены интернируются в номера (StringTable), размеры и даты
+    хранятся в array: строка занимает около 30 байт колонок вместо кортежа из семи объектов.
+    Message-ID у писем уникальны, их интернировать бессмысленно - они лежат списком строк.
+    Дата хранится разобранной (секунды UTC и смещение пояса); исходный текст заголовка
+    хранится отдельно только если он не совпадает с форматом RFC 2822, поэтому строки
+    возвращаются в точности такими, какими были добавлены.
+
+    Итоги By Email / By Domain считаются по номерам одной редукцией NumPy (group_by).
+    Порядок адресов и доменов в итогах - порядок первого появления, как у EmailAggregator.
+    """
+    def __init__(self):
+        self.emails = StringTable()
+        self.names = StringTable()
+        self.subjects = StringTable()
+        self.attachments = StringTable()
+        self.domains = StringTable()
+        # Домен каждого адреса: номер в domains по номеру в emails
+        self.email_domain = array.array("i")
+        self.email_ids = array.array("i")
+        self.name_ids = array.array("i")
+        self.subject_ids = array.array("i")
+        self.attachment_ids = array.array("i")
+        self.sizes = array.array("q")
+        self.dates = array.array("q")
+        self.date_offsets = array.array("h")
+        self.date_text: Dict[int, Any] = {}
+        self.message_ids: List[str] = []
+
+
+
+    @classmethod
+    def from_rows(cls,
+                  rows:Iterable[Tuple[Any, ...]]
+                  ) -> "RowStore":
+        #MARK: from_rows
+        store = cls()
+        store.extend(rows)
+        return store
+
+
+
+    def __len__(self) -> int:
+        return len(self.email_ids)
+
+
+
+    def _intern_email(self,
+                      address:str) -> int:
+        index = self.emails.ids.get(address)
+        if index is None:
+            index = self.emails.intern(address)
+            self.email_domain.append(self.domains.intern(registered_domain(address)))
+        return index
+
+
+
+    def append(self,
+               row:Tuple[Any, ...]):
+        #MARK: append
+        # Строка Raw Data или тройка (email, name, size), как в aggregation
+        message_id = None
+        if len(row) == 3:
+            address, name, size = row
+            subject = date = attachments = None
+        else:
+            address, name, subject, date, size, attachments = row[:6]
+            if len(row) > 6:
+                message_id = row[6]
+        self.email_ids.append(self._intern_email(address or ""))
+        self.name_ids.append(self.names.intern(name or ""))
+        self.subject_ids.append(self.subjects.intern(subject or ""))
+        self.attachment_ids.append(self.attachments.intern(attachments or ""))
+        try:
+            self.sizes.append(int(size or 0))
+        except (TypeError, ValueError):
+            self.sizes.append(0)
+        timestamp, offset = parse_date(date)
+        self.dates.append(timestamp)
+        self.date_offsets.append(offset)
+        if timestamp == NO_DATE or format_date(timestamp, offset) != date:
+            self.date_text[len(self.dates) - 1] = date
+        self.message_ids.append(message_id or "")
+
+
+
+    def extend(self,
+               rows:Iterable[Tuple[Any, ...]]):
+        #MARK: extend
+        for row in rows:
+            self.append(row)
+
+
+
+    def date(self,
+             index:int) -> Any:
+        #MARK: date
+        # Исходный текст заголовка Date строки
+        if index in self.date_text:
+            return self.date_text[index]
+        return format_date(self.dates[index], self.date_offsets[index])
+
+
+
+    def row(self,
+            index:int) -> Tuple[str, str, str, Any, int, str, str]:
+        #MARK: row
+        return (self.emails[self.email_ids[index]],
+                self.names[self.name_ids[index]],
+                self.subjects[self.subject_ids[index]],
+                self.date(index),
+                self.sizes[index],
+                self.attachments[self.attachment_ids[index]],
+                self.message_ids[index])
+
+
+
+    def __iter__(self) -> Iterator[Tuple[str, str, str, Any, int, str, str]]:
+        for index in range(len(self)):
+            yield self.row(index)
+
+
+
+    def group_by_email(self) -> Iterator[Tuple[str, int, int]]:
+        #MARK: group_by_email
+        # (email, количество, размер) - как EmailAggregator.items()
+        counts, sizes = group_by(self.email_ids, self.sizes, len(self.emails))
+        for address, count, size in zip(self.emails.values, counts.tolist(), sizes.tolist()):
+            if count:
+                yield (address, count, size)
+
+
+
+    def group_by_domain(self) -> Iterator[Tuple[str, int, int, int]]:
+        #MARK: group_by_domain
+        """
+        (домен, количество, уникальных адресов, размер) - как DomainAggregator.items().
+        Итоги доменов собираются из итогов адресов, поэтому уникальные адреса считаются точно
+        и без множеств: это количество адресов домена, у которых есть письма.
+        """
+        import numpy as np
+
+        email_counts, email_sizes = group_by(self.email_ids, self.sizes, len(self.emails))
+        domains = _column(self.email_domain)
+        groups = len(self.domains)
+        counts = np.bincount(domains, weights=email_counts, minlength=groups).astype(np.int64)
+        unique = np.bincount(domains, weights=email_counts > 0, minlength=groups).astype(np.int64)
+        sizes = np.bincount(domains, weights=email_sizes, minlength=groups).astype(np.int64)
+        for domain, count, unique_count, size in zip(self.domains.values, counts.tolist(),
+                                                     unique.tolist(), sizes.tolist()):
+            if count:
+                yield (domain, count, unique_count, size)
+
+
+
+    def domain_emails(self) -> Dict[str, set]:
+        #MARK: domain_emails
+        # Адреса с письмами по доменам: {домен: множество адресов}, порядок доменов - порядок первого появления
+        counts, _ = group_by(self.email_ids, self.sizes, len(self.emails))
+        result: Dict[str, set] = {}
+        for address, domain, count in zip(self.emails.values, self.email_domain, counts.tolist()):
+            if count:
+                result.setdefault(self.domains[domain], set()).add(address)
+        return result
+
+
+
+    def summary(self) -> "StoreSummary":
+        #MARK: summary
+        # Итоги в виде, который принимают выходные файлы вместо SummaryAggregator
+        return StoreSummary(list(self.group_by_email()), list(self.group_by_domain()), len(self))
+
+
+
+class _Groups:
+    __slots__ = ("groups",)
+
+    def __init__(self,
+                 groups:List[Tuple[Any, ...]]):
+        self.groups = groups
+
+
+
+    def items(self) -> Iterator[Tuple[Any, ...]]:
+        return iter(self.groups)
+
+
+
+class StoreSummary:
+    #MARK: StoreSummary
+    # Готовые итоги RowStore с тем же интерфейсом чтения, что у SummaryAggregator (by_email.items() и т.д.)
+    def __init__(self,
+                 by_email:List[Tuple[str, int, int]],
+                 by_domain:List[Tuple[str, int, int, int]],
+                 rows:int):
+        self.by_email = _Groups(by_email)
+        self.by_domain = _Groups(by_domain)
+        self.rows = rows
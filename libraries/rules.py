@@ -0,0 +1,240 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import re
+from collections import deque
+from email.utils import parseaddr
+
+from libraries.public_suffix import registrable_domain, is_public_suffix
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterable
+
+# До этого количества шаблонов тем одно регулярное выражение (работает в C) быстрее автомата на Python
+_REGEX_MAX_PATTERNS = 200
+# Признак конца правила в узле дерева доменов
+_END = ""
+
+
+def normalize_address(raw:Any) -> str:
+    #MARK: normalize_address
+    # "Имя <User@Mail.ru>" или "User@Mail.ru" -> "user@mail.ru" (как parse_email_address, без имени)
+    _, address = parseaddr(str(raw or ""))
+    return (address or str(raw or "")).strip().lower()
+
+
+def address_host(address:str) -> str:
+    #MARK: address_host
+    # Часть адреса после @ в нижнем регистре, без завершающей точки
+    return address.rsplit("@", 1)[-1].strip().lower().rstrip(".")
+
+
+def registered_domain(address:str) -> str:
+    #MARK: registered_domain
+    # Домен для группировки по Public Suffix List: aaaa@gos.mail.ru -> mail.ru, a@news.bbc.co.uk -> bbc.co.uk
+    return registrable_domain(address_host(address))
+
+
+class DomainSuffixTrie:
+    #MARK: DomainSuffixTrie
+    """
+    Дерево доменов по меткам в обратном порядке (ru -> mail -> ...).
+    Поиск правила для хоста - проход по его меткам справа налево, O(количество меток).
+    Публичные суффиксы (com, co.uk, com.ru) правилами не становятся - они попадают в skipped,
+    иначе одна строка старого отчета удалила бы письма всех отправителей зоны.
+    """
+    def __init__(self,
+                 domains:Iterable[str]=()):
+        self.root: Dict[str, Any] = {}
+        self.size = 0
+        self.skipped: List[str] = []
+        for domain in domains:
+            self.add(domain)
+
+
+
+    def add(self,
+            domain:str):
+        #MARK: add
+        labels = address_host(str(domain)).lstrip("@.").split(".")
+        if not labels or not labels[0]:
+            return
+        if is_public_suffix(".".join(labels)):
+            self.skipped.append(".".join(labels))
+            return
+        node = self.root
+        for label in reversed(labels):
+            node = node.setdefault(label, {})
+        if _END not in node:
+            node[_END] = ".".join(labels)
+            self.size += 1
+
+
+
+    def match(self,
+              host:str
+              ) -> Optional[str]:
+        #MARK: match
+        # Самое короткое правило-суффикс, под которое попадает хост (mail.ru для a.b.mail.ru)
+        node = self.root
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return None
+            if _END in node:
+                return node[_END]
+        return None
+
+
+
+class AhoCorasick:
+    #MARK: AhoCorasick
+    """
+    Автомат Ахо-Корасик для поиска любой из многих подстрок за один проход по тексту, O(длина текста).
+    """
+    def __init__(self,
+                 patterns:Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Optional[str]] = [None]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+
+
+    def _add(self,
+             pattern:str):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.goto[state][char] = next_state
+            state = next_state
+        if self.output[state] is None:
+            self.output[state] = pattern
+
+
+
+    def _build(self):
+        # Ссылки неудач строятся обходом в ширину (у узлов первого уровня - корень);
+        # output наследуется по ссылке неудачи
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.output[next_state] is None:
+                    self.output[next_state] = self.output[self.fail[next_state]]
+
+
+
+    def search(self,
+               text:str
+               ) -> Optional[str]:
+        #MARK: search
+        # Первый найденный шаблон или None
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+
+
+class SubjectMatcher:
+    #MARK: SubjectMatcher
+    # Поиск подстрок в теме без учета регистра: одно регулярное выражение или автомат Ахо-Корасик
+    def __init__(self,
+                 patterns:Iterable[str]):
+        self.patterns = sorted({str(pattern).lower() for pattern in patterns if str(pattern or "")})
+        self.regex = None
+        self.automaton = None
+        if not self.patterns:
+            return
+        if len(self.patterns) <= _REGEX_MAX_PATTERNS:
+            # Длинные шаблоны первыми, чтобы в отчете было самое конкретное совпадение
+            ordered = sorted(self.patterns, key=len, reverse=True)
+            self.regex = re.compile("|".join(re.escape(pattern) for pattern in ordered))
+        else:
+            self.automaton = AhoCorasick(self.patterns)
+
+
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+
+
+    def search(self,
+               subject:str
+               ) -> Optional[str]:
+        #MARK: search
+        if self.regex is not None:
+            found = self.regex.search(subject.lower())
+            return found.group(0) if found else None
+        if self.automaton is not None:
+            return self.automaton.search(subject.lower())
+        return None
+
+
+
+class RuleIndex:
+    #MARK: RuleIndex
+    """
+    Предварительно собранный индекс правил удаления.
+
+    * адреса - множество (хеш-таблица), O(1);
+    * домены - дерево по меткам в обратном порядке, правило домена действует и на его поддомены;
+    * темы - поиск подстрок одним регулярным выражением / автоматом Ахо-Корасик, O(длина темы);
+    * конкретные письма - множество ключей (email, subject, date, size).
+    """
+    def __init__(self,
+                 emails:Iterable[str]=(),
+                 domains:Iterable[str]=(),
+                 subjects:Iterable[str]=(),
+                 messages:Iterable[Tuple[str, str, str, int]]=()):
+        self.emails = frozenset(address for address in (normalize_address(raw) for raw in emails) if address)
+        self.domains = DomainSuffixTrie(domains)
+        self.subjects = SubjectMatcher(subjects)
+        self.messages = frozenset(messages)
+
+
+
+    def __len__(self) -> int:
+        return len(self.emails) + self.domains.size + len(self.subjects) + len(self.messages)
+
+
+
+    def classify(self,
+                 address:str,
+                 subject:str,
+                 message_key:Optional[Tuple[str, str, str, int]]=None
+                 ) -> Optional[str]:
+        #MARK: classify
+        # Описание сработавшего правила или None. address уже в нижнем регистре
+        if address in self.emails:
+            return f"email:{address}"
+        if self.domains.size:
+            domain = self.domains.match(address_host(address))
+            if domain:
+                return f"domain:{domain}"
+        if len(self.subjects):
+            pattern = self.subjects.search(subject)
+            if pattern:
+                return f"subject:{pattern}"
+        if message_key is not None and message_key in self.messages:
+            return "message"
+        return None
@@ -0,0 +1,222 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import heapq
+import itertools
+import re
+import time
+from fnmatch import fnmatchcase
+
+from typing import Tuple, Union, Optional, Dict, List, Any, NamedTuple, Iterable, Callable
+
+# [ и ] в шаблонах exclude_folders экранируются для fnmatch: "[Gmail]" -> "[[]gmail[]]"
+_BRACKETS = re.compile(r"([\[\]])")
+
+
+class WorkUnit(NamedTuple):
+    #MARK: WorkUnit
+    # Часть папки, которую выгружает один воркер: UID известны заранее (по результатам планирования)
+    folder: str
+    display: str
+    uidvalidity: int
+    uids: List[int]
+    label: str = ""
+
+
+class FolderPlan(NamedTuple):
+    #MARK: FolderPlan
+    """
+    Результат планирования папки: EXAMINE + UID SEARCH + сверка с хранилищем / контрольными точками.
+
+    messages - сообщения писателю, которые нужно отправить до строк папки (начало папки, сброс, удаленные UID);
+    units - части папки для параллельной выгрузки.
+    """
+    folder_name: bytes
+    folder: str
+    display: str
+    uidvalidity: int
+    messages: List[Tuple[str, str, Any]]
+    units: List[WorkUnit]
+
+
+def split_by_windows(folder:str,
+                     display:str,
+                     uidvalidity:int,
+                     uids:List[int],
+                     windows:List[Tuple[str, List[int]]]
+                     ) -> List[WorkUnit]:
+    #MARK: split_by_windows
+    """
+    Делит UID папки на части по результатам поиска в окнах дат: [(подпись окна, UID окна), ...].
+    В части попадают только UID из uids; письма, не попавшие ни в одно окно
+    (например, пришли между командами SEARCH), собираются в отдельную часть.
+    """
+    wanted = set(uids)
+    units = []
+    for label, window_uids in windows:
+        window_uids = [uid for uid in window_uids if uid in wanted]
+        wanted.difference_update(window_uids)
+        if window_uids:
+            units.append(WorkUnit(folder, display, uidvalidity, window_uids, label))
+    rest = [uid for uid in uids if uid in wanted]
+    if rest:
+        units.append(WorkUnit(folder, display, uidvalidity, rest, "rest" if windows else ""))
+    return units
+
+
+def split_unit(unit:WorkUnit,
+               max_messages:int
+               ) -> List[WorkUnit]:
+    #MARK: split_unit
+    # Большая часть делится на диапазоны соседних UID (UID FETCH получает компактные наборы 1:500)
+    if max_messages <= 0 or len(unit.uids) <= max_messages:
+        return [unit]
+    uids = sorted(unit.uids)
+    parts = []
+    for start in range(0, len(uids), max_messages):
+        chunk = uids[start:start + max_messages]
+        label = f"{unit.label + ' ' if unit.label else ''}UID {chunk[0]}:{chunk[-1]}"
+        parts.append(unit._replace(uids=chunk, label=label))
+    return parts
+
+
+def folder_excluded(names:Iterable[str],
+                    patterns:Iterable[str]
+                    ) -> Optional[str]:
+    #MARK: folder_excluded
+    """
+    Шаблон exclude_folders, под который попадает папка, или None.
+    names - варианты имени папки (раскодированное из UTF-7 и как на сервере),
+    шаблоны - имена или glob (*, ?), без учета регистра: "Спам", "Архив/*", "[Gmail]/*".
+    Квадратные скобки в шаблоне - часть имени (как в "[Gmail]"), а не класс символов fnmatch.
+    """
+    names = [name.casefold() for name in names if name]
+    for pattern in patterns:
+        folded = str(pattern).casefold()
+        literal = _BRACKETS.sub(r"[\1]", folded)
+        if any(name == folded or fnmatchcase(name, literal) for name in names):
+            return pattern
+    return None
+
+
+class UnitQueue:
+    #MARK: UnitQueue
+    """
+    Очередь частей папок: первой выдается самая большая (жадная балансировка LPT),
+    чтобы к концу выгрузки не оставалась одна огромная часть на одном воркере.
+    """
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+
+
+
+    def push(self,
+             unit:WorkUnit):
+        #MARK: push
+        heapq.heappush(self._heap, (-len(unit.uids), next(self._counter), unit))
+
+
+
+    def pop(self) -> WorkUnit:
+        #MARK: pop
+        return heapq.heappop(self._heap)[2]
+
+
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class ProgressTracker:
+    #MARK: ProgressTracker
+    """
+    Прогресс выгрузки по воркерам и оценка оставшегося времени.
+
+    Общее количество писем сначала оценивается по STATUS (MESSAGES), после планирования папки
+    заменяется точным числом писем к выгрузке (с учетом критериев поиска и уже выгруженного).
+    """
+    def __init__(self,
+                 report_interval:float=10.0,
+                 clock:Callable[[], float]=time.monotonic):
+        self.report_interval = max(float(report_interval), 0.0)
+        self.clock = clock
+        self.time_begin = clock()
+        self._last_report = self.time_begin
+        self.folder_totals = {}
+        self.folder_processed = {}
+        # Воркер -> [частей выгружено, писем выгружено]
+        self.workers = {}
+        # Заполненность очередей стадий выгрузки: {стадия: (сейчас, максимум)}, если движок их сообщает
+        self.queue_depths: Optional[Callable[[], Dict[str, Tuple[int, int]]]] = None
+
+
+
+    def set_total(self,
+                  folder:str,
+                  messages:int):
+        #MARK: set_total
+        # Оставшиеся письма папки; уже выгруженные в прошлых попытках тоже входят в итог
+        self.folder_totals[folder] = self.folder_processed.get(folder, 0) + max(int(messages), 0)
+
+
+
+    def unit_done(self,
+                  worker:str,
+                  folder:str,
+                  messages:int):
+        #MARK: unit_done
+        stats = self.workers.setdefault(worker, [0, 0])
+        stats[0] += 1
+        stats[1] += messages
+        self.folder_processed[folder] = self.folder_processed.get(folder, 0) + messages
+
+
+
+    @property
+    def total(self) -> int:
+        return sum(self.folder_totals.values())
+
+
+
+    @property
+    def processed(self) -> int:
+        return sum(self.folder_processed.values())
+
+
+
+    def rate(self) -> float:
+        #MARK: rate
+        return self.processed / max(self.clock() - self.time_begin, 1e-6)
+
+
+
+    def eta(self) -> Optional[float]:
+        #MARK: eta
+        # Секунды до конца выгрузки при текущей скорости; None, пока скорость неизвестна
+        rate = self.rate()
+        if not rate:
+            return None
+        return max(self.total - self.processed, 0) / rate
+
+
+
+    def report(self,
+               force:bool=False):
+        #MARK: report
+        now = self.clock()
+        if not force and now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        total = self.total
+        processed = self.processed
+        percent = round(100 * processed / total, 1) if total else 100.0
+        eta = self.eta()
+        eta_text = f"осталось ~{round(eta)} сек" if eta is not None else "оценка времени пока недоступна"
+        print(f"Прогресс: {processed}/{total} писем ({percent}%), {round(self.rate(), 1)} писем/сек, {eta_text}")
+        for worker, (units, messages) in sorted(self.workers.items()):
+            print(f"    воркер {worker}: частей {units}, писем {messages}")
+        if self.queue_depths is not None:
+            print("    очереди: " + ", ".join(f"{stage} {size}/{maxsize}"
+                                           for stage, (size, maxsize) in self.queue_depths().items()))
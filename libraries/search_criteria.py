@@ -0,0 +1,161 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import datetime
+
+from typing import Tuple, Union, Optional, Dict, List, Any
+
+# Даты в командах IMAP SEARCH: 01-Jan-2024 (названия месяцев не зависят от локали)
+_IMAP_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def imap_date(value:datetime.date) -> str:
+    #MARK: imap_date
+    return f"{value.day:02d}-{_IMAP_MONTHS[value.month - 1]}-{value.year}"
+
+
+def parse_date(value:Any) -> Optional[datetime.date]:
+    #MARK: parse_date
+    # Дата из конфига: date, "2024-01-31" или "31.01.2024"; пусто - None
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    for date_format in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.datetime.strptime(str(value).strip(), date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Неверная дата в критериях поиска: {value}. Формат: ГГГГ-ММ-ДД или ДД.ММ.ГГГГ")
+
+
+def _quote(value:str) -> str:
+    if any(ord(char) > 127 for char in value):
+        # Для не-ASCII нужен CHARSET и литерал - не все серверы это поддерживают
+        raise ValueError(f"Критерий поиска должен быть в ASCII: {value}")
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class SearchCriteria:
+    #MARK: SearchCriteria
+    """
+    Критерии UID SEARCH из конфига - сервер возвращает только подходящие UID, остальное не выгружается.
+
+    search:
+      since: "2024-01-01"   # SINCE - письма с этой даты (включительно)
+      before: "2025-01-01"  # BEFORE - письма до этой даты (не включая)
+      larger: 1048576       # LARGER - больше n байт
+      smaller: 0            # SMALLER - меньше n байт
+      from: ["news@", "noreply@"]  # FROM - адрес содержит строку (несколько - через OR)
+      unseen: false         # UNSEEN - только непрочитанные
+      window_days: 90       # делить большие папки на окна по датам (0 - не делить)
+      window_min_messages: 5000  # делить только папки, в которых писем не меньше
+    """
+    def __init__(self,
+                 since:Any=None,
+                 before:Any=None,
+                 larger:int=0,
+                 smaller:int=0,
+                 senders:Union[str, List[str], None]=None,
+                 unseen:bool=False,
+                 window_days:int=0,
+                 window_min_messages:int=5000):
+        self.since = parse_date(since)
+        self.before = parse_date(before)
+        if self.since and self.before and self.since >= self.before:
+            raise ValueError(f"В критериях поиска since ({self.since}) должна быть раньше before ({self.before})")
+        self.larger = max(int(larger or 0), 0)
+        self.smaller = max(int(smaller or 0), 0)
+        if isinstance(senders, str):
+            senders = [senders]
+        self.senders = [str(sender) for sender in (senders or []) if str(sender or "").strip()]
+        self.unseen = bool(unseen)
+        self.window_days = max(int(window_days or 0), 0)
+        self.window_min_messages = max(int(window_min_messages if window_min_messages is not None else 5000), 0)
+        # Проверяем строки сразу, а не на первой папке
+        self.to_imap()
+
+
+
+    @classmethod
+    def from_config(cls,
+                    config:Optional[Dict[str, Any]]
+                    ) -> "SearchCriteria":
+        #MARK: from_config
+        config = config or {}
+        return cls(since=config.get("since"),
+                   before=config.get("before"),
+                   larger=config.get("larger", 0),
+                   smaller=config.get("smaller", 0),
+                   senders=config.get("from"),
+                   unseen=config.get("unseen", False),
+                   window_days=config.get("window_days", 0),
+                   window_min_messages=config.get("window_min_messages", 5000))
+
+
+
+    def to_imap(self,
+                since:Optional[datetime.date]=None,
+                before:Optional[datetime.date]=None
+                ) -> List[str]:
+        #MARK: to_imap
+        """
+        Аргументы UID SEARCH. since/before - границы окна (сужают общие since/before).
+        Без критериев - ["ALL"].
+        """
+        since = max(filter(None, (self.since, since)), default=None)
+        before = min(filter(None, (self.before, before)), default=None)
+        criteria = []
+        if since:
+            criteria += ["SINCE", imap_date(since)]
+        if before:
+            criteria += ["BEFORE", imap_date(before)]
+        if self.larger:
+            criteria += ["LARGER", str(self.larger)]
+        if self.smaller:
+            criteria += ["SMALLER", str(self.smaller)]
+        if self.senders:
+            # OR принимает ровно два ключа: OR FROM a OR FROM b FROM c
+            senders = [["FROM", _quote(sender)] for sender in self.senders]
+            criteria += ["OR"] * (len(senders) - 1) + [token for sender in senders for token in sender]
+        if self.unseen:
+            criteria.append("UNSEEN")
+        return criteria or ["ALL"]
+
+
+
+    def date_windows(self,
+                     today:Optional[datetime.date]=None
+                     ) -> List[Tuple[Optional[datetime.date], Optional[datetime.date]]]:
+        #MARK: date_windows
+        """
+        Окна (since, before) по window_days дней, которые вместе покрывают весь диапазон поиска.
+        Без since первое окно открыто слева (BEFORE), без before последнее открыто справа (SINCE).
+        Если окна не заданы - одно окно без границ.
+        """
+        if not self.window_days:
+            return [(None, None)]
+        end = self.before or ((today or datetime.date.today()) + datetime.timedelta(days=1))
+        step = datetime.timedelta(days=self.window_days)
+        start = self.since or (end - step * 12)
+        windows = [] if self.since else [(None, start)]
+        while start < end:
+            windows.append((start, min(start + step, end)))
+            start += step
+        if not self.before:
+            # Письма "из будущего" (сбитые часы отправителя) тоже должны попасть в выгрузку
+            windows[-1] = (windows[-1][0], None)
+        return windows
+
+
+
+    def __bool__(self) -> bool:
+        return self.to_imap() != ["ALL"]
+
+
+
+    def __str__(self) -> str:
+        return " ".join(self.to_imap())
@@ -0,0 +1,189 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import sqlite3
+
+from typing import Tuple, Union, Optional, Dict, List, Any, Iterator, Iterable
+
+
+class SyncStateStore:
+    #MARK: SyncStateStore
+    """
+    Локальное хранилище состояния синхронизации (SQLite).
+
+    Для каждой папки хранит UIDVALIDITY, максимальный UID и уже извлеченные строки Raw Data,
+    чтобы повторные запуски выгружали только новые письма.
+    """
+    def __init__(self,
+                 path_to_db:Union[str, Path],
+                 readonly:bool=False):
+        self.path_to_db = str(path_to_db)
+        self.readonly = readonly
+        if readonly:
+            # Воркеры только читают состояние, пишет один ResultWriter
+            self.connection = sqlite3.connect(f"{Path(self.path_to_db).as_uri()}?mode=ro", uri=True, timeout=60,
+                                              check_same_thread=False)
+            return
+        # Соединение создается в одном потоке, а используется потоком-писателем ResultPipeline
+        self.connection = sqlite3.connect(self.path_to_db, timeout=60, check_same_thread=False)
+        # WAL позволяет читать базу, пока другой процесс в нее пишет
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS folders (
+                folder TEXT PRIMARY KEY,
+                uidvalidity INTEGER NOT NULL,
+                last_uid INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                folder TEXT NOT NULL,
+                uid INTEGER NOT NULL,
+                email TEXT,
+                name_address TEXT,
+                subject TEXT,
+                date TEXT,
+                size INTEGER,
+                attachments TEXT,
+                message_id TEXT,
+                attachment_parts TEXT,
+                PRIMARY KEY (folder, uid)
+            );
+        """)
+        # Базы прошлых версий - без Message-ID и вложений (у старых писем они пустые до повторной выгрузки папки)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(messages)")}
+        for column in ("message_id", "attachment_parts"):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE messages ADD COLUMN {column} TEXT")
+        self.connection.commit()
+
+
+
+    def close(self):
+        #MARK: close
+        if not self.readonly:
+            self.connection.commit()
+        self.connection.close()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+    def get_folder_state(self,
+                         folder:str
+                         ) -> Optional[Tuple[int, int]]:
+        #MARK: get_folder_state
+        # (UIDVALIDITY, максимальный UID) или None, если папку еще не синхронизировали
+        row = self.connection.execute(
+            "SELECT uidvalidity, last_uid FROM folders WHERE folder = ?", (folder,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+
+
+    def reset_folder(self,
+                     folder:str,
+                     uidvalidity:int):
+        #MARK: reset_folder
+        # UIDVALIDITY изменился (или папка новая) - старые UID больше ничего не значат
+        self.connection.execute("DELETE FROM messages WHERE folder = ?", (folder,))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO folders (folder, uidvalidity, last_uid) VALUES (?, ?, 0)",
+            (folder, uidvalidity))
+        self.connection.commit()
+
+
+
+    def known_uids(self,
+                   folder:str
+                   ) -> set:
+        #MARK: known_uids
+        return {row[0] for row in self.connection.execute(
+            "SELECT uid FROM messages WHERE folder = ?", (folder,))}
+
+
+
+    def save_rows(self,
+                  folder:str,
+                  rows:Iterable[Tuple[int, Tuple[Any, ...]]]):
+        #MARK: save_rows
+        """
+        Сохраняет строки Raw Data и сдвигает максимальный UID папки.
+
+        :param folder: Имя папки.
+        :param rows: Пары (UID, (email, name, subject, date, size, attachments, message_id[, вложения])),
+            вложения - JSON из attachments.encode_attachment_parts.
+        """
+        rows = [(folder, uid, row[0], row[1], row[2],
+                 None if row[3] is None else str(row[3]), row[4], row[5], row[6] if len(row) > 6 else None,
+                 row[7] if len(row) > 7 else None)
+                for uid, row in rows]
+        if not rows:
+            return
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO messages "
+            "(folder, uid, email, name_address, subject, date, size, attachments, message_id, attachment_parts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.connection.execute(
+            "UPDATE folders SET last_uid = MAX(last_uid, ?) WHERE folder = ?",
+            (max(row[1] for row in rows), folder))
+        self.connection.commit()
+
+
+
+    def delete_uids(self,
+                    folder:str,
+                    uids:Iterable[int]):
+        #MARK: delete_uids
+        # Письма, которых больше нет на сервере (EXPUNGE)
+        self.connection.executemany(
+            "DELETE FROM messages WHERE folder = ? AND uid = ?", ((folder, uid) for uid in uids))
+        self.connection.commit()
+
+
+
+    def _column(self,
+                name:str) -> str:
+        # Базу прошлой версии в режиме readonly не обновить: отсутствующая колонка читается как NULL
+        if not self.readonly:
+            return name
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(messages)")}
+        return name if name in columns else f"NULL AS {name}"
+
+
+
+    def iter_rows(self,
+                  folder:Optional[str]=None
+                  ) -> Iterator[Tuple[Any, ...]]:
+        #MARK: iter_rows
+        # Строки Raw Data из хранилища (по одной папке или по всем)
+        query = f"SELECT email, name_address, subject, date, size, attachments, {self._column('message_id')} FROM messages"
+        params = ()
+        if folder is not None:
+            query += " WHERE folder = ?"
+            params = (folder,)
+        query += " ORDER BY folder, uid"
+        yield from self.connection.execute(query, params)
+
+
+
+    def iter_messages(self,
+                      folder:Optional[str]=None
+                      ) -> Iterator[Tuple[Any, ...]]:
+        #MARK: iter_messages
+        # (папка, UID, email, name_address, subject, date, size, attachments, message_id, attachment_parts)
+        query = (f"SELECT folder, uid, email, name_address, subject, date, size, attachments, "
+                 f"{self._column('message_id')}, {self._column('attachment_parts')} FROM messages")
+        params = ()
+        if folder is not None:
+            query += " WHERE folder = ?"
+            params = (folder,)
+        query += " ORDER BY folder, uid"
+        yield from self.connection.execute(query, params)
@@ -3,10 +3,10 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent))
 
 import os
+import argparse
 import yaml
 
-from libraries.emailer import EmailDataProcessor
-from libraries.common_funcs import CustomFormatter, set_custom_logger
+from libraries.common_funcs import set_custom_logger
 
 from typing import Tuple, Union, Optional, Dict, List, Any
 
@@ -22,21 +22,98 @@ def read_yaml(file_path) -> Optional[Dict[str, Any]]:
 
 
 
+def parse_args(argv:Optional[List[str]]=None) -> argparse.Namespace:
+    #MARK: parse_args
+    """
+    Подкоманды:
+    scan - выгрузка с сервера и сборка выходного файла;
+    report - выходной файл по локальной базе state_db, без подключения к серверу;
+    delete - удаление писем по входному файлу.
+    Без подкоманды - только выгрузка, как scan: удаление запускается только явно, командой delete.
+    """
+    parser = argparse.ArgumentParser(description="Чистилка почты")
+    parser.add_argument("--config", default="config_email.yaml", help="Путь к YAML с настройками")
+    parser.add_argument("--engine", choices=["process", "async", "pipeline"], default=None,
+                        help="Движок выгрузки (перекрывает engine из конфига)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Продолжить прерванную выгрузку с последней контрольной точки")
+    # Те же параметры после scan; SUPPRESS - не затирать значения, указанные до подкоманды
+    scan_options = argparse.ArgumentParser(add_help=False)
+    scan_options.add_argument("--engine", choices=["process", "async", "pipeline"], default=argparse.SUPPRESS,
+                              help="Движок выгрузки (перекрывает engine из конфига)")
+    scan_options.add_argument("--resume", action="store_true", default=argparse.SUPPRESS,
+                              help="Продолжить прерванную выгрузку с последней контрольной точки")
+    commands = parser.add_subparsers(dest="command", metavar="{scan,report,delete}")
+    commands.add_parser("scan", parents=[scan_options],
+                        help="Выгрузить информацию о письмах и собрать выходной файл")
+    commands.add_parser("report", help="Собрать выходной файл по локальной базе state_db без подключения к серверу")
+    delete_parser = commands.add_parser("delete", help="Удалить письма по входному файлу (правила By Email, "
+                                                       "By Domain, By Subject, Duplicates, Raw Data)")
+    delete_parser.add_argument("--input", default=None, help="Входной файл (перекрывает input_excel из конфига)")
+    # --dry-run / --no-dry-run перекрывают delete_dry_run из конфига в обе стороны; без флага - значение из конфига
+    delete_parser.add_argument("--dry-run", action=argparse.BooleanOptionalAction, default=None,
+                               help="Только отчет об удалении, на сервере ничего не менять "
+                                    "(--no-dry-run - удалить письма на сервере)")
+    return parser.parse_args(argv)
+
+
+
 if __name__ == '__main__':
     #MARK: __main__
+    args = parse_args()
     logger = set_custom_logger("email_collector")
     logger.info("Привет! Я - чистилка почты. Разработчик Алексей Нихаенко, telegram: @AlekseyN92")
-    file_path = os.path.abspath("config_email.yaml")
+    file_path = os.path.abspath(args.config)
     yaml_data = read_yaml(file_path)
     if yaml_data is None:
         exit(1) # Выходим с ошибкой
+    # Импорт после разбора аргументов: --help и ошибки в аргументах не ждут загрузки модулей выгрузки
+    from libraries.emailer import EmailDataProcessor
+
     processor = EmailDataProcessor(
         imap_server=yaml_data.get("imap_server"),
         email_user=yaml_data.get("email"),
         email_password=yaml_data.get("password"),
         exclude_folders=yaml_data.get("exclude_folders"),
         output_excel_file=yaml_data.get("output_excel"),
-        input_excel_file=yaml_data.get("input_excel")
+        input_excel_file=getattr(args, "input", None) or yaml_data.get("input_excel"),
+        fetch_mode=yaml_data.get("fetch_mode", "full"),
+        fetch_batch_size=yaml_data.get("fetch_batch_size", 500),
+        state_db=yaml_data.get("state_db", ""),
+        result_queue_size=yaml_data.get("result_queue_size", 64),
+        max_connections=yaml_data.get("max_connections", 4),
+        engine=args.engine or yaml_data.get("engine", "process"),
+        parse_workers=yaml_data.get("parse_workers", 2),
+        async_pipeline_depth=yaml_data.get("async_pipeline_depth", 4),
+        fetch_queue_size=yaml_data.get("fetch_queue_size", 16),
+        parse_batch_bytes=yaml_data.get("parse_batch_bytes", 4194304),
+        find_duplicates=yaml_data.get("find_duplicates", True),
+        analyze_attachments=yaml_data.get("analyze_attachments", True),
+        delete_dry_run=yaml_data.get("delete_dry_run", True) if getattr(args, "dry_run", None) is None else args.dry_run,
+        delete_mode=yaml_data.get("delete_mode", "expunge"),
+        trash_folder=yaml_data.get("trash_folder", ""),
+        unique_senders_mode=yaml_data.get("unique_senders_mode", "exact"),
+        input_excel_cache=yaml_data.get("input_excel_cache", ""),
+        folder_retries=yaml_data.get("folder_retries", 3),
+        retry_backoff=yaml_data.get("retry_backoff", 5),
+        search=yaml_data.get("search"),
+        max_unit_messages=yaml_data.get("max_unit_messages", 5000),
+        progress_interval=yaml_data.get("progress_interval", 10),
+        imap_port=yaml_data.get("imap_port", 0),
+        imap_ssl=yaml_data.get("imap_ssl", True),
+        metrics_json=yaml_data.get("metrics_json", ""),
+        metrics_prometheus=yaml_data.get("metrics_prometheus", ""),
+        output_format=yaml_data.get("output_format", "")
     )
     # processor.init_self_logger(logger_name=logger.name)
-    processor.run()
+    if args.command == "scan":
+        processor.scan(resume=args.resume)
+    elif args.command == "report":
+        processor.report()
+    elif args.command == "delete":
+        if not processor.input_excel_file or not processor.input_excel_file.exists():
+            print(f"Входной файл для удаления не найден: {processor.input_excel_file or 'не задан (--input или input_excel)'}")
+            exit(1)
+        processor.delete_emails(path_to_excel=processor.input_excel_file)
+    else:
+        processor.run(resume=args.resume)
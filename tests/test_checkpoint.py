@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import pytest
+
+from libraries.checkpoint import ScanCheckpoint, FOLDER_IN_PROGRESS
+from libraries.report_writer import RowSpool
+
+
+def spool_batch(spool:RowSpool, checkpoint:ScanCheckpoint, folder:str, uids:list):
+    start = spool.size()
+    spool.append([(f"{folder}-{uid}@x.com", folder, uid) for uid in uids])
+    checkpoint.record_batch(folder, uids, start, spool.size())
+
+
+def test_same_uidvalidity_keeps_progress(tmp_path):
+    with ScanCheckpoint(tmp_path / "checkpoint.sqlite") as checkpoint:
+        assert checkpoint.start_folder("INBOX", 5) is False
+        checkpoint.record_batch("INBOX", [1, 2], 0, 10)
+        assert checkpoint.start_folder("INBOX", 5) is False
+        assert checkpoint.spooled_uids("INBOX") == {1, 2}
+        assert checkpoint.folder_progress("INBOX") == (5, 2, FOLDER_IN_PROGRESS)
+        assert checkpoint.spool_size() == 10
+
+
+def test_uidvalidity_change_drops_folder_rows_from_spool(tmp_path):
+    spool = RowSpool(tmp_path / "spool.jsonl")
+    spool.reset()
+    with ScanCheckpoint(tmp_path / "checkpoint.sqlite") as checkpoint:
+        checkpoint.start_folder("INBOX", 5)
+        checkpoint.start_folder("Archive", 1)
+        spool_batch(spool, checkpoint, "INBOX", [1, 2])
+        spool_batch(spool, checkpoint, "Archive", [7])
+        spool_batch(spool, checkpoint, "INBOX", [3])
+        spool_batch(spool, checkpoint, "Archive", [8, 9])
+
+        # Письма папки перенумерованы: старые UID и строки в промежуточном файле больше ничего не значат
+        assert checkpoint.start_folder("INBOX", 6) is True
+        assert checkpoint.spooled_uids("INBOX") == set()
+        assert checkpoint.folder_progress("INBOX") == (6, 0, FOLDER_IN_PROGRESS)
+        size = spool.remove_ranges(checkpoint.spool_ranges("INBOX"))
+        checkpoint.drop_folder_ranges("INBOX", size)
+
+        assert [row[1] for row in spool.iter_rows()] == ["Archive", "Archive", "Archive"]
+        assert checkpoint.spool_ranges("INBOX") == []
+        assert checkpoint.spool_size() == size
+        # Сдвинутые диапазоны Archive по-прежнему указывают на его строки
+        ranges = checkpoint.spool_ranges("Archive")
+        assert ranges[0][0] == 0 and ranges[-1][1] == size
+        assert checkpoint.spooled_uids("Archive") == {7, 8, 9}
+
+        # Повторная смена без строк в файле - не устаревшие данные
+        assert checkpoint.start_folder("INBOX", 7) is False
+
+
+def test_uidvalidity_change_without_recorded_ranges_fails(tmp_path):
+    with ScanCheckpoint(tmp_path / "checkpoint.sqlite") as checkpoint:
+        checkpoint.start_folder("INBOX", 5)
+        checkpoint.connection.execute("UPDATE folder_progress SET rows = 3 WHERE folder = 'INBOX'")
+        with pytest.raises(Exception, match="UIDVALIDITY"):
+            checkpoint.start_folder("INBOX", 6)
@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import csv
+
+from libraries.deleter import DeletionRules, plan_deletion, delete_uids_in_folder, write_deletion_report
+from libraries.state_store import SyncStateStore
+
+
+class FakeMail:
+    # Сессия imaplib: запоминает команды UID, на fail_on-й команде MOVE/EXPUNGE отвечает NO
+    def __init__(self,
+                 uidvalidity:int=7,
+                 capabilities=("IMAP4REV1", "UIDPLUS", "MOVE"),
+                 fail_on:int=0):
+        self.uidvalidity = uidvalidity
+        self.capabilities = capabilities
+        self.fail_on = fail_on
+        self.commands = []
+
+
+
+    def select(self, folder):
+        self.selected = folder
+        return "OK", [b"1"]
+
+
+
+    def response(self, code):
+        return code, [str(self.uidvalidity).encode()]
+
+
+
+    def uid(self, command, *args):
+        self.commands.append((command,) + args)
+        if command in ("MOVE", "EXPUNGE"):
+            calls = sum(1 for name, *_ in self.commands if name == command)
+            if calls == self.fail_on:
+                return "NO", [b"server error"]
+        return "OK", [None]
+
+
+def make_store(path:Path) -> SyncStateStore:
+    store = SyncStateStore(path)
+    store.reset_folder("INBOX", 7)
+    store.save_rows("INBOX", [
+        (1, ("a@x.com", "A", "Hello", "d1", 10, "", "<1@x>")),
+        (2, ("b@spam.example.co.uk", "B", "Win", "d2", 20, "", "<2@x>")),
+        (3, ("c@x.com", "C", "Weekly digest", "d3", 30, "", "<3@x>")),
+    ])
+    store.reset_folder("Archive", 7)
+    store.save_rows("Archive", [
+        (5, ("a@x.com", "A", "Hello", "d1", 10, "", "<1@x>")),
+    ])
+    return store
+
+
+def test_plan_deletion_rules(tmp_path):
+    with make_store(tmp_path / "state.sqlite") as store:
+        rules = DeletionRules(emails=["c@x.com"], domains=["example.co.uk"])
+        plan = plan_deletion(store, rules)
+    assert {folder: [uid for uid, _, _ in matches] for folder, matches in plan.items()} == {"INBOX": [2, 3]}
+    assert plan["INBOX"][0][2].startswith("domain")
+
+
+def test_delete_uids_in_folder_batches_and_encodes_trash():
+    mail = FakeMail()
+    deleted, error = delete_uids_in_folder(mail, "INBOX", 7, [5, 1, 2, 3], delete_mode="move",
+                                           trash_folder="Корзина", chunk_size=2)
+    assert (deleted, error) == ([1, 2, 3, 5], None)
+    assert mail.commands == [("MOVE", "1:2", '"&BBoEPgRABDcEOAQ9BDA-"'), ("MOVE", "3,5", '"&BBoEPgRABDcEOAQ9BDA-"')]
+
+
+def test_delete_uids_in_folder_returns_partial_result():
+    mail = FakeMail(fail_on=2)
+    deleted, error = delete_uids_in_folder(mail, "INBOX", 7, [1, 2, 3, 4, 5], chunk_size=2)
+    assert deleted == [1, 2]
+    assert "3:4" in error
+
+
+def test_delete_uids_in_folder_checks_uidvalidity():
+    try:
+        delete_uids_in_folder(FakeMail(uidvalidity=8), "INBOX", 7, [1])
+    except Exception as e:
+        assert "UIDVALIDITY" in str(e)
+    else:
+        raise AssertionError("Удаление по UID другой версии папки должно падать")
+
+
+def test_write_deletion_report_status(tmp_path):
+    plan = {"INBOX": [(1, ("a@x.com", "A", "s", "d", 1, ""), "email"), (2, ("a@x.com", "A", "s", "d", 1, ""), "email")]}
+    path = tmp_path / "report.csv"
+    write_deletion_report(path, plan, {"INBOX": ([1], "нет связи")})
+    with open(path, encoding="utf-8") as file:
+        rows = list(csv.reader(file, delimiter=";"))
+    assert [row[-1] for row in rows] == ["Status", "deleted", "not deleted: нет связи"]
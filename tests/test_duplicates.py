@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from libraries.duplicates import DuplicateIndex, row_fingerprint, fingerprint_text, parse_fingerprint
+from libraries.deleter import DeletionRules, plan_deletion
+from libraries.state_store import SyncStateStore
+
+HELLO = ("a@x.com", "A", "Hello", "d1", 10, "", "<1@x>")
+DIGEST = ("d@x.com", "D", "Digest", "d2", 30, "", "")
+MESSAGES = {
+    "INBOX": [(1, HELLO), (2, DIGEST), (3, ("b@x.com", "B", "Other", "d3", 5, "", "<3@x>"))],
+    "Archive": [(5, HELLO), (6, HELLO), (9, DIGEST)],
+}
+
+
+def test_fingerprint_text_round_trip():
+    fingerprint = row_fingerprint(HELLO)
+    assert parse_fingerprint(fingerprint_text(fingerprint)) == fingerprint
+    # Тот же Message-ID с пробелами и комментарием - та же копия
+    assert row_fingerprint(HELLO[:6] + (" <1@x> (copy)",)) == fingerprint
+    assert parse_fingerprint("не отпечаток") is None
+
+
+def test_duplicate_index_keeps_first_copy_by_folder_and_uid(tmp_path):
+    with DuplicateIndex(tmp_path / "duplicates.sqlite") as index:
+        for folder, rows in MESSAGES.items():
+            index.start_folder(folder, 1)
+            index.add(folder, rows)
+        groups = list(index.groups())
+        assert [(group[4], group[6], group[8], group[9]) for group in groups] == [(2, 30, "Archive", 9),
+                                                                                 (3, 20, "Archive", 5)]
+        assert groups[1][7] == "Archive, INBOX"
+        assert index.summary() == (2, 3, 50)
+        # Новый UIDVALIDITY: прежние письма папки выбрасываются
+        index.start_folder("Archive", 2)
+        assert index.summary() == (0, 0, 0)
+
+
+def test_plan_deletion_keeps_the_same_copy_as_duplicate_index(tmp_path):
+    with SyncStateStore(tmp_path / "state.sqlite") as store, DuplicateIndex(tmp_path / "duplicates.sqlite") as index:
+        for folder, rows in MESSAGES.items():
+            store.reset_folder(folder, 1)
+            store.save_rows(folder, rows)
+            index.start_folder(folder, 1)
+            index.add(folder, rows)
+        fingerprints = [group[0] for group in index.groups()]
+        plan = plan_deletion(store, DeletionRules(duplicates=fingerprints))
+        assert {folder: [uid for uid, _, _ in matches] for folder, matches in plan.items()} == {
+            "Archive": [6], "INBOX": [1, 2]}
+        assert plan["Archive"][0][2] == f"duplicate:{fingerprint_text(row_fingerprint(HELLO))}"
+
+        # Правило по адресу удаляет все копии письма, в том числе ту, которую оставили бы как копию
+        plan = plan_deletion(store, DeletionRules(emails=["d@x.com"], duplicates=fingerprints))
+        assert {folder: [uid for uid, _, _ in matches] for folder, matches in plan.items()} == {
+            "Archive": [6, 9], "INBOX": [1, 2]}
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from libraries.imap_fetch import parse_fetch_response, get_header_bytes
+from libraries.bodystructure import BodyPart, parse_bodystructure, attachment_parts
+
+HEADERS = b"From: A <a@x.com>\r\nSubject: Hi\r\n\r\n"
+
+FETCH = [
+    (b'1 (UID 10 RFC822.SIZE 2048 BODY[HEADER.FIELDS (FROM SUBJECT)] {%d}' % len(HEADERS), HEADERS),
+    b' BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL)'
+    b' ("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 600 NIL ("ATTACHMENT" ("FILENAME" "a.pdf")) NIL)'
+    b' "MIXED" ("BOUNDARY" "b") NIL NIL))',
+    b'2 (UID 11 RFC822.SIZE 10 BODYSTRUCTURE ("TEXT" "PLAIN" NIL NIL "say \\"hi\\"" "8BIT" 10 1 NIL NIL NIL))',
+]
+
+
+def test_parse_fetch_response_splits_messages_and_fields():
+    messages = list(parse_fetch_response(FETCH))
+    assert [seq for seq, _ in messages] == [1, 2]
+    fields = messages[0][1]
+    assert fields["UID"] == "10" and fields["RFC822.SIZE"] == "2048"
+    assert get_header_bytes(fields) == HEADERS
+    # Строка в кавычках с экранированием, NIL - None
+    assert messages[1][1]["BODYSTRUCTURE"] == ["TEXT", "PLAIN", None, None, 'say "hi"', "8BIT", "10", "1",
+                                               None, None, None]
+
+
+def test_parse_bodystructure_multipart_attachment():
+    structure = dict(parse_fetch_response(FETCH))[1]["BODYSTRUCTURE"]
+    parts = parse_bodystructure(structure)
+    assert parts == [
+        BodyPart("1", "text/plain", "", "", "7bit", 12),
+        BodyPart("2", "application/pdf", "a.pdf", "attachment", "base64", 600),
+    ]
+    assert [part.part_id for part in attachment_parts(parts)] == ["2"]
+
+
+def test_parse_bodystructure_rfc2231_and_nested_message():
+    attachment = ["APPLICATION", "OCTET-STREAM", None, None, None, "BASE64", "30", None,
+                  ["ATTACHMENT", ["FILENAME*0*", "utf-8''%D0%BE%D1%82", "FILENAME*1*", "%D1%87%D0%B5%D1%82.txt"]]]
+    inner = [["TEXT", "PLAIN", None, None, None, "7BIT", "5", "1"], attachment, "MIXED"]
+    message = ["MESSAGE", "RFC822", None, None, None, "7BIT", "100", None, inner, "3"]
+    parts = parse_bodystructure([["TEXT", "HTML", None, None, None, "QUOTED-PRINTABLE", "7", "1"], message, "MIXED"])
+    assert [(part.part_id, part.mime_type) for part in parts] == [
+        ("1", "text/html"), ("2", "message/rfc822"), ("2.1", "text/plain"), ("2.2", "application/octet-stream")]
+    assert parts[-1].filename == "отчет.txt"
+    assert parse_bodystructure(None) == []
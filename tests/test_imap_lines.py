@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import asyncio
+import imaplib
+import io
+
+import pytest
+
+from libraries import async_imap, imap_pool
+
+
+class FakeSession(imap_pool._UnlimitedLines):
+    # Сессия imaplib без сокета: readline читает из file
+    error = imaplib.IMAP4.error
+
+    def __init__(self, data:bytes):
+        self.file = io.BytesIO(data)
+
+
+def test_pool_readline_reads_lines_longer_than_imaplib_limit():
+    line = b"* SEARCH " + b" ".join(str(uid).encode() for uid in range(1, 200001)) + b"\r\n"
+    assert len(line) > imaplib._MAXLINE
+    session = FakeSession(line + b"A1 OK\r\n")
+    assert session.readline() == line
+    assert session.readline() == b"A1 OK\r\n"
+
+
+def test_pool_readline_is_bounded(monkeypatch):
+    monkeypatch.setattr(imap_pool, "MAX_LINE", 16)
+    assert FakeSession(b"* SEARCH 1 2 3\r\n").readline() == b"* SEARCH 1 2 3\r\n"
+    with pytest.raises(imaplib.IMAP4.error):
+        FakeSession(b"* SEARCH 1 2 3 4 5 6\r\n").readline()
+
+
+def read_lines(data:bytes, limit:int) -> list:
+    async def main():
+        client = async_imap.AsyncIMAPClient.__new__(async_imap.AsyncIMAPClient)
+        client.reader = asyncio.StreamReader(limit=limit)
+        client.reader.feed_data(data)
+        client.reader.feed_eof()
+        return [await client._readline(), await client._readline()]
+    return asyncio.run(main())
+
+
+def test_async_readline_reads_past_stream_limit():
+    line = b"* SEARCH " + b"1 " * 5000 + b"\r\n"
+    assert read_lines(line + b"A1 OK\r\n", 1024) == [line, b"A1 OK\r\n"]
+    assert read_lines(b"* BYE", 1024) == [b"* BYE", b""]
+
+
+def test_async_readline_is_bounded(monkeypatch):
+    monkeypatch.setattr(async_imap, "MAX_LINE", 4096)
+    with pytest.raises(async_imap.AsyncIMAPError):
+        read_lines(b"x" * 10000 + b"\r\n", 1024)
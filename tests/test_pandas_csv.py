@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import csv
+import os
+import subprocess
+
+from libraries import pandas_csv
+from libraries.pandas_csv import create_empty_csv, append_to_csv, flush_csv
+
+
+def read_rows(path:Path):
+    with open(path, encoding="utf-8", newline="") as file:
+        return list(csv.reader(file, delimiter=";"))
+
+
+def test_append_is_batched_until_flush(tmp_path):
+    path = tmp_path / "stat.csv"
+    create_empty_csv(str(path), ["one", "two"], overwrite=True)
+    append_to_csv(str(path), ["a", "b"])
+    append_to_csv(str(path), {"two": "c", "three": "d"})
+    assert read_rows(path) == [["one", "two"]]
+    flush_csv(str(path))
+    assert read_rows(path) == [["one", "two", "three"], ["a", "b", ""], ["", "c", "d"]]
+
+
+def test_append_flushes_full_batches(tmp_path):
+    path = tmp_path / "stat.csv"
+    create_empty_csv(str(path), ["n"], overwrite=True)
+    sink = pandas_csv._sinks.setdefault(os.path.abspath(path), pandas_csv.CsvSink(str(path), batch_size=2))
+    for number in range(3):
+        append_to_csv(str(path), [number])
+    assert read_rows(path) == [["n"], ["0"], ["1"]]
+    append_to_csv(str(path), [3], flush=True)
+    assert read_rows(path)[-2:] == [["2"], ["3"]]
+    assert sink.batch_size == 2
+
+
+def test_pending_rows_are_written_at_exit(tmp_path):
+    path = tmp_path / "stat.csv"
+    root = Path(__file__).resolve().parent.parent
+    code = (f"import sys; sys.path.insert(0, {str(root)!r}); "
+            f"from libraries.pandas_csv import create_empty_csv, append_to_csv; "
+            f"create_empty_csv({str(path)!r}, ['one']); append_to_csv({str(path)!r}, ['x'])")
+    subprocess.run([sys.executable, "-c", code], check=True)
+    assert read_rows(path) == [["one"], ["x"]]
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from libraries.public_suffix import PublicSuffixTrie, registrable_domain, public_suffix, is_public_suffix
+
+
+def suffix(trie:PublicSuffixTrie, host:str) -> str:
+    labels = host.split(".")
+    return ".".join(labels[-trie.suffix_length(labels[::-1]):])
+
+
+def test_trie_plain_wildcard_and_exception_rules():
+    trie = PublicSuffixTrie(["uk", "co.uk", "*.ck", "!www.ck", "рф"])
+    assert suffix(trie, "sub.example.co.uk") == "co.uk"
+    assert suffix(trie, "example.uk") == "uk"
+    # Шаблон *.ck: любая метка перед ck - часть суффикса
+    assert suffix(trie, "shop.foo.ck") == "foo.ck"
+    # Исключение !www.ck: www.ck регистрируется, суффикс - ck
+    assert suffix(trie, "mail.www.ck") == "ck"
+    # Правило по умолчанию "*" - последняя метка
+    assert suffix(trie, "host.example.org") == "org"
+    # IDN-правила хранятся и в Unicode, и в punycode
+    assert suffix(trie, "пример.рф") == "рф"
+    assert suffix(trie, "xn--e1afmkfd.xn--p1ai") == "xn--p1ai"
+
+
+def test_registrable_domain_from_bundled_list():
+    assert registrable_domain("sub.example.co.uk") == "example.co.uk"
+    assert registrable_domain("gos.mail.ru") == "mail.ru"
+    assert registrable_domain("co.uk") == "co.uk"
+    assert registrable_domain("localhost") == "localhost"
+    assert public_suffix("a.b.example.com") == "com"
+    assert is_public_suffix("co.uk") and not is_public_suffix("example.co.uk")
@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from libraries.row_store import RowStore
+from libraries.aggregation import SummaryAggregator
+from libraries.emailer import EmailDataProcessor
+
+ROWS = [
+    ("a@mail.example.co.uk", "A", "Hello", "Mon, 01 Jan 2024 10:00:00 +0300", 10, "", "<1@x>"),
+    ("b@example.co.uk", "B", "Win", "не дата", 20, "a.pdf", "<2@x>"),
+    ("a@mail.example.co.uk", "A", "Re: Hello", None, 5, "", "<3@x>"),
+    ("c@x.com", "", "", "Tue, 2 Jan 2024 08:00:00 GMT", 1, "", ""),
+]
+
+
+def test_rows_round_trip():
+    store = RowStore.from_rows(ROWS)
+    assert len(store) == 4
+    assert [row[:3] + row[4:] for row in store] == [(row[0], row[1], row[2] or "", row[4], row[5], row[6])
+                                                    for row in ROWS]
+    assert [row[3] for row in store][:2] == [ROWS[0][3], ROWS[1][3]]
+
+
+def test_summary_matches_aggregator():
+    store = RowStore.from_rows(ROWS)
+    summary = SummaryAggregator()
+    summary.update(ROWS)
+    assert list(store.group_by_email()) == list(summary.by_email.items())
+    assert list(store.group_by_domain()) == list(summary.by_domain.items())
+    assert store.summary().rows == 4
+
+
+def test_processor_group_by_domain_keeps_address_sets():
+    processor = EmailDataProcessor.__new__(EmailDataProcessor)
+    by_domain = processor.group_by_domain([(row[0], row[1], row[4]) for row in ROWS])
+    assert by_domain["example.co.uk"] == {
+        'count': 3, 'unique_emails': {"a@mail.example.co.uk", "b@example.co.uk"}, 'size': 35}
+    assert processor.group_by_email(ROWS)["a@mail.example.co.uk"] == {'count': 2, 'size': 15}
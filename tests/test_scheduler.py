@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from libraries.scheduler import folder_excluded, split_unit, split_by_windows, WorkUnit
+
+
+def test_folder_excluded_gmail_brackets_are_literal():
+    assert folder_excluded(["[Gmail]/Spam"], ["[Gmail]/*"]) == "[Gmail]/*"
+    assert folder_excluded(["[Gmail]/Корзина"], ["[gmail]/*"]) == "[gmail]/*"
+    # Без экранирования [Gmail] - класс символов, под который попадает папка "g"
+    assert folder_excluded(["g"], ["[Gmail]"]) is None
+    assert folder_excluded(["INBOX"], ["[Gmail]/*"]) is None
+
+
+def test_folder_excluded_names_and_globs():
+    assert folder_excluded(["Архив/2020", "&BBAEQARFBDgEMg-/2020"], ["архив/*"]) == "архив/*"
+    assert folder_excluded(["Спам"], ["спам"]) == "спам"
+    assert folder_excluded(["Sent1"], ["Sent?"]) == "Sent?"
+    assert folder_excluded(["Sent"], ["Sent?", "Архив/*"]) is None
+    assert folder_excluded(["", None], ["*"]) is None
+
+
+def test_split_unit_keeps_neighbouring_uids_together():
+    unit = WorkUnit("INBOX", "INBOX", 1, [5, 1, 4, 2, 3])
+    parts = split_unit(unit, 2)
+    assert [part.uids for part in parts] == [[1, 2], [3, 4], [5]]
+    assert parts[0].label == "UID 1:2"
+    assert split_unit(unit, 0) == [unit]
+
+
+def test_split_by_windows_collects_rest():
+    units = split_by_windows("INBOX", "INBOX", 1, [1, 2, 3, 4], [("2024-01", [1, 2, 9]), ("2024-02", [2, 3])])
+    assert [(unit.label, unit.uids) for unit in units] == [("2024-01", [1, 2]), ("2024-02", [3]), ("rest", [4])]
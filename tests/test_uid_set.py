@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from libraries.imap_fetch import compress_uid_set, chunked, parse_uid_list
+
+
+def test_compress_uid_set_ranges():
+    assert compress_uid_set([1, 2, 3, 5, 7, 8]) == "1:3,5,7:8"
+    assert compress_uid_set([8, 7, 5, 3, 2, 1, 2]) == "1:3,5,7:8"
+    assert compress_uid_set([42]) == "42"
+    assert compress_uid_set([]) == ""
+
+
+def test_chunked_and_parse_uid_list():
+    assert list(chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(chunked([1, 2], 0)) == [[1], [2]]
+    assert parse_uid_list([b"3 1 2"]) == [3, 1, 2]
+    assert parse_uid_list([None]) == []